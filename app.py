@@ -5,24 +5,40 @@
 from flask import Flask, jsonify
 from flask_swagger_ui import get_swaggerui_blueprint
 from models import db
-from config import Config
+from config import CONFIG_PROFILES
+import os
 import logging
 
 from concurrent.futures import ThreadPoolExecutor
-from extensions import cache  # Import from extensions
+from jobs import JobRegistry
+from write_queue import WriteQueue
+from extensions import search_cache, rate_limiter  # Import from extensions
 from routes import api  # Import the blueprint
+from monitoring import monitor_requests
+from sqlite_profile import init_sqlite_profile
 
-def create_app():
+def create_app(config_object=None):
     app = Flask(__name__)
 
-    # Configure cache
-    app.config['CACHE_TYPE'] = 'SimpleCache'
-    app.config['CACHE_DEFAULT_TIMEOUT'] = 3600
-    cache.init_app(app)  # Initialize cache with the app
+    app.config.from_object(config_object or CONFIG_PROFILES[os.environ.get('DB_PROFILE', 'default')])
 
-    app.config.from_object(Config)
-    app.executor = ThreadPoolExecutor(max_workers=15)
+    # Configure the search cache shared by all worker processes
+    search_cache.init_app(app)
+    # Rate limit buckets are shared by all worker processes too
+    rate_limiter.init_app(app)
+
+    app.executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'])
+    app.jobs = JobRegistry(app, app.executor, max_workers=app.config['JOB_WORKERS'],
+                           max_pending=app.config['JOB_QUEUE_SIZE'], history=app.config['JOB_HISTORY'])
     db.init_app(app)
+    init_sqlite_profile(app)
+    if app.config['WRITE_QUEUE_ENABLED']:
+        app.extensions['write_queue'] = WriteQueue(
+            app,
+            max_batch=app.config['WRITE_QUEUE_MAX_BATCH'],
+            max_wait=app.config['WRITE_QUEUE_MAX_WAIT_MS'] / 1000,
+            max_pending=app.config['WRITE_QUEUE_SIZE']
+        )
 
     # Configure logging
     logging.basicConfig(filename='api.log', level=logging.INFO,
@@ -44,6 +60,9 @@ def create_app():
 
     # Register API routes
     app.register_blueprint(api, url_prefix='/api')
+
+    # Prometheus metrics, served from /metrics
+    monitor_requests(app)
     
     return app
 
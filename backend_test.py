@@ -1,8 +1,7 @@
 import requests
 import time
 from concurrent.futures import ThreadPoolExecutor
-from scipy import stats
-import numpy as np
+from ci_utils import RunningStats, QuantileSketch, ReservoirSample, bootstrap_percentile_ci
 
 def test_backend_search(fin):
     """Tests the search endpoint of the backend API."""
@@ -56,27 +55,33 @@ def test_backend():
 def load_test():
     """Runs a load test by executing the test_backend function concurrently."""
     start_time = time.time()  # Start timer for the load test
-    latencies = []  # To store latency measurements
+    # Streaming latency statistics: memory does not grow with the number of requests
+    latency_stats = RunningStats()
+    latency_sketch = QuantileSketch()
+    latency_sample = ReservoirSample(10000)
 
     with ThreadPoolExecutor(max_workers=20) as executor:
         futures = [executor.submit(test_backend) for _ in range(100)]
         for future in futures:
             success, latency = future.result()
             if success:
-                latencies.append(latency)
+                latency_stats.add(latency)
+                latency_sketch.add(latency)
+                latency_sample.add(latency)
 
     elapsed_time = time.time() - start_time  # End timer for the load test
 
     # Calculate statistics
-    success_count = len(latencies)
-    total_time = sum(latencies)
-    avg_latency = total_time / success_count if success_count > 0 else 0
+    success_count = latency_stats.count
+    total_time = latency_stats.mean * success_count
+    avg_latency = latency_stats.mean
 
-    # Calculate 95% confidence interval
+    # Calculate 95% confidence intervals for the mean and the p95 latency
     try:
-        ci = stats.t.interval(0.95, len(latencies)-1, loc=np.mean(latencies), scale=stats.sem(latencies))
+        ci = latency_stats.confidence_interval(0.95)
+        p95_ci = bootstrap_percentile_ci(latency_sample.values, 95, 0.95)
     except ValueError:
-        ci = (None, None)
+        ci = p95_ci = (None, None)
 
     # Calculate Average Actual Elapsed Time
     avg_actual_elapsed_time = elapsed_time / success_count if success_count > 0 else 0
@@ -86,6 +91,9 @@ def load_test():
     print(f"- Total Time Reported by Threads: {total_time:.2f}s")
     print(f"- Avg Reported Latency: {avg_latency:.4f}s")
     print(f"- 95% Confidence Interval for Latency: {ci}")
+    if success_count:
+        print(f"- p95 / p99 Latency: {latency_sketch.percentile(95):.4f}s / {latency_sketch.percentile(99):.4f}s")
+        print(f"- 95% Confidence Interval for p95 Latency: {p95_ci}")
     print(f"- Actual Elapsed Time: {elapsed_time:.2f}s")
     print(f"- Average Actual Elapsed Time: {avg_actual_elapsed_time:.2f}s")
 
@@ -0,0 +1,97 @@
+# Description: This script benchmarks name search on a generated database (one million
+# applications by default). For each kind of query it times GET /api/applications/search?name=
+# in-process (FTS5 index, ranked, first page) against the LIKE '%...%' scan it replaces, and
+# reports how many rows matched.
+#
+# Usage: python bench_name_search.py [--applications 1000000] [--queries 100] [--like-queries 5]
+
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from bench_routes import _percentile, dataset
+
+QUERY_KINDS = {
+    "full_name": lambda first, last: f"{first} {last}",
+    "surname": lambda first, last: last,
+    "first_prefix": lambda first, last: first[:3],
+    "two_prefixes": lambda first, last: f"{first[:3]} {last[:3]}",
+}
+
+def sample_names(database, seed, count):
+    """(first, last) word pairs of randomly chosen applicants."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database)
+    max_rowid = connection.execute("SELECT MAX(rowid) FROM applications").fetchone()[0]
+    names = []
+    while len(names) < count:
+        row = connection.execute("SELECT name FROM applications WHERE rowid >= ? LIMIT 1",
+                                 (rng.randint(1, max_rowid),)).fetchone()
+        words = row[0].split() if row else []
+        if len(words) >= 2 and len(words[0]) >= 3 and len(words[-1]) >= 3:
+            names.append((words[0], words[-1]))
+    connection.close()
+    return names
+
+def like_scan(connection, query, per_page):
+    """The query without an index: every word as a LIKE '%word%' filter, one page plus the count."""
+    words = query.split()
+    where = ' AND '.join('name LIKE ?' for _ in words)
+    parameters = [f"%{word}%" for word in words]
+    connection.execute(f"SELECT id, fin, name FROM applications WHERE {where} LIMIT ?", (*parameters, per_page)).fetchall()
+    return connection.execute(f"SELECT COUNT(*) FROM applications WHERE {where}", parameters).fetchone()[0]
+
+def summarize(timings):
+    timings = sorted(timings)
+    return _percentile(timings, 0.5) * 1000, _percentile(timings, 0.95) * 1000
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Name search: FTS5 index versus a LIKE scan.")
+    parser.add_argument('--applications', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=100, help="FTS queries per kind")
+    parser.add_argument('--like-queries', type=int, default=5, help="LIKE scans per kind (each reads the whole table)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    from app import create_app
+    from config import Config
+
+    database = dataset(args.applications, args.seed, args.workers)
+    names = sample_names(database, args.seed, args.queries)
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix='bench_name_search_') as workdir:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+            SEARCH_CACHE_PATH = os.path.join(workdir, 'search_cache.db')
+
+        client = create_app(BenchConfig).test_client()
+        connection = sqlite3.connect(database)
+        print(f"{args.applications} applications")
+        print(f"{'query':<14} {'FTS p50':>9} {'FTS p95':>9} {'LIKE p50':>10} {'matches p50':>12} {'capped':>7}")
+        for kind, build in QUERY_KINDS.items():
+            fts_timings, matches, capped = [], [], 0
+            for first, last in names:
+                started = time.perf_counter()
+                response = client.get('/api/applications/search', query_string={'name': build(first, last)})
+                fts_timings.append(time.perf_counter() - started)
+                assert response.status_code in (200, 404), response.status_code
+                body = response.get_json()
+                matches.append(body.get('total', 0))
+                capped += bool(body.get('total_capped'))
+
+            like_timings = []
+            for first, last in names[:args.like_queries]:
+                started = time.perf_counter()
+                like_scan(connection, build(first, last), Config.ITEMS_PER_PAGE)
+                like_timings.append(time.perf_counter() - started)
+
+            fts_p50, fts_p95 = summarize(fts_timings)
+            like_p50, _ = summarize(like_timings)
+            print(f"{kind:<14} {fts_p50:>7.1f}ms {fts_p95:>7.1f}ms {like_p50:>8.1f}ms "
+                  f"{_percentile(sorted(matches), 0.5):>12.0f} {capped:>7}")
+        connection.close()
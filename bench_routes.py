@@ -0,0 +1,196 @@
+# Description: This script benchmarks the API routes in-process through the Flask test client
+# against generated databases of increasing size. For every route it reports p50/p95/p99 latency
+# and the number of SQL statements per request, writes the results as JSON, and exits non-zero
+# when a route regresses past the stored baseline: more queries per request than before (an N+1),
+# or p95 latency beyond the tolerance (an unindexed scan).
+#
+# Usage: python bench_routes.py [--sizes 10000 100000 1000000] [--requests 200]
+#                               [--baseline bench_baseline.json] [--update-baseline]
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from sqlalchemy import event
+
+DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), '.bench_data')
+
+def dataset(size, seed, workers):
+    """Path to a generated database of `size` applications, generated on first use."""
+    path = os.path.join(DATA_DIR, f"applications_{size}_seed{seed}_{date.today().isoformat()}.db")
+    if not os.path.exists(path):
+        from withamendments import generate
+        os.makedirs(DATA_DIR, exist_ok=True)
+        print(f"Generating {size} applications into {path}...")
+        generate(path + '.tmp', size, seed=seed, workers=workers, progress=lambda message: None)
+        os.replace(path + '.tmp', path)
+    # Bring databases cached by an older checkout up to the current schema
+    from migrations import migrate
+    connection = sqlite3.connect(path)
+    try:
+        migrate(connection)
+    finally:
+        connection.close()
+    return path
+
+def _sample(database, seed, count):
+    """Pick request targets: FINs, active IDs for update-expiry and expired IDs for create-stvp."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database)
+    today = date.today().isoformat()
+    max_rowid = connection.execute("SELECT MAX(rowid) FROM applications").fetchone()[0]
+
+    def pick(where, parameters=()):
+        rows = []
+        for _ in range(count * 20):
+            row = connection.execute(f"SELECT id, fin FROM applications WHERE rowid >= ? AND {where} LIMIT 1",
+                                     (rng.randint(1, max_rowid), *parameters)).fetchone()
+            if row:
+                rows.append(row)
+            if len(rows) == count:
+                break
+        return rows
+
+    targets = {
+        "any": pick("1"),
+        "active": pick("doe >= ?", (today,)),
+        "expired": pick("doe < ?", (today,))
+    }
+    connection.close()
+    return targets
+
+def scenarios(targets):
+    """Each scenario yields (method, url, json) requests against the sampled targets."""
+    from utils import encode_cursor
+    new_doe = (date.today() + timedelta(days=400)).isoformat()
+    fins = [fin for _, fin in targets["any"]]
+    return {
+        "search": lambda i: ('GET', f"/api/applications/search?fin={fins[i % len(fins)]}", None),
+        "search_batch": lambda i: ('POST', "/api/applications/search/batch", {"fins": fins}),
+        "list_page": lambda i: ('GET', f"/api/applications?page={1 + i % 50}", None),
+        "list_cursor": lambda i: ('GET', f"/api/applications?cursor={encode_cursor(targets['any'][i % len(targets['any'])][0])}", None),
+        "detail": lambda i: ('GET', f"/api/applications/{targets['any'][i % len(targets['any'])][0]}", None),
+        "amendments": lambda i: ('GET', f"/api/applications/{targets['any'][i % len(targets['any'])][0]}/amendments", None),
+        "update_expiry": lambda i: ('PUT', f"/api/applications/{targets['active'][i % len(targets['active'])][0]}/update-expiry",
+                                    {"new_doe": new_doe}),
+        "create_stvp": lambda i: ('POST', f"/api/applications/{targets['expired'][i % len(targets['expired'])][0]}/create-stvp", None)
+    }
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p * (len(sorted_values) - 1))))]
+
+def run_size(size, args):
+    from app import create_app
+    from config import Config
+    from models import db
+
+    source = dataset(size, args.seed, args.workers)
+    working_copy = os.path.join(DATA_DIR, f"working_{size}.db")
+    shutil.copyfile(source, working_copy)
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{working_copy}"
+        SEARCH_CACHE_PATH = os.path.join(DATA_DIR, 'search_cache.db')
+        JOB_STORE_PATH = os.path.join(DATA_DIR, 'jobs.db')
+        SEARCH_CACHE_MAX_ENTRIES = 0   # Measure the database, not the cache
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        engines = [db.engine] + [app.extensions[name] for name in ('sqlite_reader',) if name in app.extensions]
+    statements = []
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    client = app.test_client()
+    results = {}
+    for name, make_request in scenarios(_sample(working_copy, args.seed, args.requests)).items():
+        latencies, queries, errors = [], [], 0
+        for i in range(args.warmup + args.requests):
+            method, url, body = make_request(i)
+            statements.clear()
+            started = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            elapsed = time.perf_counter() - started
+            if i < args.warmup:
+                continue
+            if response.status_code >= 500:
+                errors += 1
+            latencies.append(elapsed * 1000)
+            queries.append(len(statements))
+        latencies.sort()
+        results[name] = {
+            "p50_ms": round(_percentile(latencies, 0.50), 3),
+            "p95_ms": round(_percentile(latencies, 0.95), 3),
+            "p99_ms": round(_percentile(latencies, 0.99), 3),
+            "queries_per_request": round(sum(queries) / len(queries), 2),
+            "max_queries": max(queries),
+            "errors": errors
+        }
+        print(f"  {size:>8} {name:<14} p50 {results[name]['p50_ms']:8.3f} ms  p95 {results[name]['p95_ms']:8.3f} ms  "
+              f"p99 {results[name]['p99_ms']:8.3f} ms  queries {results[name]['queries_per_request']:6.2f}")
+    os.remove(working_copy)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against baseline."""
+    regressions = []
+    for size, routes in results.items():
+        for route, current in routes.items():
+            previous = baseline.get(size, {}).get(route)
+            if previous is None:
+                continue
+            if current["queries_per_request"] > previous["queries_per_request"]:
+                regressions.append(f"{route} @ {size}: {current['queries_per_request']} queries/request "
+                                   f"(baseline {previous['queries_per_request']})")
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{route} @ {size}: p95 {current['p95_ms']} ms "
+                                   f"(baseline {previous['p95_ms']} ms, tolerance {tolerance:.0%})")
+            if current["errors"]:
+                regressions.append(f"{route} @ {size}: {current['errors']} server errors")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark every API route in-process against generated databases.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per route and size")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help="Generator processes for new datasets")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed relative p95 increase over the baseline")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = {str(size): run_size(size, args) for size in args.sizes}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline updated in {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
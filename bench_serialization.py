@@ -0,0 +1,81 @@
+# Description: This script compares the per-row cost of the two ways to serve a page of
+# applications: ORM objects copied into dicts and passed to jsonify (the old read path), and
+# Core row tuples encoded by a compiled RowSerializer (serializers.py, the current read path).
+# Both are timed from query to finished response, and the script checks they are byte-identical.
+#
+# Usage: python bench_serialization.py [--applications 10000] [--pages 20 500 5000] [--repeat 20]
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from flask import jsonify
+from sqlalchemy import select
+
+def orm_page(Application, size):
+    applications = Application.query.order_by(Application.id).limit(size).all()
+    return jsonify([{
+        "id": app.id,
+        "name": app.name,
+        "pass_type": app.pass_type,
+        "doa": app.doa.isoformat(),
+        "doe": app.doe.isoformat(),
+        "status": app.status
+    } for app in applications])
+
+def core_page(db, Application, serializer, json_response, size):
+    rows = db.session.execute(select(*serializer.columns).order_by(Application.id).limit(size)).all()
+    return json_response(serializer.encode_rows(rows))
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-row cost of ORM + jsonify versus Core rows + RowSerializer.")
+    parser.add_argument('--applications', type=int, default=10000)
+    parser.add_argument('--pages', type=int, nargs='+', default=[20, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement; the fastest is reported")
+    args = parser.parse_args()
+
+    from app import create_app
+    from config import Config
+    from models import Application, db
+    from routes import LIST_ITEM
+    from serializers import json_response
+    from withamendments import generate
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix='bench_serialization_') as workdir:
+        database = os.path.join(workdir, 'bench.db')
+        generate(database, args.applications - 1, workers=1, progress=lambda message: None)
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+            SEARCH_CACHE_PATH = os.path.join(workdir, 'search_cache.db')
+
+        app = create_app(BenchConfig)
+        print(f"{'rows':>6} {'ORM us/row':>11} {'Core us/row':>12} {'speedup':>8}")
+        with app.test_request_context():
+            for size in args.pages:
+                def orm():
+                    response = orm_page(Application, size)
+                    db.session.remove()   # A new session per request, as in the app
+                    return response
+
+                def core():
+                    response = core_page(db, Application, LIST_ITEM, json_response, size)
+                    db.session.remove()
+                    return response
+
+                assert orm().get_data() == core().get_data()
+                orm_seconds = best_of(orm, args.repeat)
+                core_seconds = best_of(core, args.repeat)
+                rows = min(size, args.applications)
+                print(f"{size:>6} {orm_seconds / rows * 1e6:>11.2f} {core_seconds / rows * 1e6:>12.2f} "
+                      f"{orm_seconds / core_seconds:>7.1f}x")
@@ -0,0 +1,141 @@
+# Description: This script measures search throughput under concurrent load for the default
+# configuration and the production SQLite profile (config.ProductionSQLiteConfig).
+# Each worker process builds its own app (like a WSGI server worker) and drives it through the
+# Flask test client: mostly FIN searches, plus a share of update-expiry writes. The search cache
+# is disabled so every search reaches the database.
+#
+# Usage: python bench_sqlite_profile.py [--applications 100000] [--processes 8] [--threads 2]
+#                                       [--seconds 10] [--write-ratio 0.05]
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+def build_database(path, applications):
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE applications (
+            id VARCHAR PRIMARY KEY, fin VARCHAR NOT NULL, name VARCHAR NOT NULL, pass_type VARCHAR NOT NULL,
+            doa DATE NOT NULL, company_uen VARCHAR NOT NULL, status VARCHAR NOT NULL, doe DATE NOT NULL,
+            amendment_seq INTEGER DEFAULT '0' NOT NULL, version INTEGER DEFAULT '1' NOT NULL
+        );
+        CREATE INDEX ix_applications_fin ON applications (fin);
+        CREATE INDEX ix_applications_doe ON applications (doe);
+        CREATE TABLE amendments (
+            amendment_id VARCHAR PRIMARY KEY, application_id VARCHAR NOT NULL REFERENCES applications (id),
+            amendment_date DATETIME NOT NULL, original_value VARCHAR NOT NULL, amended_value VARCHAR NOT NULL
+        );
+        CREATE INDEX ix_amendments_application_id_amendment_date ON amendments (application_id, amendment_date, amendment_id);
+        CREATE TABLE stvps (
+            id VARCHAR PRIMARY KEY, application_id VARCHAR NOT NULL REFERENCES applications (id),
+            start_date DATE NOT NULL, end_date DATE NOT NULL
+        );
+        CREATE INDEX ix_stvps_application_id ON stvps (application_id);
+    ''')
+    doa = (date.today() - timedelta(days=365)).isoformat()
+    doe = (date.today() + timedelta(days=365)).isoformat()
+    connection.executemany(
+        'INSERT INTO applications (id, fin, name, pass_type, doa, company_uen, status, doe) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        ((f"A{i:07d}", f"S{i:07d}X", f"User {i}", "S Pass", doa, "UEN00001", "Approved", doe) for i in range(applications))
+    )
+    connection.commit()
+    connection.close()
+
+def _worker(profile, database, cache_path, applications, threads, seconds, write_ratio, seed):
+    import logging
+    import threading
+    from app import create_app
+    from config import CONFIG_PROFILES
+
+    logging.disable(logging.CRITICAL)
+    base = CONFIG_PROFILES[profile]
+
+    class BenchConfig(base):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+        SEARCH_CACHE_PATH = cache_path
+        SEARCH_CACHE_MAX_ENTRIES = 0
+
+    app = create_app(BenchConfig)
+    results = []
+    deadline = time.perf_counter() + seconds
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        client = app.test_client()
+        counts = {"searches": 0, "writes": 0, "errors": 0, "latencies": []}
+        while time.perf_counter() < deadline:
+            i = rng.randrange(applications)
+            started = time.perf_counter()
+            if rng.random() < write_ratio:
+                new_doe = (date.today() + timedelta(days=rng.randint(400, 800))).isoformat()
+                response = client.put(f"/api/applications/A{i:07d}/update-expiry", json={"new_doe": new_doe})
+                kind = "writes"
+            else:
+                response = client.get(f"/api/applications/search?fin=S{i:07d}X")
+                kind = "searches"
+            counts["latencies"].append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                counts["errors"] += 1
+            else:
+                counts[kind] += 1
+        results.append(counts)
+
+    workers = [threading.Thread(target=run, args=(seed * 1000 + n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+def run_profile(profile, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{profile}_")
+    database = os.path.join(workdir, "bench.db")
+    build_database(database, args.applications)
+    cache_path = os.path.join(workdir, "search_cache.db")
+
+    started = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        outcomes = pool.starmap(_worker, [
+            (profile, database, cache_path, args.applications, args.threads, args.seconds, args.write_ratio, seed)
+            for seed in range(args.processes)
+        ])
+    elapsed = time.perf_counter() - started
+
+    counts = [thread for process in outcomes for thread in process]
+    latencies = sorted(latency for thread in counts for latency in thread["latencies"])
+    searches = sum(thread["searches"] for thread in counts)
+    writes = sum(thread["writes"] for thread in counts)
+    errors = sum(thread["errors"] for thread in counts)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        "profile": profile,
+        "searches_per_second": round(searches / args.seconds, 1),
+        "writes_per_second": round(writes / args.seconds, 1),
+        "errors": errors,
+        "p50_ms": round(percentile(0.50), 2),
+        "p99_ms": round(percentile(0.99), 2),
+        "wall_seconds": round(elapsed, 1)
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare search throughput of the SQLite configuration profiles.")
+    parser.add_argument('--applications', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=2, help="Request threads per process")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production_sqlite'])
+    args = parser.parse_args()
+
+    print(f"{args.applications} applications, {args.processes} processes x {args.threads} threads, "
+          f"{args.write_ratio:.0%} writes, {args.seconds}s per profile")
+    for profile in args.profiles:
+        print(run_profile(profile, args))
@@ -0,0 +1,306 @@
+# Description: This file contains set-based bulk jobs.
+# They apply the same business rules as the single-application routes, but work through the
+# table in chunks: a few statements and one commit per chunk instead of per application.
+#
+# Usage: python bulk.py issue-stvps [--as-of YYYY-MM-DD] [--chunk-size N]
+
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import insert, select, tuple_, update
+from config import Config
+from extensions import search_cache
+from models import Application, Amendment, STVP, db
+from validation import validate_date
+from rollups import RollupChanges
+from services import lock_for_write
+
+def reserve_amendment_ids(application_ids):
+    """Bulk counterpart of services.generate_amendment_id: one UPDATE ... RETURNING for many applications.
+    :return: Dict mapping each application ID to its newly reserved amendment ID.
+    """
+    if not application_ids:
+        return {}
+    rows = db.session.execute(
+        update(Application)
+        .where(Application.id.in_(application_ids))
+        .values(amendment_seq=Application.amendment_seq + 1)
+        .returning(Application.id, Application.amendment_seq)
+        .execution_options(synchronize_session=False)
+    )
+    return {app_id: f'P{seq:02d}{app_id}' for app_id, seq in rows}
+
+def issue_expired_stvps(as_of=None, chunk_size=None, progress=None):
+    """Create or extend an STVP for every application whose doe is before as_of.
+
+    Follows create_stvp: an existing STVP (latest end_date) is extended by STVP_DURATION_DAYS and
+    the change is logged as an Amendment; otherwise a new STVP{id[1:]} runs from max(doe, as_of)
+    for STVP_DURATION_DAYS. Applications whose latest STVP is still open on as_of are skipped, so
+    the job can run every day and a re-run on the same day changes nothing. Each chunk is committed
+    on its own, so a failure loses at most one chunk.
+
+    :param progress: Optional callable invoked with the running report after every chunk.
+    :return: Dict of counts and timings.
+    """
+    as_of = as_of or date.today()
+    chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+    duration = timedelta(days=Config.STVP_DURATION_DAYS)
+    report = {
+        "as_of": as_of.isoformat(),
+        "expired": 0,
+        "created": 0,
+        "extended": 0,
+        "open_stvps": 0,
+        "conflicts": 0,
+        "chunks": 0,
+        "elapsed_seconds": 0.0,
+        "slowest_chunk_seconds": 0.0
+    }
+    started = time.perf_counter()
+    last_key = None
+
+    while True:
+        chunk_started = time.perf_counter()
+        # Keyset walk over the doe index; (doe, id) is unique, so no row is visited twice
+        query = (select(Application.id, Application.fin, Application.doe, Application.company_uen)
+                 .where(Application.doe < as_of)
+                 .order_by(Application.doe, Application.id)
+                 .limit(chunk_size))
+        if last_key is not None:
+            query = query.where(tuple_(Application.doe, Application.id) > last_key)
+        applications = db.session.execute(query).all()
+        if not applications:
+            break
+        last_key = (applications[-1].doe, applications[-1].id)
+
+        try:
+            created, extended, open_stvps, conflicts = _issue_chunk(applications, as_of, duration)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logging.error(f"Bulk STVP issuance failed in chunk {report['chunks'] + 1}", exc_info=True)
+            raise
+        search_cache.delete(*{app.fin for app in applications})
+
+        chunk_seconds = time.perf_counter() - chunk_started
+        report["expired"] += len(applications)
+        report["created"] += created
+        report["extended"] += extended
+        report["open_stvps"] += open_stvps
+        report["conflicts"] += conflicts
+        report["chunks"] += 1
+        report["slowest_chunk_seconds"] = round(max(report["slowest_chunk_seconds"], chunk_seconds), 4)
+        report["elapsed_seconds"] = round(time.perf_counter() - started, 4)
+        if progress:
+            progress(report)
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_seconds"] = round(elapsed, 4)
+    report["applications_per_second"] = round(report["expired"] / elapsed, 1) if elapsed else 0.0
+    logging.info(f"Bulk STVP issuance finished: {report}")
+    return report
+
+def _issue_chunk(applications, as_of, duration):
+    lock_for_write()
+    application_ids = [app.id for app in applications]
+    companies = {app.id: app.company_uen for app in applications}
+
+    # Latest STVP per application, matching create_stvp's ORDER BY end_date DESC
+    latest = {}
+    for stvp_id, application_id, end_date in db.session.execute(
+            select(STVP.id, STVP.application_id, STVP.end_date).where(STVP.application_id.in_(application_ids))):
+        if application_id not in latest or end_date > latest[application_id][1]:
+            latest[application_id] = (stvp_id, end_date)
+    # An STVP that has not ended yet was issued or extended by an earlier run; leave it alone
+    open_stvps = {application_id for application_id, (_, end_date) in latest.items() if end_date >= as_of}
+    for application_id in open_stvps:
+        del latest[application_id]
+
+    # Extend existing STVPs and log each extension as an amendment
+    amendment_ids = reserve_amendment_ids(list(latest))
+    amendment_date = datetime.now(timezone.utc)
+    stvp_updates = []
+    amendments = []
+    rollups = RollupChanges()
+    for application_id, (stvp_id, end_date) in latest.items():
+        new_end_date = end_date + duration
+        stvp_updates.append({"id": stvp_id, "end_date": new_end_date})
+        rollups.move_stvp(companies[application_id], end_date, new_end_date)
+        amendments.append({
+            "amendment_id": amendment_ids[application_id],
+            "application_id": application_id,
+            "amendment_date": amendment_date,
+            "original_value": end_date.isoformat(),
+            "amended_value": new_end_date.isoformat()
+        })
+    if stvp_updates:
+        db.session.execute(update(STVP), stvp_updates)
+        db.session.execute(insert(Amendment), amendments)
+
+    # Create new STVPs; skip IDs already taken by another application's STVP
+    new_stvps = {}
+    conflicts = []
+    for application in applications:
+        if application.id in latest or application.id in open_stvps:
+            continue
+        stvp_id = f"STVP{application.id[1:]}"
+        if stvp_id in new_stvps:
+            conflicts.append(application.id)
+            continue
+        start_date = max(application.doe, as_of)
+        new_stvps[stvp_id] = {
+            "id": stvp_id,
+            "application_id": application.id,
+            "start_date": start_date,
+            "end_date": start_date + duration
+        }
+    if new_stvps:
+        for stvp_id in db.session.scalars(select(STVP.id).where(STVP.id.in_(list(new_stvps)))):
+            conflicts.append(new_stvps.pop(stvp_id)["application_id"])
+    for application_id in conflicts:
+        logging.warning(f"STVP ID STVP{application_id[1:]} already belongs to another application; skipping {application_id}")
+    if new_stvps:
+        db.session.execute(insert(STVP), list(new_stvps.values()))
+    for stvp in new_stvps.values():
+        rollups.move_stvp(companies[stvp["application_id"]], None, stvp["end_date"])
+    rollups.apply()
+
+    # Invalidate the ETags of every application whose STVPs changed
+    touched = list(latest) + [stvp["application_id"] for stvp in new_stvps.values()]
+    if touched:
+        db.session.execute(
+            update(Application)
+            .where(Application.id.in_(touched))
+            .values(version=Application.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    return len(new_stvps), len(stvp_updates), len(open_stvps), len(conflicts)
+
+def update_expiries(items, chunk_size=None, today=None):
+    """Bulk counterpart of services.update_expiry for a list of {"application_id", "new_doe"} items.
+
+    Items are checked on their own first (shape, date format, duplicates), then the targets are
+    loaded one chunk at a time with a single IN (...) query and the same "cannot update expired"
+    rule is applied. Each chunk's doe updates, version bumps, amendment IDs, Amendment rows and
+    rollup changes are a handful of executemany statements and one commit, so a failed chunk
+    only fails its own items.
+
+    :return: Dict with one result per item, in input order, and the counts of updated and failed items.
+    """
+    chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+    today = today or date.today()
+    results = [None] * len(items)
+    pending = []   # (index, application_id, new_doe)
+    seen = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = _update_result(None, 400, error="Each update must be an object")
+            continue
+        application_id = item.get('application_id')
+        new_doe = item.get('new_doe')
+        if application_id is not None and not isinstance(application_id, str):
+            results[index] = _update_result(application_id, 400,
+                                            error=f"application_id must be a string: {application_id!r}")
+        elif not application_id:
+            results[index] = _update_result(application_id, 400, error="Missing required field: application_id")
+        elif new_doe is not None and not isinstance(new_doe, str):
+            results[index] = _update_result(application_id, 400, error=f"new_doe must be a string: {new_doe!r}")
+        elif not new_doe:
+            results[index] = _update_result(application_id, 400, error="Missing required field: new_doe")
+        elif not validate_date(new_doe):
+            results[index] = _update_result(application_id, 400, error="Invalid date format. Use YYYY-MM-DD")
+        elif application_id in seen:
+            results[index] = _update_result(application_id, 400, error="Application listed more than once")
+        else:
+            seen.add(application_id)
+            pending.append((index, application_id, datetime.strptime(new_doe, '%Y-%m-%d').date()))
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            chunk_results, fins = _update_expiry_chunk(chunk, today)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logging.error(f"Bulk expiry update failed for items {chunk[0][0]}-{chunk[-1][0]}", exc_info=True)
+            chunk_results = {index: _update_result(application_id, 500, error="Failed to update expiry date")
+                             for index, application_id, _ in chunk}
+            fins = ()
+        for index, result in chunk_results.items():
+            results[index] = result
+        search_cache.delete(*fins)
+
+    updated = sum(1 for result in results if result["status"] == 200)
+    logging.info(f"Bulk expiry update: {updated} updated, {len(results) - updated} failed")
+    return {"results": results, "updated": updated, "failed": len(results) - updated}
+
+def _update_result(application_id, status, error=None, **body):
+    result = {"application_id": application_id, "status": status}
+    if error:
+        result["error"] = error
+    result.update(body)
+    return result
+
+def _update_expiry_chunk(chunk, today):
+    # Read the current doe under the write lock, so amendments and rollup moves start from it
+    lock_for_write()
+    applications = {row.id: row for row in db.session.execute(
+        select(Application.id, Application.fin, Application.doe, Application.pass_type, Application.company_uen)
+        .where(Application.id.in_([application_id for _, application_id, _ in chunk])))}
+
+    results = {}
+    updates = []
+    for index, application_id, new_doe in chunk:
+        application = applications.get(application_id)
+        if application is None:
+            results[index] = _update_result(application_id, 404, error="Application not found")
+        elif application.doe < today:
+            results[index] = _update_result(application_id, 400, error="Cannot update expired application")
+        else:
+            updates.append((index, application, new_doe))
+    if not updates:
+        return results, ()
+
+    ids = [application.id for _, application, _ in updates]
+    db.session.execute(update(Application), [{"id": application.id, "doe": new_doe} for _, application, new_doe in updates])
+    db.session.execute(
+        update(Application)
+        .where(Application.id.in_(ids))
+        .values(version=Application.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    amendment_ids = reserve_amendment_ids(ids)
+    amendment_date = datetime.now(timezone.utc)
+    db.session.execute(insert(Amendment), [{
+        "amendment_id": amendment_ids[application.id],
+        "application_id": application.id,
+        "amendment_date": amendment_date,
+        "original_value": application.doe.isoformat(),
+        "amended_value": new_doe.isoformat()
+    } for _, application, new_doe in updates])
+
+    rollups = RollupChanges()
+    for index, application, new_doe in updates:
+        rollups.move_pass(application.company_uen, application.pass_type, application.doe, new_doe)
+        results[index] = _update_result(application.id, 200, message="Expiry date updated successfully",
+                                        amendment_id=amendment_ids[application.id], new_expiry=new_doe.isoformat())
+    rollups.apply()
+    return results, {application.fin for _, application, _ in updates}
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Run set-based bulk jobs against the configured database.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    issue = subcommands.add_parser('issue-stvps', help="Create or extend STVPs for every expired pass")
+    issue.add_argument('--as-of', type=date.fromisoformat, default=None,
+                       help="Treat passes with doe before this date (YYYY-MM-DD) as expired; defaults to today")
+    issue.add_argument('--chunk-size', type=int, default=Config.BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'issue-stvps':
+            print(json.dumps(issue_expired_stvps(as_of=args.as_of, chunk_size=args.chunk_size), indent=2))
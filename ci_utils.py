@@ -1,5 +1,6 @@
 from scipy import stats
 import numpy as np
+import math
 
 def calculate_confidence_interval(data, confidence_level=0.95):
     """
@@ -10,7 +11,204 @@ def calculate_confidence_interval(data, confidence_level=0.95):
     """
     if len(data) < 2:
         raise ValueError("At least two data points are required to calculate a confidence interval.")
-    mean = np.mean(data)
-    sem = stats.sem(data)
-    ci = stats.t.interval(confidence_level, len(data)-1, loc=mean, scale=sem)
-    return ci
\ No newline at end of file
+    return RunningStats().update(data).confidence_interval(confidence_level)
+
+class RunningStats:
+    """
+    Streaming mean and variance (Welford), in constant memory.
+    Batches are folded in with Chan's parallel formula, and two instances (e.g. one per worker)
+    merge into the statistics of the combined samples.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0   # Sum of squared deviations from the mean
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        return self
+
+    def update(self, values):
+        """Add a batch of values at NumPy speed. Returns self."""
+        values = np.asarray(values, dtype=float)
+        if values.size:
+            batch_mean = values.mean()
+            self._combine(values.size, batch_mean, float(((values - batch_mean) ** 2).sum()))
+        return self
+
+    def merge(self, other):
+        """Fold another RunningStats into this one. Returns self."""
+        if other.count:
+            self._combine(other.count, other.mean, other._m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Sample variance (ddof=1), as used by scipy.stats.sem."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return self.variance ** 0.5
+
+    def confidence_interval(self, confidence_level=0.95):
+        """Student t confidence interval for the mean."""
+        if self.count < 2:
+            raise ValueError("At least two data points are required to calculate a confidence interval.")
+        sem = self.stdev / self.count ** 0.5
+        return stats.t.interval(confidence_level, self.count - 1, loc=self.mean, scale=sem)
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative error guarantees (DDSketch).
+    Values are counted in logarithmic buckets, so any quantile is within `relative_accuracy`
+    of the exact value. Memory is bounded by `max_buckets`: once exceeded, the lowest buckets
+    are collapsed, which only affects the accuracy of the smallest values, never p95/p99.
+    Values at or below `min_value` (e.g. zero latencies) are counted separately.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, value):
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value > self.min_value:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+            self._collapse()
+        else:
+            self.zero_count += 1
+        return self
+
+    def update(self, values):
+        """Add a batch of values at NumPy speed. Returns self."""
+        values = np.asarray(values, dtype=float).ravel()
+        if not values.size:
+            return self
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > self.min_value]
+        self.zero_count += values.size - positive.size
+        if positive.size:
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.buckets[key] = self.buckets.get(key, 0) + count
+            self._collapse()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch with the same relative_accuracy into this one. Returns self."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        excess = keys[:len(keys) - self.max_buckets + 1]
+        self.buckets[excess[-1]] += sum(self.buckets.pop(key) for key in excess[:-1])
+
+    def quantile(self, q):
+        """Value at quantile q (0 <= q <= 1), within relative_accuracy of the exact value."""
+        if not self.count:
+            raise ValueError("The sketch is empty.")
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return self.min
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile(self, p):
+        return self.quantile(p / 100)
+
+class ReservoirSample:
+    """
+    Fixed-size uniform random sample of a stream (Algorithm R), so a bootstrap CI can be taken
+    over hundreds of millions of values in constant memory.
+    """
+
+    def __init__(self, size=10000, seed=None):
+        self.size = size
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._sample = np.empty(size)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        fill = min(max(self.size - self.seen, 0), values.size)
+        self._sample[self.seen:self.seen + fill] = values[:fill]
+        rest = values[fill:]
+        if rest.size:
+            # Value number t (0-based) replaces a random slot with probability size / (t + 1);
+            # NumPy applies repeated slots in order, so later values win as in the sequential algorithm
+            positions = np.arange(self.seen + fill, self.seen + values.size)
+            slots = (self._rng.random(rest.size) * (positions + 1)).astype(np.int64)
+            keep = slots < self.size
+            self._sample[slots[keep]] = rest[keep]
+        self.seen += values.size
+        return self
+
+    def add(self, value):
+        return self.update([value])
+
+    @property
+    def values(self):
+        return self._sample[:min(self.seen, self.size)]
+
+def bootstrap_percentile_ci(data, percentile=95, confidence_level=0.95, resamples=10000, seed=None,
+                            max_batch_values=10_000_000):
+    """
+    Percentile bootstrap confidence interval for a percentile (e.g. p95) of data.
+    Resamples are drawn and evaluated as 2-D NumPy arrays, in batches of at most
+    max_batch_values drawn values to bound memory.
+    :return: Tuple (lower_bound, upper_bound).
+    """
+    data = np.asarray(data, dtype=float).ravel()
+    if data.size < 2:
+        raise ValueError("At least two data points are required to calculate a confidence interval.")
+    rng = np.random.default_rng(seed)
+    batch = max(1, max_batch_values // data.size)
+    estimates = []
+    for start in range(0, resamples, batch):
+        rows = min(batch, resamples - start)
+        samples = data[rng.integers(0, data.size, size=(rows, data.size))]
+        estimates.append(np.percentile(samples, percentile, axis=1))
+    alpha = (1 - confidence_level) / 2
+    lower, upper = np.quantile(np.concatenate(estimates), [alpha, 1 - alpha])
+    return float(lower), float(upper)
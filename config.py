@@ -6,7 +6,8 @@ class Config:
     basedir = os.path.abspath(os.path.dirname(__file__))
     
     # Database configuration
-    SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(basedir, "with_amendments.db")}'
+    DATABASE_PATH = os.path.join(basedir, "with_amendments.db")
+    SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # SQLAlchemy engine options for connection pooling
@@ -17,9 +18,103 @@ class Config:
     "pool_pre_ping": True     # Check connections for staleness
     }
     
+    # Search cache configuration (a SQLite file shared by all worker processes)
+    SEARCH_CACHE_PATH = os.path.join(basedir, "search_cache.db")
+    SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 10000))   # 0 disables the cache
+    SEARCH_CACHE_TIMEOUT = 3600   # Seconds; writes invalidate entries before this
+    SEARCH_CACHE_FLUSH_INTERVAL = 1.0   # Seconds between batched writes of hit touches and counters
+
+    # Background job configuration (see jobs.py)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 15))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 100))   # Queued jobs beyond this are rejected with 503
+    JOB_HISTORY = 1000                                              # Finished jobs kept for polling
+    JOB_STORE_PATH = os.path.join(basedir, "jobs.db")              # Job state shared by all worker processes
+    JOB_HEARTBEAT_INTERVAL = 10      # Seconds between heartbeats of a worker's queued and running jobs
+    JOB_HEARTBEAT_TIMEOUT = 60       # A job without a heartbeat for this long has lost its worker
+
+    # Group-commit write queue (see write_queue.py); off by default
+    WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', 'False').lower() == 'true'
+    WRITE_QUEUE_MAX_BATCH = 64        # Most writes applied in one transaction
+    WRITE_QUEUE_MAX_WAIT_MS = 5       # How long the writer waits to fill a batch
+    WRITE_QUEUE_SIZE = 1000           # Pending writes beyond this are rejected with 503
+    WRITE_QUEUE_TIMEOUT = 30          # Seconds a request waits for its write to commit
+
     # API Key configuration
     API_KEY = os.environ.get('API_KEY', 'default_key')
     REQUIRE_API_KEY = os.environ.get('REQUIRE_API_KEY', 'False').lower() == 'true'
+
+    # Rate limiting (token buckets in a SQLite file shared by all worker processes; see rate_limit.py)
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'False').lower() == 'true'
+    RATE_LIMIT_PATH = os.path.join(basedir, "rate_limit.db")
+    # Tier -> {endpoint: limit}; "*" applies to every endpoint without its own entry
+    RATE_LIMIT_TIERS = {
+        "default": {"*": "10/minute"},
+        "batch": {"*": "600/minute", "api.search_applications_batch": "60/minute"}
+    }
+    RATE_LIMIT_KEY_TIERS = {}   # API key -> tier; keys not listed use "default"
+    RATE_LIMIT_SWEEP_INTERVAL = 60   # Seconds between deletions of refilled buckets, per worker
     
     # Pagination configuration
-    ITEMS_PER_PAGE = 20
\ No newline at end of file
+    ITEMS_PER_PAGE = 20
+    MAX_PER_PAGE = 100        # Hard ceiling on per_page for every paginated endpoint
+
+    # Batch configuration
+    MAX_BATCH_FINS = 10000    # Most FINs accepted by one batch search request
+    MAX_BATCH_UPDATES = 10000 # Most items accepted by one batch update-expiry request
+    SQL_IN_CHUNK_SIZE = 500   # Bind parameters per IN (...) query, well under SQLite's limit
+    BULK_CHUNK_SIZE = 500     # Applications per transaction in bulk jobs
+    STVP_DURATION_DAYS = 30   # Length of a new STVP and of each extension
+
+    # Response compression for list and export responses (when the client sends Accept-Encoding: gzip)
+    GZIP_MIN_SIZE = 1024      # Bytes; smaller responses are not worth compressing
+    GZIP_LEVEL = 6
+
+    # Name search (GET /api/applications/search?name=, see name_search.py)
+    NAME_SEARCH_MIN_WORD_LENGTH = 2   # Shorter words are ignored; they would match most of the index
+    NAME_SEARCH_MAX_WORDS = 8
+    NAME_SEARCH_MAX_RESULTS = 1000    # Matches considered per query; pages beyond this are not served
+
+    # Rollup endpoints (GET /api/expiries and /api/companies, see rollups.py)
+    EXPIRY_DEFAULT_DAYS = 90  # Days returned when to is omitted
+    EXPIRY_MAX_DAYS = 366     # Longest from..to range one request may ask for
+    COMPANY_EXPIRING_SOON_DAYS = 30   # Default expiring_within of GET /api/companies/<uen>/summary
+
+    # Export configuration
+    EXPORT_BATCH_SIZE = 500   # Rows per yield_per batch; related rows are fetched once per batch
+    EXPORT_DIR = os.path.join(basedir, "exports")
+
+    # Import configuration (see imports.py)
+    IMPORT_CHUNK_SIZE = 2000  # Rows validated, upserted and committed together
+    IMPORT_DIR = os.path.join(basedir, "imports")   # Uploaded files while queued, and rejected-rows files
+
+
+class ProductionSQLiteConfig(Config):
+    """SQLite tuned for concurrent load: WAL journaling, and GET handlers on a read-only connection pool.
+    Select it with DB_PROFILE=production_sqlite (see sqlite_profile.py)."""
+
+    # Applied to every new connection through a connect event
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",       # Readers and the writer no longer block each other
+        "synchronous": "NORMAL",     # fsync at checkpoints only; safe with WAL
+        "busy_timeout": 5000,        # Wait up to 5 seconds for the write lock instead of failing
+        "mmap_size": 268435456,      # Read through a 256 MB memory map
+        "cache_size": -65536         # 64 MB page cache per connection
+    }
+
+    # SQLite allows one writer at a time, so a large writer pool only adds lock waiting
+    SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": 2,
+    "max_overflow": 0,
+    "pool_timeout": 30
+    }
+
+    SQLITE_READ_WRITE_SPLIT = True
+    SQLITE_READER_POOL_SIZE = int(os.environ.get('SQLITE_READER_POOL_SIZE', 16))
+    SQLITE_READER_MAX_OVERFLOW = 0
+    SQLITE_READER_POOL_TIMEOUT = 30
+
+
+CONFIG_PROFILES = {
+    "default": Config,
+    "production_sqlite": ProductionSQLiteConfig
+}
@@ -0,0 +1,100 @@
+# export.py
+# Streaming export of applications as NDJSON or CSV. Rows are read through a yield_per cursor
+# and each batch's amendments and STVPs are fetched with one IN (...) query per table, so memory
+# stays flat whatever the table size and the query count grows with batches, not rows.
+
+import csv
+import io
+import json
+from sqlalchemy import select
+from config import Config
+from models import Application, Amendment, STVP, db
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+INCLUDES = ('amendments', 'stvps')
+APPLICATION_COLUMNS = ('id', 'fin', 'name', 'pass_type', 'doa', 'doe', 'status', 'company_uen')
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def iter_applications(doe_from=None, doe_to=None, status=None, include=(), batch_size=None, progress=None):
+    """Yield one dict per application, optionally with its amendments and STVPs embedded.
+    :param progress: Optional callable invoked with the running row count after every batch.
+    """
+    batch_size = min(batch_size or Config.EXPORT_BATCH_SIZE, Config.SQL_IN_CHUNK_SIZE)
+    query = select(*[getattr(Application, column) for column in APPLICATION_COLUMNS])
+    if doe_from:
+        query = query.where(Application.doe >= doe_from)
+    if doe_to:
+        query = query.where(Application.doe <= doe_to)
+    if status:
+        query = query.where(Application.status == status)
+    # Follow the index that serves the filter so SQLite never sorts the whole result
+    if doe_from or doe_to:
+        query = query.order_by(Application.doe, Application.id)
+    else:
+        query = query.order_by(Application.id)
+
+    rows = 0
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        records = [{column: _iso(value) for column, value in zip(APPLICATION_COLUMNS, row)} for row in partition]
+        ids = [record['id'] for record in records]
+        if 'amendments' in include:
+            amendments = _group_by_application(db.session.execute(
+                select(Amendment.application_id, Amendment.amendment_id, Amendment.amendment_date,
+                       Amendment.original_value, Amendment.amended_value)
+                .where(Amendment.application_id.in_(ids))
+                .order_by(Amendment.application_id, Amendment.amendment_date)
+            ), ('amendment_id', 'amendment_date', 'original_value', 'amended_value'))
+            for record in records:
+                record['amendments'] = amendments.get(record['id'], [])
+        if 'stvps' in include:
+            stvps = _group_by_application(db.session.execute(
+                select(STVP.application_id, STVP.id, STVP.start_date, STVP.end_date)
+                .where(STVP.application_id.in_(ids))
+                .order_by(STVP.application_id, STVP.end_date)
+            ), ('id', 'start_date', 'end_date'))
+            for record in records:
+                record['stvps'] = stvps.get(record['id'], [])
+        yield from records
+        rows += len(records)
+        if progress:
+            progress(rows)
+
+def _group_by_application(rows, columns):
+    grouped = {}
+    for application_id, *values in rows:
+        grouped.setdefault(application_id, []).append(
+            {column: _iso(value) for column, value in zip(columns, values)})
+    return grouped
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+def to_csv(records, include=()):
+    # Embedded amendments/STVPs do not fit a flat row, so they are written as JSON-encoded cells
+    columns = APPLICATION_COLUMNS + tuple(name for name in INCLUDES if name in include)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([
+            json.dumps(record[column], separators=(',', ':')) if column in INCLUDES else record[column]
+            for column in columns
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def render(format, records, include=()):
+    """Encode records as a stream of text chunks in the requested format."""
+    if format == 'csv':
+        return to_csv(records, include)
+    return to_ndjson(records)
@@ -1,4 +1,6 @@
 # extensions.py
-from flask_caching import Cache
+from shared_cache import SearchCache
+from rate_limit import RateLimiter
 
-cache = Cache()
\ No newline at end of file
+search_cache = SearchCache()
+rate_limiter = RateLimiter()
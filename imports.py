@@ -0,0 +1,201 @@
+# Description: This file contains the streaming import of applications from CSV or NDJSON files,
+# the counterpart of export.py. The file is read one record at a time and handled in chunks: each
+# chunk is validated column by column (validation.validate_applications), its existing rows are
+# loaded with one IN (...) query per SQL_IN_CHUNK_SIZE IDs, and it is upserted with one executemany
+# INSERT ... ON CONFLICT (id) DO UPDATE and committed on its own. Memory therefore depends on the
+# chunk size, never on the file size. Rows that fail validation are written to a rejected-rows
+# NDJSON file as {"row", "errors", "record"}, where row is the line number in the input file.
+#
+# Imports replace whole rows: they keep the rollups (including the STVPs of an application that
+# changes company), the name index and the search cache in step and bump each updated row's
+# version, but do not log Amendment rows.
+#
+# Usage: python imports.py FILE [--format csv|ndjson] [--rejected PATH] [--chunk-size N]
+
+import csv
+import json
+import logging
+import time
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from export import APPLICATION_COLUMNS, FORMATS
+from extensions import search_cache
+from models import Application, STVP, db
+from rollups import RollupChanges
+from services import lock_for_write
+from validation import validate_applications
+
+def read_records(f, format):
+    """Yield (row, record, error) for every record of an open text file; row is its line number.
+    record is a dict, or the raw line when it could not be parsed, in which case error says why.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for row, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line), None
+        except ValueError as e:
+            yield row, line.rstrip('\n'), f"Invalid JSON: {e}"
+
+def import_applications(f, format, rejected_path=None, chunk_size=None, progress=None):
+    """Upsert every valid record of an open CSV or NDJSON file into applications.
+
+    Records are upserted by id: a new id is inserted, an existing one has all its columns replaced
+    and its version bumped. When an id appears more than once in the file the last occurrence wins.
+    Each chunk is committed on its own, so a failure loses at most one chunk.
+
+    :param rejected_path: Where to write rejected rows as NDJSON; created only if a row is rejected.
+    :param progress: Optional callable invoked with the running report after every chunk.
+    :return: Dict of counts and timings.
+    """
+    chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+    report = {
+        "format": format,
+        "rows_read": 0,
+        "inserted": 0,
+        "updated": 0,
+        "duplicates": 0,
+        "rejected": 0,
+        "chunks": 0,
+        "elapsed_seconds": 0.0,
+        "rows_per_second": 0.0
+    }
+    started = time.perf_counter()
+    rejected_file = None
+    chunk = []
+
+    def flush():
+        nonlocal rejected_file
+        parsed = {row: record for row, record, error in chunk if error is None}
+        valid, rejected = validate_applications(list(parsed.items()))
+        rejected += [{"row": row, "errors": {"record": error}} for row, _, error in chunk if error is not None]
+        if rejected:
+            if rejected_file is None:
+                rejected_file = open(rejected_path, 'w', encoding='utf-8') if rejected_path else False
+            if rejected_file:
+                records = {row: record for row, record, _ in chunk}
+                rejected_file.writelines(
+                    json.dumps({**entry, "record": records[entry["row"]]}, separators=(',', ':')) + '\n'
+                    for entry in sorted(rejected, key=lambda entry: entry["row"]))
+
+        try:
+            inserted, updated, duplicates, fins = _import_chunk(valid)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logging.error(f"Import failed in chunk {report['chunks'] + 1} (lines {chunk[0][0]}-{chunk[-1][0]})",
+                          exc_info=True)
+            raise
+        search_cache.delete(*fins)
+
+        report["rows_read"] += len(chunk)
+        report["inserted"] += inserted
+        report["updated"] += updated
+        report["duplicates"] += duplicates
+        report["rejected"] += len(rejected)
+        report["chunks"] += 1
+        elapsed = time.perf_counter() - started
+        report["elapsed_seconds"] = round(elapsed, 4)
+        report["rows_per_second"] = round(report["rows_read"] / elapsed, 1) if elapsed else 0.0
+        chunk.clear()
+        if progress:
+            progress(report)
+
+    try:
+        for record in read_records(f, format):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        if rejected_file:
+            rejected_file.close()
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_seconds"] = round(elapsed, 4)
+    report["rows_per_second"] = round(report["rows_read"] / elapsed, 1) if elapsed else 0.0
+    logging.info(f"Import finished: {report}")
+    return report
+
+def _import_chunk(valid):
+    # The last occurrence of an id wins, as if the rows had been applied one after another
+    applications = {}
+    for _, application in valid:
+        applications[application['id']] = application
+    duplicates = len(valid) - len(applications)
+    if not applications:
+        return 0, 0, duplicates, set()
+
+    # The rollup changes start from the existing rows, so read them under the write lock
+    lock_for_write()
+    ids = list(applications)
+    existing = {}
+    for start in range(0, len(ids), Config.SQL_IN_CHUNK_SIZE):
+        for row in db.session.execute(
+                select(Application.id, Application.fin, Application.pass_type, Application.status,
+                       Application.company_uen, Application.doe)
+                .where(Application.id.in_(ids[start:start + Config.SQL_IN_CHUNK_SIZE]))):
+            existing[row.id] = row
+
+    rollups = RollupChanges()
+    fins = set()
+    for application in applications.values():
+        old = existing.get(application['id'])
+        if old is not None:
+            rollups.add_pass(old.company_uen, old.pass_type, old.status, old.doe, count=-1)
+            fins.add(old.fin)
+        rollups.add_pass(application['company_uen'], application['pass_type'], application['status'], application['doe'])
+        fins.add(application['fin'])
+
+    # An application that changes company takes its STVPs with it
+    moved = [application_id for application_id, old in existing.items()
+             if old.company_uen != applications[application_id]['company_uen']]
+    for start in range(0, len(moved), Config.SQL_IN_CHUNK_SIZE):
+        for application_id, end_date in db.session.execute(
+                select(STVP.application_id, STVP.end_date)
+                .where(STVP.application_id.in_(moved[start:start + Config.SQL_IN_CHUNK_SIZE]))):
+            rollups.move_stvp(existing[application_id].company_uen, end_date, None)
+            rollups.move_stvp(applications[application_id]['company_uen'], None, end_date)
+
+    statement = sqlite_insert(Application)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Application.id],
+        set_={**{column: getattr(statement.excluded, column) for column in APPLICATION_COLUMNS if column != 'id'},
+              "version": Application.version + 1}
+    )
+    db.session.execute(statement, list(applications.values()))
+    rollups.apply()
+    return len(applications) - len(existing), len(existing), duplicates, fins
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Import applications from a CSV or NDJSON file.")
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=list(FORMATS), default=None,
+                        help="Defaults to the file extension (.csv or .ndjson)")
+    parser.add_argument('--rejected', default=None,
+                        help="Where to write rejected rows; defaults to FILE.rejected.ndjson")
+    parser.add_argument('--chunk-size', type=int, default=Config.IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    format = args.format or os.path.splitext(args.file)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        parser.error(f"Cannot tell the format of {args.file}; pass --format")
+
+    def show(report):
+        print(f"{report['rows_read']} rows read, {report['rejected']} rejected, "
+              f"{report['rows_per_second']:.0f} rows/s", flush=True)
+
+    with app.app_context(), open(args.file, encoding='utf-8-sig', newline='') as f:
+        report = import_applications(f, format, rejected_path=args.rejected or f"{args.file}.rejected.ndjson",
+                                     chunk_size=args.chunk_size, progress=show)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,393 @@
+# jobs.py
+# A job registry on top of app.executor. Every background job gets a stable ID that clients can
+# poll for status, progress and result, and can cancel. The number of queued jobs is bounded, so
+# an overloaded server rejects new work with JobQueueFull instead of growing memory without limit.
+#
+# Job state lives in a local SQLite file (JOB_STORE_PATH) shared by every worker process, so a job
+# submitted to one worker can be polled or cancelled through any other. Each job runs on the
+# executor of the worker that accepted it; the queue bound and the busy/queued counters in
+# stats() are per worker.
+#
+# Each job records the pid of its worker, which refreshes a heartbeat for its live jobs every
+# JOB_HEARTBEAT_INTERVAL seconds. A queued or running job whose worker has exited, or whose
+# heartbeat is older than JOB_HEARTBEAT_TIMEOUT, is marked failed when it is polled and when a
+# worker first opens the store, so pollers always see it finish.
+#
+# Files a job writes for clients to download are recorded with Job.add_file and deleted with the
+# job's record once JOB_HISTORY newer jobs push it out.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        files TEXT NOT NULL DEFAULT '[]',
+        owner_pid INTEGER,
+        heartbeat_at REAL
+    )''',
+)
+
+# Columns that stores created by earlier versions lack, added when the store is opened
+_ADDED_COLUMNS = (
+    ('files', "TEXT NOT NULL DEFAULT '[]'"),
+    ('owner_pid', "INTEGER"),
+    ('heartbeat_at', "REAL"),
+)
+
+class JobQueueFull(Exception):
+    """Raised by JobRegistry.submit when max_pending jobs are already waiting for a worker."""
+
+class JobCancelled(Exception):
+    """Raised inside a running job by Job.update_progress once cancellation has been requested."""
+
+class Job:
+    def __init__(self, name, registry=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = QUEUED
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.files = []
+        self._registry = registry
+        self._future = None
+
+    @classmethod
+    def from_row(cls, row):
+        """A snapshot of a job as stored, for polling from any worker."""
+        job = cls(row['name'])
+        job.id = row['id']
+        job.status = row['status']
+        job.progress = json.loads(row['progress']) if row['progress'] is not None else None
+        job.result = json.loads(row['result']) if row['result'] is not None else None
+        job.error = row['error']
+        job.created_at = datetime.fromisoformat(row['created_at'])
+        job.started_at = datetime.fromisoformat(row['started_at']) if row['started_at'] else None
+        job.finished_at = datetime.fromisoformat(row['finished_at']) if row['finished_at'] else None
+        job.cancel_requested = bool(row['cancel_requested'])
+        job.files = json.loads(row['files'])
+        return job
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def update_progress(self, progress):
+        """Record progress from inside the job. This is also where a cancellation request takes effect,
+        including one made through another worker.
+        """
+        self.progress = progress
+        if self._registry is not None and self._registry._save_progress(self):
+            self.cancel_requested = True
+        if self.cancel_requested:
+            raise JobCancelled(self.id)
+
+    def add_file(self, path):
+        """Record a file the job writes, so it is deleted when the job is pruned. Call before writing it."""
+        self.files.append(path)
+        if self._registry is not None:
+            self._registry._save_files(self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class JobRegistry:
+    def __init__(self, app, executor, max_workers, max_pending, history=1000):
+        self._app = app
+        self._executor = executor
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        app.config.setdefault('JOB_STORE_PATH', os.path.join(basedir, 'jobs.db'))
+        app.config.setdefault('JOB_HEARTBEAT_INTERVAL', 10)
+        app.config.setdefault('JOB_HEARTBEAT_TIMEOUT', 60)
+        self._local = threading.local()
+        self._swept = set()   # Store files already checked for orphaned jobs by this registry
+        self._heartbeat = None
+        self._live = {}   # Jobs submitted to this worker that have not finished, by ID
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._busy = 0
+        self._rejected = 0
+
+    def _connection(self):
+        # One connection per thread and file; sqlite3 connections must not be shared across threads
+        path = self._app.config['JOB_STORE_PATH']
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, definition in _ADDED_COLUMNS:
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+            if path not in self._swept:
+                # Jobs left behind by workers that stopped before this one started
+                self._swept.add(path)
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._fail_orphans(conn, conn.execute(
+                        'SELECT * FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)).fetchall())
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            connections[path] = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs) to run in an app context on the executor."""
+        job = Job(name, registry=self)
+        with self._lock:
+            if self._queued >= self.max_pending:
+                self._rejected += 1
+                raise JobQueueFull(f"{self._queued} jobs already queued")
+            self._queued += 1
+            self._live[job.id] = job
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    'INSERT INTO jobs (id, name, status, created_at, owner_pid, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (job.id, job.name, job.status, job.created_at.isoformat(), os.getpid(), time.time())
+                )
+                pruned_files = self._prune(conn)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+                del self._live[job.id]
+            raise
+        _remove_files(pruned_files)
+        self._start_heartbeat()
+        job._future = self._executor.submit(self._run, job, fn, args, kwargs)
+        logging.info(f"Queued job {job.id} ({name})")
+        return job
+
+    def get(self, job_id):
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is not None and self._orphaned(row):
+            with self._transaction() as conn:
+                self._fail_orphans(conn, conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchall())
+                row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def cancel(self, job_id):
+        """Cancel a job queued on this worker at once, or ask the job to stop: a running job stops at
+        its next progress update, a job queued on another worker when it is picked up.
+        """
+        with self._transaction() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = Job.from_row(row)
+            if job.finished:
+                return job
+            job.cancel_requested = True
+            conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            with self._lock:
+                live = self._live.get(job_id)
+                if live is not None:
+                    live.cancel_requested = True
+                    if live._future is not None and live._future.cancel():
+                        self._queued -= 1
+                        del self._live[job_id]
+                        self._finish(conn, live, CANCELLED)
+                        job = live
+        logging.info(f"Cancellation requested for job {job_id}")
+        return job
+
+    def stats(self):
+        tracked = self._connection().execute('SELECT count(*) FROM jobs').fetchone()[0]
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "busy_workers": self._busy,
+                "utilisation": round(self._busy / self.max_workers, 3),
+                "queued": self._queued,
+                "max_pending": self.max_pending,
+                "rejected": self._rejected,
+                "tracked_jobs": tracked
+            }
+
+    def _orphaned(self, row):
+        """True for a queued or running job whose worker has exited or stopped sending heartbeats."""
+        if row['status'] not in (QUEUED, RUNNING):
+            return False
+        if row['heartbeat_at'] is not None and row['heartbeat_at'] < time.time() - self._app.config['JOB_HEARTBEAT_TIMEOUT']:
+            return True
+        pid = row['owner_pid']
+        return pid is not None and pid != os.getpid() and not _process_alive(pid)
+
+    def _fail_orphans(self, conn, rows):
+        finished_at = datetime.now(timezone.utc).isoformat()
+        for row in rows:
+            if self._orphaned(row):
+                logging.warning(f"Job {row['id']} ({row['name']}) lost its worker process {row['owner_pid']}")
+                conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                    (FAILED, f"Worker process {row['owner_pid']} stopped before the job finished", finished_at, row['id'])
+                )
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(self._app.config['JOB_HEARTBEAT_INTERVAL'])
+            with self._lock:
+                ids = list(self._live)
+            if not ids:
+                continue
+            try:
+                with self._transaction() as conn:
+                    conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({', '.join('?' * len(ids))})",
+                                 (time.time(), *ids))
+            except sqlite3.Error as e:
+                logging.warning(f"Job heartbeat failed: {str(e)}")
+
+    def _save_progress(self, job):
+        """Store a running job's progress; return True if its cancellation has been requested."""
+        with self._transaction() as conn:
+            conn.execute('UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?',
+                         (json.dumps(job.progress), time.time(), job.id))
+            return bool(conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job.id,)).fetchone()[0])
+
+    def _save_files(self, job):
+        with self._transaction() as conn:
+            conn.execute('UPDATE jobs SET files = ? WHERE id = ?', (json.dumps(job.files), job.id))
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+        with self._transaction() as conn:
+            if conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job.id,)).fetchone()[0]:
+                job.cancel_requested = True
+                self._finish(conn, job, CANCELLED)
+                with self._lock:
+                    self._live.pop(job.id, None)
+                return
+            job.status = RUNNING
+            job.started_at = datetime.now(timezone.utc)
+            conn.execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?',
+                         (job.status, job.started_at.isoformat(), job.id))
+        with self._lock:
+            self._busy += 1
+
+        status = SUCCEEDED
+        try:
+            with self._app.app_context():
+                result = fn(job, *args, **kwargs)
+            # Results are stored as JSON; an unstorable one fails the job instead of leaving it running
+            json.dumps(result)
+            job.result = result
+        except JobCancelled:
+            status = CANCELLED
+            logging.info(f"Job {job.id} ({job.name}) cancelled")
+        except Exception as e:
+            status = FAILED
+            job.error = str(e)
+            logging.error(f"Job {job.id} ({job.name}) failed: {str(e)}", exc_info=True)
+        finally:
+            with self._transaction() as conn:
+                self._finish(conn, job, status)
+            with self._lock:
+                self._busy -= 1
+                self._live.pop(job.id, None)
+
+    def _finish(self, conn, job, status):
+        job.status = status
+        job.finished_at = datetime.now(timezone.utc)
+        conn.execute(
+            'UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+            (job.status, json.dumps(job.progress) if job.progress is not None else None,
+             json.dumps(job.result) if job.result is not None else None,
+             job.error, job.finished_at.isoformat(), job.id)
+        )
+
+    def _prune(self, conn):
+        """Forget the oldest finished jobs once more than `history` are stored; live jobs are always kept.
+        Returns the files of the forgotten jobs, to delete once the transaction has committed.
+        """
+        excess = conn.execute('SELECT count(*) FROM jobs').fetchone()[0] - self.history
+        if excess <= 0:
+            return []
+        rows = conn.execute(
+            'SELECT rowid, files FROM jobs WHERE status IN (?, ?, ?) ORDER BY rowid LIMIT ?',
+            (SUCCEEDED, FAILED, CANCELLED, excess)
+        ).fetchall()
+        conn.executemany('DELETE FROM jobs WHERE rowid = ?', [(row['rowid'],) for row in rows])
+        return [path for row in rows for path in json.loads(row['files'])]
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass   # Exists, but belongs to another user
+    return True
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not delete job file {path}: {str(e)}")
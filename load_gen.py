@@ -0,0 +1,286 @@
+# Description: This script is an open-loop load generator. Unlike backend_test.load_test, which
+# runs a fixed number of threads in a closed loop (a slow server slows the clients down and hides
+# its own tail latency), it starts workflows at a target arrival rate whether or not earlier ones
+# have finished. The first request of every workflow is timed from its intended send time, so
+# time spent queued behind a stalled server is counted (coordinated-omission correction).
+#
+# Workflows: search, search -> create-stvp, search -> update-expiry, mixed with --mix.
+# Targets: a running server (--url) or the app in-process through WSGI (--in-process), which
+# needs no network and works on a temporary copy of --database. Search targets are sampled from
+# --database with --seed, so a seed gives the same targets on every run.
+#
+# Usage: python load_gen.py [--url http://localhost:5000 | --in-process] [--rate 50 --duration 30]
+#                           [--ramp 10,20,40,80 --step-seconds 10] [--mix search=6,search_stvp=2,search_update=2]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+from ci_utils import QuantileSketch
+
+def latency_summary(sketch):
+    return {
+        "count": sketch.count,
+        **{f"p{p:g}_ms": round(sketch.percentile(p) * 1000, 2) if sketch.count else 0.0 for p in (50, 90, 99, 99.9)},
+        "max_ms": round(sketch.max * 1000, 2) if sketch.count else 0.0
+    }
+
+class HTTPTransport:
+    """Minimal asyncio HTTP/1.1 client (one connection per request), so no extra dependency."""
+
+    def __init__(self, url, api_key):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.api_key = api_key
+
+    async def request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: close",
+                       f"X-API-Key: {self.api_key}", f"Content-Length: {len(payload)}"]
+            if body is not None:
+                headers.append("Content-Type: application/json")
+            writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + payload)
+            await writer.drain()
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            length = None
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value.strip())
+            content = await (reader.readexactly(length) if length is not None else reader.read())
+            return status, content
+        finally:
+            writer.close()
+
+class WSGITransport:
+    """Calls the Flask app directly on a thread pool; WSGI is synchronous, asyncio is not."""
+
+    def __init__(self, app, api_key, threads):
+        self.app = app
+        self.api_key = api_key
+        self.executor = ThreadPoolExecutor(threads)
+
+    def _call(self, method, path, body):
+        response = self.app.test_client().open(path, method=method, json=body, headers={"X-API-Key": self.api_key})
+        return response.status_code, response.get_data()
+
+    async def request(self, method, path, body=None):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, method, path, body)
+
+class LoadGenerator:
+    def __init__(self, transport, targets, mix, max_in_flight, seed):
+        self.transport = transport
+        self.targets = targets
+        self.workflows = list(mix)
+        self.weights = [mix[name] for name in self.workflows]
+        self.rng = random.Random(seed)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.endpoints = {}    # (endpoint, status) -> QuantileSketch
+        self.workflow_latency = {}    # workflow -> QuantileSketch
+        self.stages = []
+
+    def _record(self, endpoint, status, seconds):
+        self.endpoints.setdefault((endpoint, status), QuantileSketch()).add(seconds)
+
+    async def _timed(self, endpoint, method, path, body=None, intended=None):
+        """Send a request; latency runs from `intended` (the scheduled time) when given."""
+        loop = asyncio.get_running_loop()
+        started = intended if intended is not None else loop.time()
+        try:
+            status, content = await self.transport.request(method, path, body)
+        except Exception as e:
+            logging.warning(f"{endpoint} request failed: {str(e)}")
+            status, content = 'error', b''
+        self._record(endpoint, status, loop.time() - started)
+        return status, content
+
+    async def _search(self, target, intended):
+        """Search for a target's FIN; return its application ID if the search succeeded."""
+        fin, application_id = target
+        status, _ = await self._timed('search', 'GET', f"/api/applications/search?fin={fin}", intended=intended)
+        return application_id if status == 200 else None
+
+    async def search(self, intended):
+        await self._search(self.rng.choice(self.targets["any"]), intended)
+
+    async def search_stvp(self, intended):
+        application_id = await self._search(self.rng.choice(self.targets["expired"]), intended)
+        if application_id:
+            await self._timed('create-stvp', 'POST', f"/api/applications/{application_id}/create-stvp")
+
+    async def search_update(self, intended):
+        application_id = await self._search(self.rng.choice(self.targets["active"]), intended)
+        if application_id:
+            new_doe = (date.today() + timedelta(days=self.rng.randint(400, 800))).isoformat()
+            await self._timed('update-expiry', 'PUT', f"/api/applications/{application_id}/update-expiry",
+                              {"new_doe": new_doe})
+
+    async def _workflow(self, name, intended, stage):
+        async with self.in_flight:
+            await getattr(self, name)(intended)
+        latency = asyncio.get_running_loop().time() - intended
+        self.workflow_latency.setdefault(name, QuantileSketch()).add(latency)
+        stage["latency"].add(latency)
+
+    async def run(self, rates, step_seconds, poisson=False):
+        """Start workflows at rates[i] per second for step_seconds each; wait for all to finish."""
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        start = loop.time()
+        offset = 0.0
+        for index, rate in enumerate(rates):
+            stage = {"rate": rate, "started": 0, "latency": QuantileSketch()}
+            self.stages.append(stage)
+            stage_end = (index + 1) * step_seconds
+            while True:
+                offset += self.rng.expovariate(rate) if poisson else 1 / rate
+                if offset >= stage_end:
+                    offset = stage_end
+                    break
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                name = self.rng.choices(self.workflows, self.weights)[0]
+                task = asyncio.create_task(self._workflow(name, start + offset, stage))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                stage["started"] += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+        return loop.time() - start
+
+    def report(self, elapsed):
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "stages": [
+                {"target_rate": stage["rate"], "started": stage["started"], **latency_summary(stage["latency"])}
+                for stage in self.stages
+            ],
+            "workflows": {name: latency_summary(sketch) for name, sketch in sorted(self.workflow_latency.items())},
+            "endpoints": [
+                {"endpoint": endpoint, "status": status, **latency_summary(sketch)}
+                for (endpoint, status), sketch in sorted(self.endpoints.items(), key=lambda item: str(item[0]))
+            ]
+        }
+
+def sample_targets(database, count=1000, seed=42, probes=20):
+    """(FIN, application ID) pairs to search for: any, with an expired pass (for create-stvp) and an
+    active one (for update-expiry).
+
+    Applications are drawn by rowid from a random.Random(seed), so the same seed and database give
+    the same targets, and at most probes * count rows are read instead of the whole table.
+    """
+    connection = sqlite3.connect(database)
+    today = date.today().isoformat()
+    targets = {"any": [], "expired": [], "active": []}
+    highest = connection.execute("SELECT max(rowid) FROM applications").fetchone()[0] or 0
+    rowids = random.Random(seed).sample(range(1, highest + 1), min(highest, probes * count))
+    # Rowids left unused by deleted rows are simply missed
+    for start in range(0, len(rowids), 500):
+        batch = rowids[start:start + 500]
+        rows = {row[0]: row[1:] for row in connection.execute(
+            f"SELECT rowid, fin, id, doe FROM applications WHERE rowid IN ({', '.join('?' * len(batch))})", batch)}
+        for rowid in batch:
+            if rowid not in rows:
+                continue
+            fin, application_id, doe = rows[rowid]
+            for name in ("any", "expired" if doe < today else "active"):
+                if len(targets[name]) < count:
+                    targets[name].append((fin, application_id))
+        if all(len(values) >= count for values in targets.values()):
+            break
+    connection.close()
+    # Fall back to any FIN when the sample has no passes of one kind
+    return {name: values or targets["any"] for name, values in targets.items()}
+
+def in_process_app(database, workdir):
+    from app import create_app
+    from config import Config
+
+    working_copy = os.path.join(workdir, 'load.db')
+    shutil.copyfile(database, working_copy)
+
+    class LoadConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{working_copy}"
+        SEARCH_CACHE_PATH = os.path.join(workdir, 'search_cache.db')
+        JOB_STORE_PATH = os.path.join(workdir, 'jobs.db')
+
+    return create_app(LoadConfig)
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('search', 'search_stvp', 'search_update'):
+            raise argparse.ArgumentTypeError(f"Unknown workflow: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def print_report(report):
+    print(f"Finished in {report['elapsed_seconds']}s")
+    print(f"{'stage rate':>10} {'started':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in report["stages"]:
+        print(f"{stage['target_rate']:>10g} {stage['started']:>8} {stage['p50_ms']:>9} {stage['p99_ms']:>9} {stage['max_ms']:>9}")
+    print(f"{'endpoint':<14} {'status':>6} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}")
+    for row in report["endpoints"]:
+        print(f"{row['endpoint']:<14} {str(row['status']):>6} {row['count']:>7} {row['p50_ms']:>9} {row['p90_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['p99.9_ms']:>9} {row['max_ms']:>9}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the work pass API.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://localhost:5000', help="Base URL of a running server")
+    target.add_argument('--in-process', action='store_true', help="Drive the app through WSGI, without a network")
+    parser.add_argument('--database', default='with_amendments.db', help="Database to sample FINs from (and to copy in-process)")
+    parser.add_argument('--rate', type=float, default=20, help="Workflows started per second")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds at --rate")
+    parser.add_argument('--ramp', help="Comma-separated rates for a step ramp, e.g. 10,20,40,80 (overrides --rate)")
+    parser.add_argument('--step-seconds', type=float, default=10, help="Seconds per ramp step")
+    parser.add_argument('--poisson', action='store_true', help="Exponential inter-arrival times instead of a fixed interval")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('search=6,search_stvp=2,search_update=2'))
+    parser.add_argument('--max-in-flight', type=int, default=1000,
+                        help="Cap on concurrent workflows; waiting for a slot still counts toward latency")
+    parser.add_argument('--threads', type=int, default=32, help="WSGI threads for --in-process")
+    parser.add_argument('--api-key', default='default_key')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.ramp:
+        rates, step_seconds = [float(rate) for rate in args.ramp.split(',')], args.step_seconds
+    else:
+        rates, step_seconds = [args.rate], args.duration
+
+    targets = sample_targets(args.database, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='load_gen_') as workdir:
+        if args.in_process:
+            logging.disable(logging.CRITICAL)
+            transport = WSGITransport(in_process_app(args.database, workdir), args.api_key, args.threads)
+        else:
+            transport = HTTPTransport(args.url, args.api_key)
+
+        async def main():
+            generator = LoadGenerator(transport, targets, args.mix, args.max_in_flight, args.seed)
+            return generator.report(await generator.run(rates, step_seconds, args.poisson))
+
+        report = asyncio.run(main())
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,184 @@
+# Description: This script brings an existing SQLite database up to the schema declared in models.py.
+# Every migration inspects the live schema before changing it, so the script is safe to re-run
+# and also works on databases freshly generated by with_amendments.py.
+#
+# Usage: python migrations.py [path/to/database.db]
+
+import sqlite3
+import sys
+from config import Config
+from models import NAME_SEARCH_DROP, NAME_SEARCH_TABLES, NAME_SEARCH_TRIGGERS
+
+def _columns(cursor, table):
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+
+AMENDMENT_INDEXES = {
+    "ix_amendments_application_id_amendment_date": "amendments (application_id, amendment_date, amendment_id)",
+    "ix_amendments_amendment_date": "amendments (amendment_date, amendment_id)",
+}
+
+def add_amendment_seq(cursor):
+    """Per-application amendment counter, backfilled from the amendments already issued."""
+    if 'amendment_seq' in _columns(cursor, 'applications'):
+        return False
+    # The backfill looks amendments up by application; this is the index add_amendment_indexes keeps
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_amendments_application_id_amendment_date "
+                   f"ON {AMENDMENT_INDEXES['ix_amendments_application_id_amendment_date']}")
+    cursor.execute("ALTER TABLE applications ADD COLUMN amendment_seq INTEGER NOT NULL DEFAULT 0")
+    # Amendment IDs are P<seq><application_id>; continue from the highest sequence already used
+    # rather than the row count, so the next ID can never collide with an existing one
+    cursor.execute('''
+        UPDATE applications SET amendment_seq = COALESCE((
+            SELECT MAX(CAST(substr(a.amendment_id, 2, length(a.amendment_id) - 1 - length(a.application_id)) AS INTEGER))
+            FROM amendments a
+            WHERE a.application_id = applications.id
+        ), 0)
+    ''')
+    return True
+
+def add_stvp_application_index(cursor):
+    """STVP lookups by application (create-stvp and the bulk issuance job) use this index."""
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_stvps_application_id'").fetchone():
+        return False
+    cursor.execute("CREATE INDEX ix_stvps_application_id ON stvps (application_id)")
+    return True
+
+def add_application_version(cursor):
+    """Per-application version, bumped on every write; read endpoints derive their ETags from it."""
+    if 'version' in _columns(cursor, 'applications'):
+        return False
+    cursor.execute("ALTER TABLE applications ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    return True
+
+LIST_FILTER_INDEXES = {
+    "ix_applications_status_doe": "applications (status, doe)",
+    "ix_applications_pass_type_doe": "applications (pass_type, doe)",
+    "ix_applications_company_uen_doe": "applications (company_uen, doe)",
+    "ix_applications_doa": "applications (doa)",
+}
+
+def add_list_filter_indexes(cursor):
+    """Indexes behind the status/pass_type/company_uen/doa filters of GET /api/applications."""
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    missing = [name for name in LIST_FILTER_INDEXES if name not in existing]
+    for name in missing:
+        cursor.execute(f"CREATE INDEX {name} ON {LIST_FILTER_INDEXES[name]}")
+    return bool(missing)
+
+def add_expiry_rollup(cursor):
+    """Per-day, per-pass-type expiry counts behind GET /api/expiries, backfilled like rollups.rebuild('expiries')."""
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expiry_rollup'").fetchone():
+        return False
+    cursor.execute('''
+        CREATE TABLE expiry_rollup (
+            day DATE NOT NULL,
+            pass_type VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, pass_type)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO expiry_rollup (day, pass_type, count)
+        SELECT doe, pass_type, COUNT(*) FROM applications GROUP BY doe, pass_type
+        UNION ALL
+        SELECT end_date, 'STVP', COUNT(*) FROM stvps GROUP BY end_date
+    ''')
+    return True
+
+def add_company_summary(cursor):
+    """Per-company rollup behind GET /api/companies, backfilled like rollups.rebuild('companies')."""
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'company_totals'").fetchone():
+        return False
+    statements = [
+        """CREATE TABLE company_summary (
+            company_uen VARCHAR NOT NULL,
+            pass_type VARCHAR NOT NULL,
+            status VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (company_uen, pass_type, status)
+        )""",
+        """CREATE TABLE company_expiries (
+            company_uen VARCHAR NOT NULL,
+            kind VARCHAR NOT NULL,
+            day DATE NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (company_uen, kind, day)
+        )""",
+        """CREATE TABLE company_totals (
+            company_uen VARCHAR NOT NULL,
+            passes INTEGER NOT NULL,
+            PRIMARY KEY (company_uen)
+        )""",
+        "CREATE INDEX ix_company_totals_passes ON company_totals (passes DESC, company_uen)",
+        """INSERT INTO company_summary (company_uen, pass_type, status, count)
+        SELECT company_uen, pass_type, status, COUNT(*) FROM applications GROUP BY company_uen, pass_type, status""",
+        """INSERT INTO company_expiries (company_uen, kind, day, count)
+        SELECT company_uen, 'pass', doe, COUNT(*) FROM applications GROUP BY company_uen, doe
+        UNION ALL
+        SELECT a.company_uen, 'stvp', s.end_date, COUNT(*) FROM stvps s JOIN applications a ON a.id = s.application_id
+        GROUP BY a.company_uen, s.end_date""",
+        """INSERT INTO company_totals (company_uen, passes)
+        SELECT company_uen, COUNT(*) FROM applications GROUP BY company_uen""",
+    ]
+    for statement in statements:
+        cursor.execute(statement)
+    return True
+
+def add_name_search(cursor):
+    """FTS5 index over applications.name, filled from the existing rows, then kept in step by triggers.
+    An index keyed by applications.rowid (which VACUUM may renumber) is replaced by one keyed through
+    applications_fts_keys."""
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'applications_fts_keys'").fetchone():
+        return False
+    for trigger in ('applications_fts_insert', 'applications_fts_delete', 'applications_fts_update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for statement in NAME_SEARCH_DROP:
+        cursor.execute(statement)
+    for statement in NAME_SEARCH_TABLES:
+        cursor.execute(statement)
+    cursor.execute("INSERT INTO applications_fts_keys (application_id) SELECT id FROM applications")
+    cursor.execute("INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')")
+    for trigger in NAME_SEARCH_TRIGGERS:
+        cursor.execute(trigger)
+    return True
+
+def add_amendment_indexes(cursor):
+    """Indexes behind the paginated amendment history and GET /api/amendments. The composite index
+    replaces ix_amendments_application_id, whose lookups it serves through its leftmost column."""
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    missing = [name for name in AMENDMENT_INDEXES if name not in existing]
+    for name in missing:
+        cursor.execute(f"CREATE INDEX {name} ON {AMENDMENT_INDEXES[name]}")
+    if 'ix_amendments_application_id' in existing:
+        cursor.execute("DROP INDEX ix_amendments_application_id")
+        return True
+    return bool(missing)
+
+MIGRATIONS = [
+    add_amendment_seq,
+    add_stvp_application_index,
+    add_application_version,
+    add_list_filter_indexes,
+    add_expiry_rollup,
+    add_company_summary,
+    add_name_search,
+    add_amendment_indexes,
+]
+
+def migrate(connection):
+    cursor = connection.cursor()
+    applied = []
+    for migration in MIGRATIONS:
+        if migration(cursor):
+            applied.append(migration.__name__)
+    connection.commit()
+    return applied
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE_PATH
+    connection = sqlite3.connect(path)
+    try:
+        applied = migrate(connection)
+    finally:
+        connection.close()
+    print(f"Applied migrations: {', '.join(applied)}" if applied else "Schema is up to date.")
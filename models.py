@@ -2,25 +2,92 @@
 # The database is created using SQLAlchemy and the models are defined using the SQLAlchemy ORM.
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from datetime import datetime, timezone
+from sqlite_profile import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Application(db.Model):
     __tablename__ = 'applications'
+    # Each list filter (routes.list_applications) seeks one of these, already ordered by doe
+    __table_args__ = (
+        db.Index('ix_applications_status_doe', 'status', 'doe'),
+        db.Index('ix_applications_pass_type_doe', 'pass_type', 'doe'),
+        db.Index('ix_applications_company_uen_doe', 'company_uen', 'doe'),
+    )
     id = db.Column(db.String, primary_key=True)
     fin = db.Column(db.String, nullable=False, index=True)  # Add index=True here
     name = db.Column(db.String, nullable=False)
     pass_type = db.Column(db.String, nullable=False)
-    doa = db.Column(db.Date, nullable=False)
+    doa = db.Column(db.Date, nullable=False, index=True)
     company_uen = db.Column(db.String, nullable=False)
     status = db.Column(db.String, nullable=False)
     doe = db.Column(db.Date, nullable=False, index=True)  # Add index=True here
-    amendments = db.relationship('Amendment', backref='application', lazy=True)
+    # Last amendment sequence number issued for this application; incremented atomically by
+    # services.generate_amendment_id inside the write transaction
+    amendment_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every write to the application, its amendments or its STVPs (services.py, bulk.py)
+    # and by every import that replaces the row (imports.py); ETags of the read endpoints derive from it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    amendments = db.relationship('Amendment', backref='application', lazy=True, order_by='Amendment.amendment_date')
+    stvps = db.relationship('STVP', backref='application', lazy=True, order_by='STVP.end_date')
 
 
+# Full-text index over applications.name for GET /api/applications/search?name= (see name_search.py).
+# The external-content FTS5 table stores only the index; triggers keep it in step with every insert,
+# delete and name change, so no write path has to know about it. applications has a TEXT primary
+# key, so its implicit rowids may change on VACUUM; the index is therefore keyed by
+# applications_fts_keys, whose INTEGER PRIMARY KEY is stable, and reads names through a view.
+NAME_SEARCH_TABLES = [
+    """CREATE TABLE applications_fts_keys (
+        key INTEGER PRIMARY KEY,
+        application_id TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE VIEW applications_fts_content AS
+        SELECT k.key AS key, a.name AS name
+        FROM applications_fts_keys k JOIN applications a ON a.id = k.application_id""",
+    "CREATE VIRTUAL TABLE applications_fts USING fts5("
+    "name, content='applications_fts_content', content_rowid='key', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+NAME_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER applications_fts_insert AFTER INSERT ON applications BEGIN
+        INSERT INTO applications_fts_keys (application_id) VALUES (new.id);
+        INSERT INTO applications_fts (rowid, name)
+            SELECT key, new.name FROM applications_fts_keys WHERE application_id = new.id;
+    END""",
+    """CREATE TRIGGER applications_fts_delete AFTER DELETE ON applications BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, name)
+            SELECT 'delete', key, old.name FROM applications_fts_keys WHERE application_id = old.id;
+        DELETE FROM applications_fts_keys WHERE application_id = old.id;
+    END""",
+    """CREATE TRIGGER applications_fts_update AFTER UPDATE OF name ON applications BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, name)
+            SELECT 'delete', key, old.name FROM applications_fts_keys WHERE application_id = old.id;
+        INSERT INTO applications_fts (rowid, name)
+            SELECT key, new.name FROM applications_fts_keys WHERE application_id = new.id;
+    END""",
+]
+NAME_SEARCH_DROP = [
+    "DROP TABLE IF EXISTS applications_fts",
+    "DROP VIEW IF EXISTS applications_fts_content",
+    "DROP TABLE IF EXISTS applications_fts_keys",
+]
+
+for _statement in [*NAME_SEARCH_TABLES, *NAME_SEARCH_TRIGGERS]:
+    event.listen(Application.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in NAME_SEARCH_DROP:
+    event.listen(Application.__table__, 'before_drop', DDL(_statement).execute_if(dialect='sqlite'))
+
 class Amendment(db.Model):
     __tablename__ = 'amendments'
+    # Amendment history pages seek (application_id, amendment_date) and GET /api/amendments seeks
+    # amendment_date; amendment_id completes both keys, so every keyset position is exact
+    __table_args__ = (
+        db.Index('ix_amendments_application_id_amendment_date', 'application_id', 'amendment_date', 'amendment_id'),
+        db.Index('ix_amendments_amendment_date', 'amendment_date', 'amendment_id'),
+    )
     amendment_id = db.Column(db.String, primary_key=True)
     application_id = db.Column(db.String, db.ForeignKey('applications.id'), nullable=False)
     amendment_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -30,6 +97,38 @@ class Amendment(db.Model):
 class STVP(db.Model):
     __tablename__ = 'stvps'
     id = db.Column(db.String, primary_key=True)
-    application_id = db.Column(db.String, db.ForeignKey('applications.id'), nullable=False)
+    application_id = db.Column(db.String, db.ForeignKey('applications.id'), nullable=False, index=True)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
+
+class ExpiryRollup(db.Model):
+    """Number of passes expiring on each day, per pass type; maintained by rollups.py."""
+    __tablename__ = 'expiry_rollup'
+    day = db.Column(db.Date, primary_key=True)
+    pass_type = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CompanySummary(db.Model):
+    """Number of passes of each company, per pass type and status; maintained by rollups.py."""
+    __tablename__ = 'company_summary'
+    company_uen = db.Column(db.String, primary_key=True)
+    pass_type = db.Column(db.String, primary_key=True)
+    status = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CompanyExpiry(db.Model):
+    """Number of a company's passes (kind 'pass') or STVPs (kind 'stvp') ending on each day; maintained by rollups.py."""
+    __tablename__ = 'company_expiries'
+    company_uen = db.Column(db.String, primary_key=True)
+    kind = db.Column(db.String, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CompanyTotal(db.Model):
+    """Number of passes per company; the index serves the top-N listing without a sort."""
+    __tablename__ = 'company_totals'
+    __table_args__ = (
+        db.Index('ix_company_totals_passes', db.desc('passes'), 'company_uen'),
+    )
+    company_uen = db.Column(db.String, primary_key=True)
+    passes = db.Column(db.Integer, nullable=False, default=0)
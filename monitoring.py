@@ -1,4 +1,14 @@
-from prometheus_client import start_http_server, Counter, Histogram
+# monitoring.py
+# Prometheus instrumentation. monitor_requests(app) times every request by route template,
+# times every SQL statement through SQLAlchemy engine events, and serves everything (plus search
+# cache, rate limiter and job executor state, read at scrape time) from /metrics.
+
+import time
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from models import db
 
 REQUEST_COUNT = Counter(
     'http_requests_total',
@@ -12,15 +22,100 @@ REQUEST_LATENCY = Histogram(
     ['method', 'endpoint']
 )
 
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds',
+    'SQL statement execution time',
+    ['operation'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+def _route_label():
+    # The URL rule template (e.g. /api/applications/<string:application_id>) keeps label cardinality
+    # bounded; the raw path would create a new time series for every application ID
+    return request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+
+def _operation(statement):
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
+
+class RuntimeCollector:
+    """Reads search cache and rate limiter counters and job executor gauges from the app at scrape time."""
+
+    def __init__(self):
+        self.app = None
+
+    def collect(self):
+        if self.app is None:
+            return
+        stats = self.app.jobs.stats()
+        yield GaugeMetricFamily('executor_queue_depth', 'Jobs waiting for an executor worker', value=stats['queued'])
+        yield GaugeMetricFamily('executor_busy_workers', 'Executor workers running a job', value=stats['busy_workers'])
+        yield GaugeMetricFamily('executor_workers', 'Executor pool size', value=stats['workers'])
+        yield CounterMetricFamily('executor_rejected_jobs', 'Jobs rejected because the queue was full', value=stats['rejected'])
+
+        write_queue = self.app.extensions.get('write_queue')
+        if write_queue is not None:
+            writes = write_queue.stats()
+            yield GaugeMetricFamily('write_queue_pending', 'Writes waiting for the group-commit writer', value=writes['pending'])
+            yield CounterMetricFamily('write_queue_batches', 'Transactions committed by the group-commit writer', value=writes['batches'])
+            yield CounterMetricFamily('write_queue_operations', 'Writes applied by the group-commit writer', value=writes['operations'])
+
+        search_cache = self.app.extensions['search_cache']
+        with self.app.app_context():
+            cache = search_cache.stats()
+        for name in ('hits', 'misses', 'evictions', 'invalidations'):
+            yield CounterMetricFamily(f'search_cache_{name}', f'Search cache {name} across all workers', value=cache[name])
+        yield GaugeMetricFamily('search_cache_entries', 'Entries in the search cache', value=cache['size'])
+
+        if self.app.config['RATE_LIMIT_ENABLED']:
+            with self.app.app_context():
+                limits = self.app.extensions['rate_limiter'].stats()
+            allowed = CounterMetricFamily('rate_limit_allowed', 'Requests allowed by the rate limiter across all workers',
+                                          labels=['endpoint', 'tier'])
+            rejected = CounterMetricFamily('rate_limit_rejections', 'Requests rejected by the rate limiter across all workers',
+                                           labels=['endpoint', 'tier'])
+            for row in limits:
+                allowed.add_metric([row['route'], row['tier']], row['allowed'])
+                rejected.add_metric([row['route'], row['tier']], row['rejected'])
+            yield allowed
+            yield rejected
+
+_runtime_collector = RuntimeCollector()
+REGISTRY.register(_runtime_collector)
+
+def instrument_engine(engine):
+    """Time every SQL statement executed through engine."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start_time'].pop()
+        DB_QUERY_LATENCY.labels(_operation(statement)).observe(time.perf_counter() - started)
+
 def monitor_requests(app):
     @app.before_request
     def before_request():
-        request.start_time = time.time()
+        g.start_time = time.perf_counter()
 
     @app.after_request
     def after_request(response):
-        latency = time.time() - request.start_time
-        REQUEST_LATENCY.labels(request.method, request.path).observe(latency)
-        REQUEST_COUNT.labels(request.method, request.path, response.status_code).inc()
+        endpoint = _route_label()
+        if 'start_time' in g:
+            latency = time.perf_counter() - g.start_time
+            REQUEST_LATENCY.labels(request.method, endpoint).observe(latency)
+        REQUEST_COUNT.labels(request.method, endpoint, response.status_code).inc()
         return response
-    
\ No newline at end of file
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(generate_latest(REGISTRY), mimetype=CONTENT_TYPE_LATEST)
+
+    with app.app_context():
+        instrument_engine(db.engine)
+    if 'sqlite_reader' in app.extensions:
+        instrument_engine(app.extensions['sqlite_reader'])
+    _runtime_collector.app = app
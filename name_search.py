@@ -0,0 +1,87 @@
+# Description: This file contains the name search behind GET /api/applications/search?name=.
+# Names are matched through the applications_fts FTS5 index declared in models.py, never with
+# LIKE '%...%', so a query costs a few index lookups plus ranking of the matching rows instead of a
+# scan of applications. Every word of the query must match the start of a word in the name
+# ("jo smi" finds "John Smith"); results are ranked by bm25 and the number of matches considered
+# is capped at NAME_SEARCH_MAX_RESULTS.
+#
+# Usage: python name_search.py rebuild
+
+import re
+from sqlalchemy import column, func, literal_column, select, table, text
+from config import Config
+from models import Application, NAME_SEARCH_TABLES, NAME_SEARCH_TRIGGERS, db
+
+applications_fts = table('applications_fts', column('rowid'), column('rank'))
+applications_fts_keys = table('applications_fts_keys', column('key'), column('application_id'))
+_match = literal_column('applications_fts').op('MATCH')
+
+def match_expression(name):
+    """Turn free text into an FTS5 query: every word becomes a quoted prefix term, all of them required.
+    :return: Tuple (expression, error); expression is None when the text has no usable words.
+    """
+    words = [word for word in re.findall(r'\w+', name.lower()) if len(word) >= Config.NAME_SEARCH_MIN_WORD_LENGTH]
+    if not words:
+        return None, f"name must contain a word of at least {Config.NAME_SEARCH_MIN_WORD_LENGTH} characters"
+    if len(words) > Config.NAME_SEARCH_MAX_WORDS:
+        return None, f"name may contain at most {Config.NAME_SEARCH_MAX_WORDS} words"
+    # \w+ never contains a double quote, so quoting each word neutralises FTS5 operators
+    return ' '.join(f'"{word}"*' for word in words), None
+
+def count_matches(expression, cap):
+    """Number of matching applications, counting no further than cap + 1."""
+    matches = select(applications_fts.c.rowid).where(_match(expression)).limit(cap + 1).subquery()
+    return db.session.scalar(select(func.count()).select_from(matches))
+
+def search_names(expression, columns, offset, limit):
+    """One page of matching applications, best match first (ties broken by index key, so pages are stable).
+    :param columns: Application columns to select, e.g. a RowSerializer's columns.
+    """
+    ranked = (select(applications_fts.c.rowid, applications_fts.c.rank)
+              .where(_match(expression))
+              .order_by(applications_fts.c.rank, applications_fts.c.rowid)
+              .limit(limit).offset(offset)
+              .subquery())
+    return db.session.execute(
+        select(*columns)
+        .select_from(ranked
+                     .join(applications_fts_keys, applications_fts_keys.c.key == ranked.c.rowid)
+                     .join(Application, Application.id == applications_fts_keys.c.application_id))
+        .order_by(ranked.c.rank, ranked.c.rowid)
+    ).all()
+
+def create_name_index(connection):
+    """Create and fill the FTS index on a database whose applications table already exists.
+    The index is filled in one pass before the triggers exist, which is much faster than indexing
+    row by row during a bulk load.
+    """
+    for statement in NAME_SEARCH_TABLES:
+        connection.execute(text(statement))
+    rebuild_name_index(connection)
+    for trigger in NAME_SEARCH_TRIGGERS:
+        connection.execute(text(trigger))
+
+def rebuild_name_index(connection=None):
+    """Give every application an index key and re-read every name, e.g. to repair the index."""
+    connection = connection or db.session
+    connection.execute(text(
+        "DELETE FROM applications_fts_keys WHERE application_id NOT IN (SELECT id FROM applications)"))
+    connection.execute(text(
+        "INSERT INTO applications_fts_keys (application_id) "
+        "SELECT id FROM applications WHERE id NOT IN (SELECT application_id FROM applications_fts_keys)"))
+    connection.execute(text("INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')"))
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Maintain the full-text name index.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('rebuild', help="Rebuild applications_fts from the applications table")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'rebuild':
+            rebuild_name_index()
+            db.session.commit()
+            print("Name index rebuilt.")
@@ -0,0 +1,187 @@
+# rate_limit.py
+# Token-bucket rate limiting shared by every worker process through a local SQLite file, so a
+# limit means the same thing with one worker or sixteen. Each API key belongs to a tier
+# (RATE_LIMIT_KEY_TIERS); a tier maps routes (endpoint names such as
+# "api.search_applications_batch") to limits like "600/minute", with "*" covering every other
+# route. A check is one indexed read and one upsert in a single transaction, whatever the
+# number of keys. Allowed/rejected counters live in the same file and are totals across workers.
+#
+# Buckets exist only for configured keys (API_KEY and the keys of RATE_LIMIT_KEY_TIERS); any
+# other request is limited by client address, so made-up keys cannot add rows. A bucket that has
+# refilled is the same as no bucket, so refilled buckets are swept every RATE_LIMIT_SWEEP_INTERVAL.
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, request
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        full_at REAL NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS rate_limit_counters (
+        route TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        allowed INTEGER NOT NULL DEFAULT 0,
+        rejected INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (route, tier)
+    )''',
+)
+# Indexes on columns that older files gain through _add_missing_columns
+_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_full_at ON rate_limit_buckets (full_at)',
+)
+
+def parse_limit(limit):
+    """Parse "10/minute" into (capacity, tokens refilled per second)."""
+    try:
+        count, _, period = limit.partition('/')
+        capacity = int(count)
+        return capacity, capacity / _PERIODS[period.strip().rstrip('s')]
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid rate limit: {limit}") from e
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._swept_at = {}   # Limiter file -> time of this process's last sweep
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        app.config.setdefault('RATE_LIMIT_ENABLED', False)
+        app.config.setdefault('RATE_LIMIT_PATH', os.path.join(basedir, 'rate_limit.db'))
+        app.config.setdefault('RATE_LIMIT_TIERS', {"default": {"*": "10/minute"}})
+        app.config.setdefault('RATE_LIMIT_KEY_TIERS', {})
+        app.config.setdefault('RATE_LIMIT_SWEEP_INTERVAL', 60)
+        # Fail at startup, not on the first request, if a limit is misspelled
+        for limits in app.config['RATE_LIMIT_TIERS'].values():
+            for limit in limits.values():
+                parse_limit(limit)
+        app.extensions['rate_limiter'] = self
+
+    def _connection(self):
+        # One connection per thread and file; sqlite3 connections must not be shared across threads
+        path = current_app.config['RATE_LIMIT_PATH']
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # Losing a few refills on a crash is harmless
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._add_missing_columns(conn)
+            for statement in _INDEXES:
+                conn.execute(statement)
+            connections[path] = conn
+        return conn
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        # Files created before full_at existed; their buckets are swept on the first pass
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(rate_limit_buckets)')}
+        if 'full_at' not in columns:
+            conn.execute('ALTER TABLE rate_limit_buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def limit_for(self, api_key, endpoint):
+        """Return (tier, bucket scope, limit) for a key calling an endpoint."""
+        config = current_app.config
+        tier = config['RATE_LIMIT_KEY_TIERS'].get(api_key, 'default')
+        limits = config['RATE_LIMIT_TIERS'].get(tier) or config['RATE_LIMIT_TIERS']['default']
+        scope = endpoint if endpoint in limits else '*'
+        return tier, scope, limits[scope]
+
+    def hit(self, api_key, endpoint, route):
+        """
+        Take one token for api_key on endpoint. Returns (allowed, retry_after_seconds).
+        route is the URL rule, used to label the counters.
+        """
+        if not current_app.config['RATE_LIMIT_ENABLED']:
+            return True, 0
+        tier, scope, limit = self.limit_for(api_key, endpoint)
+        capacity, rate = parse_limit(limit)
+        # Store a digest, not the API key itself
+        key = f"{hashlib.sha256(api_key.encode()).hexdigest()[:32]}|{scope}"
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                conn.execute(
+                    'INSERT INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, '
+                    'full_at = excluded.full_at',
+                    (key, tokens, now, now + (capacity - tokens) / rate)
+                )
+                self._sweep(conn, now)
+                outcome = 'allowed' if allowed else 'rejected'
+                conn.execute(
+                    f'INSERT INTO rate_limit_counters (route, tier, {outcome}) VALUES (?, ?, 1) '
+                    f'ON CONFLICT (route, tier) DO UPDATE SET {outcome} = {outcome} + 1',
+                    (route, tier)
+                )
+        except sqlite3.Error as e:
+            # Fail open: an unavailable limiter must not take the API down with it
+            logging.warning(f"Rate limiter check failed: {str(e)}")
+            return True, 0
+        if allowed:
+            return True, 0
+        return False, max(1, math.ceil((1 - tokens) / rate))
+
+    def _sweep(self, conn, now):
+        """Delete the buckets that have refilled, at most once per RATE_LIMIT_SWEEP_INTERVAL per process."""
+        path = current_app.config['RATE_LIMIT_PATH']
+        if now - self._swept_at.get(path, 0) < current_app.config['RATE_LIMIT_SWEEP_INTERVAL']:
+            return
+        self._swept_at[path] = now
+        conn.execute('DELETE FROM rate_limit_buckets WHERE full_at <= ?', (now,))
+
+    def check(self):
+        """hit() for the current request. The key is the X-API-Key header when it is a configured key,
+        otherwise the client address.
+        """
+        config = current_app.config
+        api_key = request.headers.get('X-API-Key')
+        if api_key != config.get('API_KEY') and api_key not in config['RATE_LIMIT_KEY_TIERS']:
+            api_key = f"ip:{request.remote_addr}"
+        route = request.url_rule.rule if request.url_rule else request.path
+        return self.hit(api_key, request.endpoint, route)
+
+    def reset(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM rate_limit_buckets')
+            conn.execute('DELETE FROM rate_limit_counters')
+
+    def stats(self):
+        """Allowed and rejected totals per route and tier, across all workers."""
+        rows = self._connection().execute(
+            'SELECT route, tier, allowed, rejected FROM rate_limit_counters ORDER BY route, tier'
+        ).fetchall()
+        return [{"route": route, "tier": tier, "allowed": allowed, "rejected": rejected}
+                for route, tier, allowed, rejected in rows]
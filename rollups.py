@@ -0,0 +1,248 @@
+# Description: This file maintains the rollup tables behind the summary endpoints.
+# - expiry_rollup: how many passes expire on each day, per pass type. Applications count on their
+#   doe under their own pass_type, STVPs on their end_date under "STVP" (GET /api/expiries).
+# - company_summary, company_expiries and company_totals: per company, passes by pass type and
+#   status, pass and STVP end dates per day, and the pass total (GET /api/companies...).
+# Every write that changes a counted value adjusts the counts in the caller's transaction
+# (services.py, bulk.py), so the endpoints read a handful of rows instead of scanning applications.
+# rebuild() recomputes a rollup from scratch, after a raw load or to repair drift; check() reports drift.
+#
+# Usage: python rollups.py rebuild-expiries|check-expiries|rebuild-companies|check-companies
+
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Application, CompanyExpiry, CompanySummary, CompanyTotal, ExpiryRollup, STVP, db
+
+STVP_PASS_TYPE = 'STVP'
+PASS_KIND = 'pass'
+STVP_KIND = 'stvp'
+
+def _adjust(model, key_columns, count_column, deltas):
+    """Add each delta to its row's count, with one INSERT ... ON CONFLICT DO UPDATE for all rows."""
+    rows = [dict(zip(key_columns, key), **{count_column: delta}) for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    statement = sqlite_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=[getattr(model, column) for column in key_columns],
+        set_={count_column: getattr(model, count_column) + getattr(statement.excluded, count_column)}
+    )
+    db.session.execute(statement, rows)
+
+class RollupChanges:
+    """Collects count changes for every rollup table, then applies them with one statement per table.
+    Single writes go through move_expiry/move_stvp_expiry; bulk writes collect a whole chunk first.
+    """
+
+    def __init__(self):
+        self.expiries = Counter()            # (day, pass_type)
+        self.company_expiries = Counter()    # (company_uen, kind, day)
+        self.company_passes = Counter()      # (company_uen, pass_type, status)
+        self.company_totals = Counter()      # (company_uen,)
+
+    def move_pass(self, company_uen, pass_type, old_doe, new_doe):
+        """A pass's doe moved; either date may be None for a pass that appears or goes."""
+        self._move(company_uen, pass_type, PASS_KIND, old_doe, new_doe)
+
+    def move_stvp(self, company_uen, old_end_date, new_end_date):
+        """An STVP's end_date moved; old_end_date is None for a new STVP."""
+        self._move(company_uen, STVP_PASS_TYPE, STVP_KIND, old_end_date, new_end_date)
+
+    def add_pass(self, company_uen, pass_type, status, doe, count=1):
+        """count passes were inserted (or deleted, if negative)."""
+        self.company_passes[(company_uen, pass_type, status)] += count
+        self.company_totals[(company_uen,)] += count
+        self.expiries[(doe, pass_type)] += count
+        self.company_expiries[(company_uen, PASS_KIND, doe)] += count
+
+    def _move(self, company_uen, pass_type, kind, old_day, new_day):
+        if old_day is not None:
+            self.expiries[(old_day, pass_type)] -= 1
+            self.company_expiries[(company_uen, kind, old_day)] -= 1
+        if new_day is not None:
+            self.expiries[(new_day, pass_type)] += 1
+            self.company_expiries[(company_uen, kind, new_day)] += 1
+
+    def apply(self):
+        _adjust(ExpiryRollup, ('day', 'pass_type'), 'count', self.expiries)
+        _adjust(CompanyExpiry, ('company_uen', 'kind', 'day'), 'count', self.company_expiries)
+        _adjust(CompanySummary, ('company_uen', 'pass_type', 'status'), 'count', self.company_passes)
+        _adjust(CompanyTotal, ('company_uen',), 'passes', self.company_totals)
+
+def move_expiry(application, old_doe, new_doe):
+    changes = RollupChanges()
+    changes.move_pass(application.company_uen, application.pass_type, old_doe, new_doe)
+    changes.apply()
+
+def move_stvp_expiry(application, old_end_date, new_end_date):
+    changes = RollupChanges()
+    changes.move_stvp(application.company_uen, old_end_date, new_end_date)
+    changes.apply()
+
+# Fresh aggregates, used to rebuild and to check the incrementally maintained tables
+
+def _expiry_counts():
+    applications = (select(Application.doe.label('day'), Application.pass_type, func.count().label('count'))
+                    .group_by(Application.doe, Application.pass_type))
+    stvps = (select(STVP.end_date.label('day'), literal(STVP_PASS_TYPE).label('pass_type'), func.count().label('count'))
+             .group_by(STVP.end_date))
+    return union_all(applications, stvps)
+
+def _company_summary_counts():
+    return (select(Application.company_uen, Application.pass_type, Application.status, func.count().label('count'))
+            .group_by(Application.company_uen, Application.pass_type, Application.status))
+
+def _company_expiry_counts():
+    passes = (select(Application.company_uen, literal(PASS_KIND).label('kind'), Application.doe.label('day'),
+                     func.count().label('count'))
+              .group_by(Application.company_uen, Application.doe))
+    stvps = (select(Application.company_uen, literal(STVP_KIND).label('kind'), STVP.end_date.label('day'),
+                    func.count().label('count'))
+             .join(Application, STVP.application_id == Application.id)
+             .group_by(Application.company_uen, STVP.end_date))
+    return union_all(passes, stvps)
+
+def _company_total_counts():
+    return select(Application.company_uen, func.count().label('passes')).group_by(Application.company_uen)
+
+# Rollup name -> (table, key columns, count column, fresh aggregate) for each of its tables
+ROLLUPS = {
+    'expiries': [(ExpiryRollup, ('day', 'pass_type'), 'count', _expiry_counts)],
+    'companies': [
+        (CompanySummary, ('company_uen', 'pass_type', 'status'), 'count', _company_summary_counts),
+        (CompanyExpiry, ('company_uen', 'kind', 'day'), 'count', _company_expiry_counts),
+        (CompanyTotal, ('company_uen',), 'passes', _company_total_counts),
+    ]
+}
+
+def rebuild(name, connection=None):
+    """Recompute the tables of one rollup in the caller's transaction.
+    :param connection: A Session or Connection; defaults to db.session.
+    :return: Dict mapping each table name to the number of rows written.
+    """
+    connection = connection or db.session
+    written = {}
+    for model, key_columns, count_column, counts in ROLLUPS[name]:
+        connection.execute(delete(model))
+        connection.execute(insert(model).from_select([*key_columns, count_column], select(counts().subquery())))
+        written[model.__tablename__] = connection.execute(select(func.count()).select_from(model)).scalar_one()
+    return written
+
+def check(name, connection=None):
+    """Compare the tables of one rollup with a fresh aggregate.
+    :return: List of {"table", "key", "expected", "actual"} for every row that differs.
+    """
+    connection = connection or db.session
+    mismatches = []
+    for model, key_columns, count_column, counts in ROLLUPS[name]:
+        expected = {tuple(row[:-1]): row[-1] for row in connection.execute(counts())}
+        actual = {tuple(row[:-1]): row[-1] for row in connection.execute(
+            select(*[getattr(model, column) for column in key_columns], getattr(model, count_column))
+            .where(getattr(model, count_column) != 0))}
+        for key in sorted(expected.keys() | actual.keys()):
+            if expected.get(key, 0) != actual.get(key, 0):
+                mismatches.append({
+                    "table": model.__tablename__,
+                    "key": {column: value.isoformat() if hasattr(value, 'isoformat') else value
+                            for column, value in zip(key_columns, key)},
+                    "expected": expected.get(key, 0),
+                    "actual": actual.get(key, 0)
+                })
+    return mismatches
+
+# Reads
+
+def expiries_between(start, end, group_by=None):
+    """Daily expiry counts for start..end inclusive, one entry per day (zero days included).
+    :param group_by: None for a total per day, or 'pass_type' to also split each day by pass type.
+    """
+    rows = db.session.execute(
+        select(ExpiryRollup.day, ExpiryRollup.pass_type, ExpiryRollup.count)
+        .where(ExpiryRollup.day.between(start, end), ExpiryRollup.count != 0)
+    ).all()
+    days = {}
+    for day, pass_type, count in rows:
+        entry = days.setdefault(day, {"total": 0, "by_pass_type": {}})
+        entry["total"] += count
+        entry["by_pass_type"][pass_type] = count
+
+    result = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        entry = days.get(day, {"total": 0, "by_pass_type": {}})
+        item = {"date": day.isoformat(), "total": entry["total"]}
+        if group_by == 'pass_type':
+            item["by_pass_type"] = dict(sorted(entry["by_pass_type"].items()))
+        result.append(item)
+    return result
+
+def company_summary(company_uen, today, expiring_within):
+    """Summary of one company from the company rollup, or None if it has no passes.
+    Reads one row per pass type and status, plus one per day on which a pass or open STVP ends.
+    """
+    total = db.session.scalar(select(CompanyTotal.passes).where(CompanyTotal.company_uen == company_uen))
+    if not total:
+        return None
+
+    by_pass_type, by_status = {}, Counter()
+    for pass_type, status, count in db.session.execute(
+            select(CompanySummary.pass_type, CompanySummary.status, CompanySummary.count)
+            .where(CompanySummary.company_uen == company_uen, CompanySummary.count != 0)
+            .order_by(CompanySummary.pass_type, CompanySummary.status)):
+        by_pass_type.setdefault(pass_type, {})[status] = count
+        by_status[status] += count
+
+    def ending(kind, start, end=None):
+        query = (select(func.coalesce(func.sum(CompanyExpiry.count), 0))
+                 .where(CompanyExpiry.company_uen == company_uen, CompanyExpiry.kind == kind, CompanyExpiry.day >= start))
+        if end is not None:
+            query = query.where(CompanyExpiry.day <= end)
+        return db.session.scalar(query)
+
+    expiring_to = today + timedelta(days=expiring_within)
+    return {
+        "company_uen": company_uen,
+        "passes": total,
+        "by_pass_type": by_pass_type,
+        "by_status": dict(sorted(by_status.items())),
+        "active_passes": ending(PASS_KIND, today),
+        "expiring_soon": {"from": today.isoformat(), "to": expiring_to.isoformat(),
+                          "count": ending(PASS_KIND, today, expiring_to)},
+        "open_stvps": ending(STVP_KIND, today)
+    }
+
+def top_companies(limit):
+    """Companies with the most passes, read in order from ix_company_totals_passes."""
+    rows = db.session.execute(
+        select(CompanyTotal.company_uen, CompanyTotal.passes)
+        .where(CompanyTotal.passes > 0)
+        .order_by(CompanyTotal.passes.desc(), CompanyTotal.company_uen)
+        .limit(limit)
+    )
+    return [{"company_uen": company_uen, "passes": passes} for company_uen, passes in rows]
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Maintain the rollup tables behind the summary endpoints.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    for rollup in ROLLUPS:
+        subcommands.add_parser(f'rebuild-{rollup}', help=f"Recompute the {rollup} rollup from applications and STVPs")
+        subcommands.add_parser(f'check-{rollup}', help=f"Report {rollup} rollup rows that differ from a fresh aggregate")
+    args = parser.parse_args()
+    action, rollup = args.command.split('-', 1)
+
+    with app.app_context():
+        if action == 'rebuild':
+            written = rebuild(rollup)
+            db.session.commit()
+            print(f"Rebuilt the {rollup} rollup: {json.dumps(written)}")
+        else:
+            mismatches = check(rollup)
+            print(json.dumps(mismatches, indent=2) if mismatches else f"The {rollup} rollup is consistent.")
+            if mismatches:
+                raise SystemExit(1)
@@ -1,69 +1,249 @@
 # Description: This file contains the API routes for the application.
 
-from flask import Blueprint, jsonify, request, current_app
-from models import Application, Amendment, STVP, db
-from utils import require_api_key
-from validation import validate_fin, validate_date
+from flask import Blueprint, jsonify, request, current_app, send_file
+from models import Application, Amendment, db
+from utils import require_api_key, encode_cursor, decode_cursor, etag_for, not_modified, accepts_gzip, gzip_response, streamed_response
+from validation import validate_fin, validate_fins, validate_date
 import logging
 from datetime import datetime, date, timedelta
-from sqlalchemy import desc, func
+from sqlalchemy import String, desc, func, select, tuple_, type_coerce
+from sqlalchemy.orm import selectinload
+from serializers import RawJSON, RowSerializer, encode_object, json_response
 from config import Config
-from sqlalchemy.orm import Session
 import time
-from extensions import cache  # Import the shared cache
+from extensions import search_cache  # Import the shared cache
+from jobs import JobQueueFull
+from write_queue import WriteQueueFull
+import services
+from bulk import issue_expired_stvps, update_expiries
+from rollups import company_summary, expiries_between, top_companies
+import export
+import imports
+import name_search
+import os
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 api = Blueprint('api', __name__)
 
-def generate_amendment_id(application_id):
-    count = Amendment.query.filter_by(application_id=application_id).count()
-    return f'P{(count + 1):02d}{application_id}'
-
 @api.route('/applications/search', methods=['GET'])
-@cache.cached(query_string=True)  # Use the cache object
 @require_api_key
 def search_applications():
-    print("Cache object in routes.py (inside route):", cache)
     fin = request.args.get('fin')
-    
+    if not fin and request.args.get('name'):
+        return _search_applications_by_name(request.args.get('name'))
+
     if not fin:
         logging.warning("FIN parameter is missing")
-        return jsonify({"error": "FIN parameter is required"}), 400
+        return jsonify({"error": "FIN or name parameter is required"}), 400
     
     if not validate_fin(fin):
         logging.warning(f"Invalid FIN format: {fin}")
         return jsonify({"error": "Invalid FIN format. Must be 9 characters starting with a letter"}), 400
 
+    # Consulted only after require_api_key, so cache hits are still authenticated and rate limited.
+    # Entries keep the ETag of the result they hold, so a hit can answer 304 without the database.
+    cached = search_cache.get(fin)
+    if isinstance(cached, dict):
+        logging.info(f"Cache hit for FIN: {fin}")
+        return not_modified(cached["etag"]) or _with_etag(jsonify(cached["applications"]), cached["etag"])
+
+    # Read before the query, so a result that a concurrent write invalidates is not cached
+    generation = search_cache.generation(fin)
     try:
+        # Revalidation only needs the versions of the matching applications, not the full rows
+        if request.if_none_match:
+            versions = db.session.execute(
+                select(Application.id, Application.version).where(Application.fin == fin)
+            ).all()
+            if versions:
+                response = not_modified(_search_etag(fin, versions))
+                if response:
+                    return response
+
         logging.info(f"Searching for applications with FIN: {fin}")
-        applications = Application.query.filter_by(fin=fin).all()
-        logging.info(f"Found {len(applications)} applications")
+        rows = db.session.execute(select(*SEARCH_ITEM.columns, Application.version).where(Application.fin == fin)).all()
+        logging.info(f"Found {len(rows)} applications")
 
-        if not applications:
+        if not rows:
             logging.info(f"No applications found for FIN: {fin}")
             return jsonify({"message": "No applications found for the given FIN"}), 404
 
-        result = [{
-            "id": app.id,
-            "name": app.name,
-            "pass_type": app.pass_type,
-            "doa": app.doa.isoformat(),
-            "doe": app.doe.isoformat(),
-            "status": app.status,
-            "company_uen": app.company_uen
-        } for app in applications]
+        etag = _search_etag(fin, [(row.id, row.version) for row in rows])
+        search_cache.set(fin, {"etag": etag, "applications": [SEARCH_ITEM.to_dict(row) for row in rows]}, generation)
 
-        logging.info(f"Returning {len(result)} applications")
-        return jsonify(result)
+        logging.info(f"Returning {len(rows)} applications")
+        return _with_etag(json_response(SEARCH_ITEM.encode_rows(rows)), etag)
 
     except Exception as e:
         logging.error(f"Unexpected error in search: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
+def _search_applications_by_name(name):
+    expression, error = name_search.match_expression(name)
+    if error:
+        return jsonify({"error": error}), 400
+    per_page = request.args.get('per_page', Config.ITEMS_PER_PAGE, type=int)
+    if per_page < 1:
+        per_page = Config.ITEMS_PER_PAGE
+    per_page = min(per_page, Config.MAX_PER_PAGE)
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    # Pages stop at NAME_SEARCH_MAX_RESULTS, so ranking and counting never go past the cap
+    cap = Config.NAME_SEARCH_MAX_RESULTS
+    offset = (page - 1) * per_page
+    try:
+        logging.info(f"Searching for applications with name: {name}")
+        rows = []
+        if offset < cap:
+            rows = name_search.search_names(expression, NAME_SEARCH_ITEM.columns, offset, min(per_page, cap - offset))
+        if not rows:
+            return jsonify({"message": "No applications found for the given name"}), 404
+        matches = name_search.count_matches(expression, cap)
+    except Exception as e:
+        logging.error(f"Unexpected error in name search: {str(e)}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
+
+    total = min(matches, cap)
+    return gzip_response(json_response(encode_object({
+        "applications": RawJSON(NAME_SEARCH_ITEM.encode_rows(rows)),
+        "total": total,
+        "total_capped": matches > cap,
+        "pages": -(-total // per_page),
+        "current_page": page
+    })))
+
+def _search_etag(fin, versions):
+    return etag_for('search', fin, *sorted(f"{application_id}:{version}" for application_id, version in versions))
+
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    return response
+
+# Read endpoints select these columns as Core rows and encode them without ORM objects
+SEARCH_ITEM = RowSerializer(
+    ("id", Application.id),
+    ("name", Application.name),
+    ("pass_type", Application.pass_type),
+    ("doa", Application.doa),
+    ("doe", Application.doe),
+    ("status", Application.status),
+    ("company_uen", Application.company_uen)
+)
+
+NAME_SEARCH_ITEM = RowSerializer(
+    ("id", Application.id),
+    ("fin", Application.fin),
+    ("name", Application.name),
+    ("pass_type", Application.pass_type),
+    ("doa", Application.doa),
+    ("doe", Application.doe),
+    ("status", Application.status),
+    ("company_uen", Application.company_uen)
+)
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+@api.route('/applications/search/batch', methods=['POST'])
+@require_api_key
+def search_applications_batch():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    fins = request.json.get('fins') if isinstance(request.json, dict) else None
+    if not isinstance(fins, list) or not fins:
+        return jsonify({"error": "Missing required field: fins (non-empty list)"}), 400
+    if len(fins) > Config.MAX_BATCH_FINS:
+        return jsonify({"error": f"Too many FINs: at most {Config.MAX_BATCH_FINS} per request"}), 400
+    if not all(isinstance(fin, str) for fin in fins):
+        return jsonify({"error": "Every FIN must be a string"}), 400
+
+    valid, invalid = validate_fins(fins)
+    if invalid:
+        logging.warning(f"Batch search rejected {len(invalid)} invalid FINs")
+
+    try:
+        found = {}
+        # One IN (...) query per chunk, each resolved through the fin index
+        for chunk in _chunks(valid, Config.SQL_IN_CHUNK_SIZE):
+            query = select(Application.fin, *SEARCH_ITEM.columns).where(Application.fin.in_(chunk)).order_by(Application.id)
+            for fin, *row in db.session.execute(query):
+                found.setdefault(fin, []).append(SEARCH_ITEM.to_dict(row))
+    except Exception as e:
+        logging.error(f"Unexpected error in batch search: {str(e)}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
+
+    results = {}
+    for fin in fins:
+        if fin in results:
+            continue
+        if fin in invalid:
+            results[fin] = {"status": "invalid", "error": invalid[fin]}
+        elif fin in found:
+            results[fin] = {"status": "found", "applications": found[fin]}
+        else:
+            results[fin] = {"status": "not_found"}
+
+    logging.info(f"Batch search: {len(found)} found, {len(valid) - len(found)} not found, {len(invalid)} invalid")
+    return jsonify({
+        "results": results,
+        "found": len(found),
+        "not_found": len(valid) - len(found),
+        "invalid": len(invalid)
+    })
+
+def _apply_write(operation, failure_message, *args):
+    """Run a services.py operation and commit it, through the group-commit writer when enabled."""
+    write_queue = current_app.extensions.get('write_queue')
+    if write_queue is not None:
+        return _apply_queued_write(write_queue, operation, failure_message, *args)
+    try:
+        body, status, fin = operation(*args)
+        if status < 400:
+            db.session.commit()
+        else:
+            db.session.rollback()   # Release the write lock the operation took
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"{failure_message}: {str(e)}", exc_info=True)
+        return jsonify({"error": failure_message}), 500
+
+    if fin:
+        search_cache.delete(fin)
+    return jsonify(body), status
+
+def _apply_queued_write(write_queue, operation, failure_message, *args):
+    # The writer thread invalidates the search cache itself, so a write that commits after its
+    # caller stopped waiting still invalidates it
+    try:
+        future = write_queue.submit(operation, *args)
+    except WriteQueueFull:
+        logging.warning("Write queue full, rejecting write")
+        response = jsonify({"error": "Too many pending writes, retry later"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    try:
+        body, status, _ = future.result(timeout=Config.WRITE_QUEUE_TIMEOUT)
+    except FutureTimeoutError:
+        if future.cancel():
+            logging.warning("Queued write timed out before it started; cancelled")
+            response = jsonify({"error": "Write timed out before it was applied, retry later"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        # Already being applied: it may still commit, so it must not be reported as failed
+        logging.warning("Queued write timed out while being applied")
+        return jsonify({"message": "Write accepted and still being applied"}), 202
+    except Exception as e:
+        logging.error(f"{failure_message}: {str(e)}", exc_info=True)
+        return jsonify({"error": failure_message}), 500
+    return jsonify(body), status
+
 @api.route('/applications/<string:application_id>/update-expiry', methods=['PUT'])
 @require_api_key
 def update_expiry(application_id):
-    session = Session(db.engine)
-    application = session.get(Application, application_id)
+    application = db.session.get(Application, application_id)
     if not application:
         return jsonify({"error": "Application not found"}), 404
     # Check for JSON content
@@ -83,172 +263,577 @@ def update_expiry(application_id):
     except ValueError:
         return jsonify({"error": "Invalid date value"}), 400
 
-    try:
-        session = Session(db.engine)
-        application = session.get(Application, application_id)
-        if not application:
-            return jsonify({"error": "Application not found"}), 404
-
-        if application.doe < datetime.now().date():
-            return jsonify({"error": "Cannot update expired application"}), 400
-
-        old_doe = application.doe
-        application.doe = new_doe
-
-        amendment_id = generate_amendment_id(application_id)
-        amendment = Amendment(
-            amendment_id=amendment_id,
-            application_id=application_id,
-            original_value=old_doe.isoformat(),
-            amended_value=new_doe.isoformat()
-        )
-
-        db.session.add(amendment)
-        db.session.commit()
-
-        return jsonify({
-            "message": "Expiry date updated successfully",
-            "amendment_id": amendment_id,
-            "new_expiry": new_doe.isoformat()
-        }), 200
+    return _apply_write(services.update_expiry, "Failed to update expiry date", application_id, new_doe)
 
-    except Exception as e:
-        db.session.rollback()
-        logging.error(f"Update expiry failed: {str(e)}", exc_info=True)
-        return jsonify({"error": "Failed to update expiry date"}), 500
-
-@api.route('/applications/<string:application_id>/create-stvp', methods=['POST'])
+@api.route('/applications/update-expiry/batch', methods=['PUT'])
 @require_api_key
-def create_stvp(application_id):
-    try:
-        # Start a transaction
-        application = Application.query.get(application_id)
-        if not application:
-            return jsonify({"error": "Application not found"}), 404
-
-        current_date = date.today()
-        if application.doe >= current_date:
-            return jsonify({"error": "Cannot create STVP for non-expired pass"}), 400
-
-        existing_stvp = STVP.query.filter_by(application_id=application_id).order_by(STVP.end_date.desc()).first()
-        if existing_stvp:
-            # Update existing STVP
-            old_end_date = existing_stvp.end_date
-            new_end_date = old_end_date + timedelta(days=30)
-            existing_stvp.end_date = new_end_date
-
-            # Log the amendment
-            amendment_id = generate_amendment_id(application_id)
-            amendment = Amendment(
-                amendment_id=amendment_id,
-                application_id=application_id,
-                original_value=old_end_date.isoformat(),
-                amended_value=new_end_date.isoformat()
-            )
-            db.session.add(amendment)
-
-            # Commit the transaction
-            db.session.commit()
+def update_expiry_batch():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
 
-            return jsonify({
-                "message": "Existing STVP extended",
-                "stvp_id": existing_stvp.id,
-                "new_end_date": new_end_date.isoformat(),
-                "amendment_id": amendment_id
-            }), 200
-        else:
-            # Create new STVP
-            start_date = max(application.doe, current_date)
-            end_date = start_date + timedelta(days=30)
-
-            # Generate STVP ID based on application ID
-            stvp_id = f"STVP{application_id[1:]}"  # Assuming application_id is in the format 'A0001'
-
-            new_stvp = STVP(
-                id=stvp_id,
-                application_id=application_id,
-                start_date=start_date,
-                end_date=end_date
-            )
-            db.session.add(new_stvp)
-
-            # Commit the transaction
-            db.session.commit()
+    # A bare list, or {"updates": [...]} like the batch search's {"fins": [...]}
+    updates = request.json.get('updates') if isinstance(request.json, dict) else request.json
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"error": "Missing required field: updates (non-empty list)"}), 400
+    if len(updates) > Config.MAX_BATCH_UPDATES:
+        return jsonify({"error": f"Too many updates: at most {Config.MAX_BATCH_UPDATES} per request"}), 400
 
-            return jsonify({
-                "message": "New STVP created",
-                "stvp_id": stvp_id,
-                "start_date": start_date.isoformat(),
-                "end_date": end_date.isoformat()
-            }), 201
+    # Each chunk commits on its own and failures are reported per item, so the request itself succeeds
+    return jsonify(update_expiries(updates)), 200
 
-    except Exception as e:
-        # Rollback the transaction in case of an error
-        db.session.rollback()
-        logging.error(f"Create STVP failed: {str(e)}", exc_info=True)
-        return jsonify({"error": "Failed to create or extend STVP"}), 500
+@api.route('/applications/<string:application_id>/create-stvp', methods=['POST'])
+@require_api_key
+def create_stvp(application_id):
+    return _apply_write(services.create_stvp, "Failed to create or extend STVP", application_id)
 
 @api.route('/applications', methods=['GET'])
 @require_api_key
 def list_applications():
-    page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', Config.ITEMS_PER_PAGE, type=int)
+    if per_page < 1:
+        per_page = Config.ITEMS_PER_PAGE
+    per_page = min(per_page, Config.MAX_PER_PAGE)
+
+    conditions, error = _list_filters(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    sort = request.args.get('sort', 'id')
+    if sort.lstrip('-') not in LIST_SORTS:
+        return jsonify({"error": f"Unsupported sort: {sort}. Use one of {', '.join(LIST_SORTS)}, optionally prefixed with -"}), 400
+    descending = sort.startswith('-')
+    sort_column = LIST_SORTS[sort.lstrip('-')]
+    # id breaks ties, so the order (and every keyset position) is total
+    order_by = [column.desc() if descending else column for column in dict.fromkeys([sort_column, Application.id])]
+
+    # Cursor mode: one indexed range seek per page, whatever the depth
+    if 'cursor' in request.args:
+        return _list_applications_by_cursor(request.args.get('cursor'), per_page, conditions, sort_column, descending, order_by)
+
+    # Count first, so a page past the end is answered without an OFFSET that could overflow
+    page = max(request.args.get('page', 1, type=int), 1)
+    total = db.session.scalar(select(func.count()).select_from(Application).where(*conditions))
+    pages = -(-total // per_page)
+    if page > pages:
+        return jsonify({"message": "No applications found"}), 404
 
-    applications = Application.query.paginate(page=page, per_page=per_page, error_out=False)
-
-    if not applications.items:
+    rows = db.session.execute(
+        select(*LIST_ITEM.columns).where(*conditions).order_by(*order_by)
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all()
+    return gzip_response(json_response(encode_object({
+        "applications": RawJSON(LIST_ITEM.encode_rows(rows)),
+        "total": total,
+        "pages": pages,
+        "current_page": page
+    })))
+
+LIST_ITEM = RowSerializer(
+    ("id", Application.id),
+    ("name", Application.name),
+    ("pass_type", Application.pass_type),
+    ("doa", Application.doa),
+    ("doe", Application.doe),
+    ("status", Application.status)
+)
+
+# Every filter can be served by an index (see the composite indexes on Application)
+LIST_EQUALITY_FILTERS = {
+    "status": Application.status,
+    "pass_type": Application.pass_type,
+    "company_uen": Application.company_uen
+}
+LIST_RANGE_FILTERS = {
+    "doe": Application.doe,
+    "doa": Application.doa
+}
+LIST_SORTS = {
+    "id": Application.id,
+    "doe": Application.doe,
+    "doa": Application.doa
+}
+
+def _list_filters(args):
+    """WHERE conditions for the list filters in args. Returns (conditions, error)."""
+    conditions = []
+    for name, column in LIST_EQUALITY_FILTERS.items():
+        value = args.get(name)
+        if value is not None:
+            conditions.append(column == value)
+    for name, column in LIST_RANGE_FILTERS.items():
+        for suffix, compare in (('from', column.__ge__), ('to', column.__le__)):
+            value = args.get(f"{name}_{suffix}")
+            if value is None:
+                continue
+            if not validate_date(value):
+                return None, f"Invalid {name}_{suffix}. Use YYYY-MM-DD"
+            conditions.append(compare(datetime.strptime(value, '%Y-%m-%d').date()))
+    return conditions, None
+
+def _list_applications_by_cursor(cursor, per_page, conditions, sort_column, descending, order_by):
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+
+    query = select(*LIST_ITEM.columns).where(*conditions).order_by(*order_by)
+    if cursor:
+        # The cursor holds the sort key of the last row: (id) when sorting by id, else (value, id)
+        try:
+            if sort_column is Application.id:
+                (last,) = decode_cursor(cursor)
+                if not isinstance(last, str):
+                    raise ValueError(cursor)
+                key = Application.id
+            else:
+                last_value, last_id = decode_cursor(cursor)
+                if not isinstance(last_value, str) or not isinstance(last_id, str):
+                    raise ValueError(cursor)
+                key, last = tuple_(sort_column, Application.id), (date.fromisoformat(last_value), last_id)
+        except (ValueError, TypeError):
+            logging.warning(f"Invalid pagination cursor: {cursor}")
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.where(key < last if descending else key > last)
+
+    # Fetch one extra row to learn whether another page exists without a COUNT
+    rows = db.session.execute(query.limit(per_page + 1)).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if not rows and not cursor:
         return jsonify({"message": "No applications found"}), 404
 
-    result = [{
-        "id": app.id,
-        "name": app.name,
-        "pass_type": app.pass_type,
-        "doa": app.doa.isoformat(),
-        "doe": app.doe.isoformat(),
-        "status": app.status
-    } for app in applications.items]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.id) if sort_column is Application.id else \
+            encode_cursor(getattr(last, sort_column.key).isoformat(), last.id)
+    response = {
+        "applications": RawJSON(LIST_ITEM.encode_rows(rows)),
+        "next_cursor": next_cursor
+    }
+    if include_total:
+        response["total"] = db.session.scalar(select(func.count()).select_from(Application).where(*conditions))
+    return gzip_response(json_response(encode_object(response)))
+
+APPLICATION_DETAIL_FIELDS = ('id', 'fin', 'name', 'pass_type', 'doa', 'doe', 'status', 'company_uen', 'amendments', 'stvps')
+
+@api.route('/applications/<string:application_id>', methods=['GET'])
+@require_api_key
+def get_application(application_id):
+    fields = request.args.get('fields')
+    fields = [field for field in fields.split(',') if field] if fields is not None else list(APPLICATION_DETAIL_FIELDS)
+    if not fields:
+        return jsonify({"error": "fields must name at least one field"}), 400
+    unknown = set(fields) - set(APPLICATION_DETAIL_FIELDS)
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+    if request.if_none_match:
+        version = db.session.scalar(select(Application.version).where(Application.id == application_id))
+        if version is not None:
+            response = not_modified(_application_etag(application_id, version, fields))
+            if response:
+                return response
+
+    # Related rows come from one batched SELECT per relationship, and only when projected
+    query = select(Application).where(Application.id == application_id)
+    if 'amendments' in fields:
+        query = query.options(selectinload(Application.amendments))
+    if 'stvps' in fields:
+        query = query.options(selectinload(Application.stvps))
+    application = db.session.scalars(query).first()
+    if not application:
+        return jsonify({"error": "Application not found"}), 404
 
-    return jsonify({
-        "applications": result,
-        "total": applications.total,
-        "pages": applications.pages,
-        "current_page": page
-    })
+    result = {}
+    for field in fields:
+        if field == 'amendments':
+            result[field] = [{
+                "amendment_id": amendment.amendment_id,
+                "amendment_date": amendment.amendment_date.isoformat(),
+                "original_value": amendment.original_value,
+                "amended_value": amendment.amended_value
+            } for amendment in application.amendments]
+        elif field == 'stvps':
+            result[field] = [{
+                "id": stvp.id,
+                "start_date": stvp.start_date.isoformat(),
+                "end_date": stvp.end_date.isoformat()
+            } for stvp in application.stvps]
+        else:
+            value = getattr(application, field)
+            result[field] = value.isoformat() if isinstance(value, date) else value
+    return _with_etag(jsonify(result), _application_etag(application_id, application.version, fields))
+
+def _application_etag(application_id, version, fields):
+    # The projection is part of the representation, so it is part of the ETag
+    return etag_for('application', application_id, version, ','.join(fields))
 
 @api.route('/applications/<string:application_id>/amendments', methods=['GET'])
 @require_api_key
 def get_amendment_history(application_id):
-    amendments = Amendment.query.filter_by(application_id=application_id).order_by(Amendment.amendment_date).all()
-
-    if not amendments:
+    conditions, error = _amendment_date_filters(request.args, 'from')
+    if error:
+        return jsonify({"error": error}), 400
+
+    if request.if_none_match:
+        version = db.session.scalar(select(Application.version).where(Application.id == application_id))
+        if version is not None:
+            response = not_modified(_amendments_etag(application_id, version))
+            if response:
+                return response
+
+    # Every new amendment bumps the application's version, so the ETag comes from the same statement
+    query = (select(*AMENDMENT_ITEM.columns, Application.version, AMENDMENT_DATE_KEY.label('date_key'))
+             .join(Application, Application.id == Amendment.application_id)
+             .where(Amendment.application_id == application_id, *conditions))
+    rows, next_cursor, error = _amendment_page(query, request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    if not rows and not request.args.get('after'):
         return jsonify({"message": "No amendments found for this application"}), 404
+    response = json_response(encode_object({
+        "amendments": RawJSON(AMENDMENT_ITEM.encode_rows(rows)),
+        "next_cursor": next_cursor
+    }))
+    return _with_etag(response, _amendments_etag(application_id, rows[0].version)) if rows else response
+
+@api.route('/amendments', methods=['GET'])
+@require_api_key
+def list_amendments():
+    conditions, error = _amendment_date_filters(request.args, 'since')
+    if error:
+        return jsonify({"error": error}), 400
+    rows, next_cursor, error = _amendment_page(
+        select(*AMENDMENT_LOG_ITEM.columns, AMENDMENT_DATE_KEY.label('date_key')).where(*conditions), request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return gzip_response(json_response(encode_object({
+        "amendments": RawJSON(AMENDMENT_LOG_ITEM.encode_rows(rows)),
+        "next_cursor": next_cursor
+    })))
+
+AMENDMENT_ITEM = RowSerializer(
+    ("amendment_id", Amendment.amendment_id),
+    ("amendment_date", Amendment.amendment_date),
+    ("original_value", Amendment.original_value),
+    ("amended_value", Amendment.amended_value)
+)
+
+AMENDMENT_LOG_ITEM = RowSerializer(
+    ("amendment_id", Amendment.amendment_id),
+    ("application_id", Amendment.application_id),
+    ("amendment_date", Amendment.amendment_date),
+    ("original_value", Amendment.original_value),
+    ("amended_value", Amendment.amended_value)
+)
+
+# amendment_date as the text SQLite stores ('YYYY-MM-DD HH:MM:SS[.ffffff]'). Range filters and
+# cursors compare this text directly, so they seek the amendment indexes in the order they are stored
+AMENDMENT_DATE_KEY = type_coerce(Amendment.amendment_date, String)
+AMENDMENT_HISTORY_PARAMS = ('from', 'to', 'limit', 'after')
+
+def _amendments_etag(application_id, version):
+    # The same version serves different pages and ranges, so the ETag covers the query as well
+    return etag_for('amendments', application_id, version, *[request.args.get(name) for name in AMENDMENT_HISTORY_PARAMS])
+
+def _amendment_date_filters(args, from_name):
+    """WHERE conditions for the from_name/to day range (both inclusive). Returns (conditions, error)."""
+    bounds = {}
+    for name in (from_name, 'to'):
+        value = args.get(name)
+        if value is None:
+            continue
+        if not validate_date(value):
+            return None, f"Invalid {name}. Use YYYY-MM-DD"
+        bounds[name] = datetime.strptime(value, '%Y-%m-%d').date()
+    conditions = []
+    if from_name in bounds:
+        conditions.append(AMENDMENT_DATE_KEY >= bounds[from_name].isoformat())
+    if 'to' in bounds:
+        conditions.append(AMENDMENT_DATE_KEY < (bounds['to'] + timedelta(days=1)).isoformat())
+    return conditions, None
+
+def _amendment_page(query, args):
+    """One page of query in (amendment_date, amendment_id) order, after the cursor in args['after'].
+    The query must select AMENDMENT_DATE_KEY labelled date_key. Returns (rows, next_cursor, error).
+    """
+    limit = args.get('limit', Config.ITEMS_PER_PAGE, type=int)
+    if limit < 1:
+        limit = Config.ITEMS_PER_PAGE
+    limit = min(limit, Config.MAX_PER_PAGE)
+
+    after = args.get('after')
+    if after:
+        try:
+            last_date, last_id = decode_cursor(after)
+            if not isinstance(last_date, str) or not isinstance(last_id, str):
+                raise ValueError(after)
+        except (ValueError, TypeError):
+            logging.warning(f"Invalid amendment cursor: {after}")
+            return None, None, "Invalid cursor"
+        query = query.where(tuple_(AMENDMENT_DATE_KEY, Amendment.amendment_id) > (last_date, last_id))
+
+    # Fetch one extra row to learn whether another page exists without a COUNT
+    rows = db.session.execute(query.order_by(Amendment.amendment_date, Amendment.amendment_id).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date_key, rows[-1].amendment_id)
+    return rows, next_cursor, None
+
+@api.route('/expiries', methods=['GET'])
+@require_api_key
+def list_expiries():
+    """Passes expiring on each day of [from, to], read from the expiry rollup (O(days), not O(applications))."""
+    bounds = {}
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if value is not None and not validate_date(value):
+            return jsonify({"error": f"Invalid {name}. Use YYYY-MM-DD"}), 400
+        bounds[name] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    start = bounds['from'] or date.today()
+    end = bounds['to'] or start + timedelta(days=Config.EXPIRY_DEFAULT_DAYS - 1)
+    if end < start:
+        return jsonify({"error": "to must not be before from"}), 400
+    if (end - start).days + 1 > Config.EXPIRY_MAX_DAYS:
+        return jsonify({"error": f"Date range is limited to {Config.EXPIRY_MAX_DAYS} days"}), 400
+
+    group_by = request.args.get('group_by')
+    if group_by not in (None, 'pass_type'):
+        return jsonify({"error": f"Unsupported group_by: {group_by}. Use pass_type"}), 400
+
+    try:
+        days = expiries_between(start, end, group_by)
+    except Exception as e:
+        logging.error(f"Error reading expiries: {str(e)}")
+        return jsonify({"error": "An error occurred while reading expiries"}), 500
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "group_by": group_by,
+        "total": sum(day["total"] for day in days),
+        "days": days
+    }), 200
+
+@api.route('/companies', methods=['GET'])
+@require_api_key
+def list_top_companies():
+    """Companies with the most passes, read in order from the company_totals index."""
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(limit, Config.MAX_PER_PAGE)
+    try:
+        return jsonify(top_companies(limit)), 200
+    except Exception as e:
+        logging.error(f"Error listing companies: {str(e)}")
+        return jsonify({"error": "An error occurred while listing companies"}), 500
 
-    result = [{
-        "amendment_id": amendment.amendment_id,
-        "amendment_date": amendment.amendment_date.isoformat(),
-        "original_value": amendment.original_value,
-        "amended_value": amendment.amended_value
-    } for amendment in amendments]
+@api.route('/companies/<string:company_uen>/summary', methods=['GET'])
+@require_api_key
+def get_company_summary(company_uen):
+    """Per-company breakdown read from the company rollup, so its cost does not grow with the table."""
+    expiring_within = request.args.get('expiring_within', Config.COMPANY_EXPIRING_SOON_DAYS, type=int)
+    if not 0 <= expiring_within < Config.EXPIRY_MAX_DAYS:
+        return jsonify({"error": f"expiring_within must be between 0 and {Config.EXPIRY_MAX_DAYS - 1} days"}), 400
+    try:
+        summary = company_summary(company_uen, date.today(), expiring_within)
+    except Exception as e:
+        logging.error(f"Error reading summary of company {company_uen}: {str(e)}")
+        return jsonify({"error": "An error occurred while reading the company summary"}), 500
+    if summary is None:
+        return jsonify({"error": "Company not found"}), 404
+    return jsonify(summary), 200
 
-    return jsonify(result)
+@api.route('/cache/stats', methods=['GET'])
+@require_api_key
+def cache_stats():
+    return jsonify(search_cache.stats())
+
+def _submit_job(name, fn, *args, **kwargs):
+    try:
+        job = current_app.jobs.submit(name, fn, *args, **kwargs)
+    except JobQueueFull:
+        logging.warning(f"Job queue full, rejected {name}")
+        response = jsonify({"error": "Job queue is full, retry later"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    response = jsonify({"message": "Job queued", "job_id": job.id, "status": job.status})
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response, 202
+
+@api.route('/jobs', methods=['GET'])
+@require_api_key
+def job_stats():
+    return jsonify(current_app.jobs.stats())
+
+@api.route('/jobs/<string:job_id>', methods=['GET'])
+@require_api_key
+def get_job(job_id):
+    job = current_app.jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@api.route('/jobs/<string:job_id>', methods=['DELETE'])
+@require_api_key
+def cancel_job(job_id):
+    job = current_app.jobs.cancel(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.finished and not job.cancel_requested:
+        return jsonify({"error": f"Job already {job.status}"}), 409
+    return jsonify(job.to_dict()), 202
+
+def _issue_expired_stvps_job(job, as_of):
+    return issue_expired_stvps(as_of=as_of, progress=lambda report: job.update_progress(dict(report)))
+
+@api.route('/stvps/issue-expired', methods=['POST'])
+@require_api_key
+def issue_expired_stvps_bulk():
+    as_of = request.args.get('as_of')
+    if as_of is not None:
+        if not validate_date(as_of):
+            return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+        as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+    return _submit_job('issue-expired-stvps', _issue_expired_stvps_job, as_of)
+
+def _export_params(args):
+    """Parse the shared export query parameters. Returns (params, error)."""
+    format = args.get('format', 'ndjson')
+    if format not in export.FORMATS:
+        return None, f"Unsupported format: {format}. Use one of {', '.join(export.FORMATS)}"
+    include = [name for name in args.get('include', '').split(',') if name]
+    unknown = set(include) - set(export.INCLUDES)
+    if unknown:
+        return None, f"Unsupported include: {', '.join(sorted(unknown))}. Use amendments and/or stvps"
+    params = {"format": format, "include": include, "status": args.get('status')}
+    for name in ('doe_from', 'doe_to'):
+        value = args.get(name)
+        if value is not None and not validate_date(value):
+            return None, f"Invalid {name}. Use YYYY-MM-DD"
+        params[name] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    return params, None
+
+def _export_filters(params):
+    return {key: params[key] for key in ('doe_from', 'doe_to', 'status', 'include')}
+
+@api.route('/export', methods=['GET'])
+@require_api_key
+def export_applications():
+    params, error = _export_params(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    records = export.iter_applications(**_export_filters(params))
+    body = export.render(params['format'], records, params['include'])
+    return streamed_response(body, export.FORMATS[params['format']], {
+        'Content-Disposition': f"attachment; filename=applications.{params['format']}"
+    })
+
+@api.route('/export', methods=['POST'])
+@require_api_key
+def queue_export():
+    params, error = _export_params(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return _submit_job('export', _export_job, params)
+
+def _export_path(job_id, format):
+    return os.path.join(Config.EXPORT_DIR, f"{job_id}.{format}")
+
+def _export_job(job, params):
+    progress = {"rows": 0}
+    def report(rows):
+        progress["rows"] = rows
+        job.update_progress(dict(progress))
+
+    records = export.iter_applications(**_export_filters(params), progress=report)
+    os.makedirs(Config.EXPORT_DIR, exist_ok=True)
+    job.add_file(_export_path(job.id, params['format']))
+    with open(_export_path(job.id, params['format']), 'w', encoding='utf-8', newline='') as f:
+        f.writelines(export.render(params['format'], records, params['include']))
+    return {"rows": progress["rows"], "format": params['format'], "download": f"/api/export/{job.id}/download"}
+
+@api.route('/export/<string:job_id>/download', methods=['GET'])
+@require_api_key
+def download_export(job_id):
+    job = current_app.jobs.get(job_id)
+    if not job or job.name != 'export':
+        return jsonify({"error": "Export not found"}), 404
+    if job.status != 'succeeded':
+        return jsonify({"error": f"Export is {job.status}"}), 409
+    format = job.result['format']
+    if accepts_gzip():
+        return streamed_response(_read_chunks(_export_path(job.id, format)), export.FORMATS[format], {
+            'Content-Disposition': f"attachment; filename=applications.{format}"
+        })
+    return send_file(_export_path(job.id, format), mimetype=export.FORMATS[format],
+                     as_attachment=True, download_name=f"applications.{format}")
+
+def _read_chunks(path, size=65536):
+    with open(path, 'rb') as f:
+        while chunk := f.read(size):
+            yield chunk
+
+@api.route('/import', methods=['POST'])
+@require_api_key
+def queue_import():
+    format = request.args.get('format', 'ndjson')
+    if format not in export.FORMATS:
+        return jsonify({"error": f"Unsupported format: {format}. Use one of {', '.join(export.FORMATS)}"}), 400
+
+    # Spool the upload to disk in blocks, so the request never holds the whole file in memory
+    os.makedirs(Config.IMPORT_DIR, exist_ok=True)
+    upload_path = os.path.join(Config.IMPORT_DIR, f"{uuid.uuid4().hex}.upload.{format}")
+    with open(upload_path, 'wb') as f:
+        while block := request.stream.read(65536):
+            f.write(block)
+    if not os.path.getsize(upload_path):
+        os.remove(upload_path)
+        return jsonify({"error": "Request body is empty"}), 400
+
+    response, status = _submit_job('import', _import_job, upload_path, format)
+    if status != 202:
+        os.remove(upload_path)
+    return response, status
+
+def _import_rejected_path(job_id):
+    return os.path.join(Config.IMPORT_DIR, f"{job_id}.rejected.ndjson")
+
+def _import_job(job, upload_path, format):
+    job.add_file(_import_rejected_path(job.id))
+    try:
+        with open(upload_path, encoding='utf-8-sig', newline='') as f:
+            report = imports.import_applications(f, format, rejected_path=_import_rejected_path(job.id),
+                                                 progress=lambda report: job.update_progress(dict(report)))
+    finally:
+        os.remove(upload_path)
+    if report["rejected"]:
+        report["rejected_download"] = f"/api/import/{job.id}/rejected"
+    return report
+
+@api.route('/import/<string:job_id>/rejected', methods=['GET'])
+@require_api_key
+def download_import_rejected(job_id):
+    job = current_app.jobs.get(job_id)
+    if not job or job.name != 'import':
+        return jsonify({"error": "Import not found"}), 404
+    if job.status != 'succeeded':
+        return jsonify({"error": f"Import is {job.status}"}), 409
+    if not job.result["rejected"]:
+        return jsonify({"error": "Import rejected no rows"}), 404
+    return send_file(_import_rejected_path(job.id), mimetype=export.FORMATS['ndjson'],
+                     as_attachment=True, download_name="rejected.ndjson")
+
+def _sleep_job(job, seconds):
+    start = datetime.now()
+    logging.info("Started background task")
+    for elapsed in range(seconds):
+        job.update_progress({"elapsed_seconds": elapsed, "total_seconds": seconds})
+        time.sleep(1)  # Simulate a long-running task
+    logging.info(f"Task completed in {(datetime.now() - start).total_seconds()}s")
+    return {"slept_seconds": seconds}
 
-from flask import copy_current_request_context
 # New endpoint for concurrency testing
 @api.route('/test-concurrency', methods=['GET'])
 def test_concurrency():
-    @copy_current_request_context
-    def background_task():
-        start = datetime.now()
-        logging.info("Started background task")
-        try:
-            time.sleep(5)  # Simulate a long-running task
-            logging.info(f"Task completed in {(datetime.now() - start).total_seconds()}s")
-        except Exception as e:
-            logging.error(f"Background task failed: {str(e)}")
-
-    # Submit the task to the executor
-    future = current_app.executor.submit(background_task)
-    return jsonify({
-        "message": "Background task started",
-        "task_id": str(future)
-    }), 202
+    return _submit_job('test-concurrency', _sleep_job, 5)
@@ -0,0 +1,127 @@
+# Description: This file contains the business rules behind the write endpoints.
+# Each operation runs inside the caller's transaction and never commits, so the same rules serve
+# the request handlers (one commit per call) and the group-commit writer in write_queue.py (one
+# commit per batch). Operations return (body, status, fin): the JSON body, the HTTP status and
+# the FIN whose cached search result must be invalidated once the transaction commits.
+# An operation that returns a 4xx status has not changed anything. Every operation takes the
+# write lock before it reads, so the values it changes cannot move under it.
+
+from datetime import datetime, date, timedelta
+from sqlalchemy import update
+from config import Config
+from models import Application, Amendment, STVP, db
+from rollups import move_expiry, move_stvp_expiry
+
+def lock_for_write():
+    """Take SQLite's write lock (BEGIN IMMEDIATE) before reading the values a write will change.
+    pysqlite only emits BEGIN at the first INSERT/UPDATE/DELETE, so without this two concurrent
+    writers could both read the same old doe or end_date, and each write an amendment and rollup
+    change computed from it. Does nothing if the transaction already holds the lock.
+    """
+    connection = db.session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def generate_amendment_id(application_id):
+    # Bump the per-application counter in the caller's transaction. The UPDATE takes the row's
+    # write lock, so concurrent writers are serialized instead of both reading the same COUNT.
+    seq = db.session.execute(
+        update(Application)
+        .where(Application.id == application_id)
+        .values(amendment_seq=Application.amendment_seq + 1)
+        .returning(Application.amendment_seq)
+    ).scalar_one()
+    return f'P{seq:02d}{application_id}'
+
+def bump_version(application):
+    # Every change to an application, its amendments or its STVPs must invalidate its ETags
+    application.version = Application.version + 1
+
+def update_expiry(application_id, new_doe):
+    lock_for_write()
+    application = db.session.get(Application, application_id, populate_existing=True)
+    if not application:
+        return {"error": "Application not found"}, 404, None
+
+    if application.doe < datetime.now().date():
+        return {"error": "Cannot update expired application"}, 400, None
+
+    old_doe = application.doe
+    application.doe = new_doe
+    bump_version(application)
+    move_expiry(application, old_doe, new_doe)
+
+    amendment_id = generate_amendment_id(application_id)
+    amendment = Amendment(
+        amendment_id=amendment_id,
+        application_id=application_id,
+        original_value=old_doe.isoformat(),
+        amended_value=new_doe.isoformat()
+    )
+    db.session.add(amendment)
+
+    return {
+        "message": "Expiry date updated successfully",
+        "amendment_id": amendment_id,
+        "new_expiry": new_doe.isoformat()
+    }, 200, application.fin
+
+def create_stvp(application_id):
+    lock_for_write()
+    application = db.session.get(Application, application_id, populate_existing=True)
+    if not application:
+        return {"error": "Application not found"}, 404, None
+
+    current_date = date.today()
+    if application.doe >= current_date:
+        return {"error": "Cannot create STVP for non-expired pass"}, 400, None
+
+    existing_stvp = (STVP.query.filter_by(application_id=application_id).order_by(STVP.end_date.desc())
+                     .populate_existing().first())
+    bump_version(application)
+    if existing_stvp:
+        # Update existing STVP
+        old_end_date = existing_stvp.end_date
+        new_end_date = old_end_date + timedelta(days=Config.STVP_DURATION_DAYS)
+        existing_stvp.end_date = new_end_date
+        move_stvp_expiry(application, old_end_date, new_end_date)
+
+        # Log the amendment
+        amendment_id = generate_amendment_id(application_id)
+        amendment = Amendment(
+            amendment_id=amendment_id,
+            application_id=application_id,
+            original_value=old_end_date.isoformat(),
+            amended_value=new_end_date.isoformat()
+        )
+        db.session.add(amendment)
+
+        return {
+            "message": "Existing STVP extended",
+            "stvp_id": existing_stvp.id,
+            "new_end_date": new_end_date.isoformat(),
+            "amendment_id": amendment_id
+        }, 200, application.fin
+
+    # Create new STVP
+    start_date = max(application.doe, current_date)
+    end_date = start_date + timedelta(days=Config.STVP_DURATION_DAYS)
+
+    # Generate STVP ID based on application ID
+    stvp_id = f"STVP{application_id[1:]}"  # Assuming application_id is in the format 'A0001'
+
+    new_stvp = STVP(
+        id=stvp_id,
+        application_id=application_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+    db.session.add(new_stvp)
+    move_stvp_expiry(application, None, end_date)
+
+    return {
+        "message": "New STVP created",
+        "stvp_id": stvp_id,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat()
+    }, 201, application.fin
@@ -0,0 +1,233 @@
+# shared_cache.py
+# A FIN-keyed, size-bounded LRU cache for search results, shared by every worker process
+# through a local SQLite file. Writes that touch an application call delete(fin) so clients
+# never see a stale result, and hit/miss/eviction counters live in the same file so stats()
+# reports totals across all workers.
+#
+# A hit is a single read: its LRU touch and the hit/miss counters are kept in memory and written
+# in one batch by the next set(), by stats(), or once SEARCH_CACHE_FLUSH_INTERVAL has passed, so
+# hits never take the write lock. delete() also bumps the generation of each FIN's stripe (one of
+# GENERATION_STRIPES fixed counters, so the file does not grow with the FINs ever written); a set()
+# given the generation read before its query is dropped if a write invalidated the stripe since.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from flask import current_app
+from config import Config
+
+GENERATION_STRIPES = 4096
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access ON cache_entries (last_access)',
+    '''CREATE TABLE IF NOT EXISTS cache_stats (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )''',
+    # Replaced by the fixed-size cache_generation_stripes
+    'DROP TABLE IF EXISTS cache_generations',
+    '''CREATE TABLE IF NOT EXISTS cache_generation_stripes (
+        stripe INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL
+    )''',
+    '''INSERT OR IGNORE INTO cache_stats (name, value) VALUES
+        ('hits', 0), ('misses', 0), ('evictions', 0), ('invalidations', 0), ('size', 0)''',
+)
+
+def _stripe(fin):
+    # crc32 rather than hash(), which differs between worker processes
+    return zlib.crc32(fin.encode('utf-8')) % GENERATION_STRIPES
+
+class SearchCache:
+    def __init__(self, app=None):
+        self._local = threading.local()
+        # Touches and counters not yet written, per cache file, shared by the threads of this process
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        app.config.setdefault('SEARCH_CACHE_PATH', os.path.join(basedir, 'search_cache.db'))
+        app.config.setdefault('SEARCH_CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('SEARCH_CACHE_TIMEOUT', 3600)
+        app.config.setdefault('SEARCH_CACHE_FLUSH_INTERVAL', 1.0)
+        app.extensions['search_cache'] = self
+
+    def _connection(self):
+        # One connection per thread and cache file; sqlite3 connections must not be shared across threads
+        path = current_app.config['SEARCH_CACHE_PATH']
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # Cache contents are disposable
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            connections[path] = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _bump(conn, name, amount=1):
+        conn.execute('UPDATE cache_stats SET value = value + ? WHERE name = ?', (amount, name))
+
+    def _record(self, fin, hit, now):
+        """Queue the LRU touch and counter of a lookup; return True once the batch is due."""
+        path = current_app.config['SEARCH_CACHE_PATH']
+        with self._pending_lock:
+            pending = self._pending.setdefault(path, {"touches": {}, "hits": 0, "misses": 0, "since": now})
+            if hit:
+                pending["touches"][fin] = now
+                pending["hits"] += 1
+            else:
+                pending["misses"] += 1
+            return now - pending["since"] >= current_app.config['SEARCH_CACHE_FLUSH_INTERVAL']
+
+    def _flush(self, conn):
+        """Write this process's queued touches and counters inside the caller's transaction."""
+        with self._pending_lock:
+            pending = self._pending.pop(current_app.config['SEARCH_CACHE_PATH'], None)
+        if pending is None:
+            return
+        # An entry deleted or replaced since the hit is skipped or keeps its newer last_access
+        conn.executemany('UPDATE cache_entries SET last_access = MAX(last_access, ?) WHERE key = ?',
+                         [(at, fin) for fin, at in pending["touches"].items()])
+        self._bump(conn, 'hits', pending["hits"])
+        self._bump(conn, 'misses', pending["misses"])
+
+    def get(self, fin):
+        """Return the cached search result for a FIN, or None on a miss."""
+        if current_app.config['SEARCH_CACHE_MAX_ENTRIES'] <= 0:
+            return None
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?', (fin, now)
+            ).fetchone()
+            # Expired entries stay until set() replaces them or they are evicted
+            if self._record(fin, row is not None, now):
+                with self._transaction() as conn:
+                    self._flush(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"Search cache read failed: {str(e)}")
+            return None
+        return None if row is None else json.loads(row[0])
+
+    def generation(self, fin):
+        """Return the invalidation generation of a FIN's stripe, to pass to set() after the query."""
+        try:
+            row = self._connection().execute(
+                'SELECT generation FROM cache_generation_stripes WHERE stripe = ?', (_stripe(fin),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Search cache read failed: {str(e)}")
+            return None
+        return row[0] if row else 0
+
+    def set(self, fin, value, generation=None):
+        """Store a search result, evicting the least recently used entries beyond the size bound.
+
+        :param generation: generation(fin) as read before the result was computed. The result is
+            dropped if delete() invalidated the FIN (or another FIN of its stripe) since, as it may
+            predate that write.
+        """
+        now = time.time()
+        config = current_app.config
+        if config['SEARCH_CACHE_MAX_ENTRIES'] <= 0:
+            return
+        try:
+            with self._transaction() as conn:
+                # Apply pending touches first, so eviction sees the latest hits
+                self._flush(conn)
+                if generation is not None:
+                    current = conn.execute('SELECT generation FROM cache_generation_stripes WHERE stripe = ?',
+                                           (_stripe(fin),)).fetchone()
+                    if (current[0] if current else 0) != generation:
+                        return
+                existed = conn.execute('SELECT 1 FROM cache_entries WHERE key = ?', (fin,)).fetchone()
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache_entries (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                    (fin, json.dumps(value), now + config['SEARCH_CACHE_TIMEOUT'], now)
+                )
+                if existed:
+                    return
+                size = conn.execute("SELECT value FROM cache_stats WHERE name = 'size'").fetchone()[0] + 1
+                overflow = size - config['SEARCH_CACHE_MAX_ENTRIES']
+                if overflow > 0:
+                    conn.execute(
+                        'DELETE FROM cache_entries WHERE key IN '
+                        '(SELECT key FROM cache_entries ORDER BY last_access LIMIT ?)',
+                        (overflow,)
+                    )
+                    self._bump(conn, 'evictions', overflow)
+                    size -= overflow
+                conn.execute("UPDATE cache_stats SET value = ? WHERE name = 'size'", (size,))
+        except sqlite3.Error as e:
+            logging.warning(f"Search cache write failed: {str(e)}")
+
+    def delete(self, *fins):
+        """Invalidate the cached results for the given FINs and bump their stripes' generations."""
+        if not fins:
+            return
+        fins = list(fins)
+        try:
+            with self._transaction() as conn:
+                removed = 0
+                for start in range(0, len(fins), Config.SQL_IN_CHUNK_SIZE):
+                    chunk = fins[start:start + Config.SQL_IN_CHUNK_SIZE]
+                    removed += conn.execute(
+                        f"DELETE FROM cache_entries WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                    ).rowcount
+                conn.executemany(
+                    'INSERT INTO cache_generation_stripes (stripe, generation) VALUES (?, 1) '
+                    'ON CONFLICT (stripe) DO UPDATE SET generation = generation + 1',
+                    [(stripe,) for stripe in {_stripe(fin) for fin in fins}]
+                )
+                if removed:
+                    self._bump(conn, 'invalidations', removed)
+                    self._bump(conn, 'size', -removed)
+        except sqlite3.Error as e:
+            # The write has already committed; stale entries still expire after SEARCH_CACHE_TIMEOUT
+            logging.error(f"Search cache invalidation failed for {len(fins)} FINs: {str(e)}")
+
+    def clear(self):
+        with self._pending_lock:
+            self._pending.pop(current_app.config['SEARCH_CACHE_PATH'], None)
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM cache_entries')
+            conn.execute("UPDATE cache_stats SET value = 0 WHERE name = 'size'")
+
+    def stats(self):
+        try:
+            with self._transaction() as conn:
+                self._flush(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"Search cache write failed: {str(e)}")
+        rows = self._connection().execute('SELECT name, value FROM cache_stats').fetchall()
+        result = dict(rows)
+        result['max_entries'] = current_app.config['SEARCH_CACHE_MAX_ENTRIES']
+        return result
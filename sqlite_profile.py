@@ -0,0 +1,64 @@
+# sqlite_profile.py
+# Production SQLite profile. PRAGMAs are applied to every new connection through connect events,
+# and with SQLITE_READ_WRITE_SPLIT enabled, GET/HEAD handlers read through a pool of read-only
+# connections while writes stay on the small writer pool configured by SQLALCHEMY_ENGINE_OPTIONS.
+# In WAL mode, readers never block the writer and the writer never blocks readers.
+
+import logging
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+READ_METHODS = ('GET', 'HEAD')
+
+# journal_mode is a property of the database file and cannot be changed through a read-only connection
+_FILE_PRAGMAS = ('journal_mode',)
+
+class RoutingSession(Session):
+    """Sends reads made while handling GET/HEAD requests to the read-only engine, when one is configured."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and request.method in READ_METHODS:
+            reader = current_app.extensions.get('sqlite_reader')
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_pragmas
+
+def reader_url(url):
+    """Read-only URI for the same SQLite file: sqlite:///file:<path>?mode=ro&uri=true"""
+    url = make_url(url)
+    return url.set(database=f"file:{url.database}", query={"mode": "ro", "uri": "true"})
+
+def init_sqlite_profile(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    db = app.extensions['sqlalchemy']
+    with app.app_context():
+        writer = db.engine
+    event.listen(writer, 'connect', _pragma_listener(pragmas))
+    # Set the file-level journal mode now, before any reader opens the file
+    with writer.connect() as connection:
+        connection.exec_driver_sql('SELECT 1')
+
+    if not app.config.get('SQLITE_READ_WRITE_SPLIT'):
+        return
+    reader = create_engine(
+        reader_url(writer.url),
+        pool_size=app.config['SQLITE_READER_POOL_SIZE'],
+        max_overflow=app.config.get('SQLITE_READER_MAX_OVERFLOW', 0),
+        pool_timeout=app.config.get('SQLITE_READER_POOL_TIMEOUT', 30)
+    )
+    reader_pragmas = {name: value for name, value in pragmas.items() if name not in _FILE_PRAGMAS}
+    event.listen(reader, 'connect', _pragma_listener(reader_pragmas))
+    app.extensions['sqlite_reader'] = reader
+    logging.info(f"SQLite read/write split enabled with {app.config['SQLITE_READER_POOL_SIZE']} reader connections")
@@ -4,11 +4,19 @@ from models import Application, db
 from datetime import datetime, date, timedelta
 
 @pytest.fixture
-def client():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def client(tmp_path):
+    from config import Config
+
+    # The engine is built inside create_app, so the test database must be set before it runs
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+        JOB_STORE_PATH = str(tmp_path / 'jobs.db')
+
+    app = create_app(TestConfig)
 
     with app.test_client() as client:
         with app.app_context():
@@ -97,4 +105,1265 @@ def test_create_stvp(client):
     response = client.post('/api/applications/EXPIRED123/create-stvp',
                           headers={'X-API-Key': 'default_key'})
     assert response.status_code == 201
-    assert 'stvp_id' in response.json
\ No newline at end of file
+    assert 'stvp_id' in response.json
+
+def _add_applications(count):
+    applications = [Application(
+        id=f"B{i:04d}",
+        fin=f"T{i:07d}A",
+        name=f"Bulk User {i}",
+        pass_type="S Pass",
+        doa=date.today() - timedelta(days=100),
+        doe=date.today() + timedelta(days=100),
+        company_uen="UEN00001",
+        status="Approved"
+    ) for i in range(count)]
+    db.session.add_all(applications)
+    db.session.commit()
+
+def test_list_applications_cursor_pagination(client):
+    with client.application.app_context():
+        _add_applications(5)
+
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get(f'/api/applications?per_page=2&cursor={cursor}',
+                              headers={'X-API-Key': 'default_key'})
+        assert response.status_code == 200
+        assert 'total' not in response.json
+        seen.extend(app['id'] for app in response.json['applications'])
+        cursor = response.json['next_cursor']
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) == 6
+
+def test_list_applications_cursor_with_total(client):
+    response = client.get('/api/applications?cursor=&include_total=true',
+                          headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    assert response.json['total'] == 1
+    assert response.json['next_cursor'] is None
+
+def test_list_applications_invalid_cursor(client):
+    response = client.get('/api/applications?cursor=not-a-cursor',
+                          headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 400
+    from utils import encode_cursor
+    for sort, values in (('id', [{}]), ('id', [None]), ('id', [[1]]), ('doe', ["2020-01-01", {}]),
+                         ('doe', [None, "A1"]), ('-doa', ["not-a-date", "A1"])):
+        response = client.get('/api/applications', query_string={'sort': sort, 'cursor': encode_cursor(*values)},
+                              headers={'X-API-Key': 'default_key'})
+        assert response.status_code == 400 and response.json['error'] == "Invalid cursor"
+
+def test_list_applications_page_bounds(client):
+    headers = {'X-API-Key': 'default_key'}
+    assert client.get('/api/applications?page=-3', headers=headers).json['current_page'] == 1
+    assert client.get('/api/applications?page=2', headers=headers).status_code == 404
+    assert client.get('/api/applications?page=99999999999999999999', headers=headers).status_code == 404
+
+def test_list_applications_per_page_ceiling(client):
+    with client.application.app_context():
+        _add_applications(120)
+
+    response = client.get('/api/applications?per_page=1000',
+                          headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    assert len(response.json['applications']) == 100
+
+def test_batch_search(client):
+    response = client.post('/api/applications/search/batch',
+                           json={'fins': ['S1234567X', 'S0000000Z', 'INVALID', 'S1234567X']},
+                           headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    results = response.json['results']
+    assert results['S1234567X']['status'] == 'found'
+    assert results['S1234567X']['applications'][0]['id'] == 'TEST123'
+    assert results['S0000000Z']['status'] == 'not_found'
+    assert results['INVALID']['status'] == 'invalid'
+    assert (response.json['found'], response.json['not_found'], response.json['invalid']) == (1, 1, 1)
+
+def test_batch_search_uses_chunked_queries(client):
+    from sqlalchemy import event
+
+    fins = [f"S{i:07d}X" for i in range(1200)]
+    statements = []
+    with client.application.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.post('/api/applications/search/batch', json={'fins': fins},
+                               headers={'X-API-Key': 'default_key'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    assert response.status_code == 200
+    assert response.json['not_found'] == 1200
+    assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 3
+
+def test_batch_search_requires_list(client):
+    response = client.post('/api/applications/search/batch', json={'fins': 'S1234567X'},
+                           headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 400
+
+def test_batch_search_requires_an_object_body(client):
+    import json
+    for body in (['S1234567X'], None, "S1234567X"):
+        response = client.post('/api/applications/search/batch', data=json.dumps(body),
+                               content_type='application/json', headers={'X-API-Key': 'default_key'})
+        assert response.status_code == 400
+        assert response.json['error'] == "Missing required field: fins (non-empty list)"
+
+def test_search_cache_hit_and_invalidation(client):
+    headers = {'X-API-Key': 'default_key'}
+    first = client.get('/api/applications/search?fin=S1234567X', headers=headers)
+    second = client.get('/api/applications/search?fin=S1234567X', headers=headers)
+    assert first.json == second.json
+
+    new_doe = (date.today() + timedelta(days=90)).isoformat()
+    response = client.put('/api/applications/TEST123/update-expiry', json={'new_doe': new_doe}, headers=headers)
+    assert response.status_code == 200
+
+    third = client.get('/api/applications/search?fin=S1234567X', headers=headers)
+    assert third.json[0]['doe'] == new_doe
+
+    stats = client.get('/api/cache/stats', headers=headers).json
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 2, 1)
+
+def test_search_cache_evicts_least_recently_used(client):
+    from extensions import search_cache
+
+    client.application.config['SEARCH_CACHE_MAX_ENTRIES'] = 2
+    with client.application.app_context():
+        search_cache.set('S0000001A', [{'id': '1'}])
+        search_cache.set('S0000002A', [{'id': '2'}])
+        assert search_cache.get('S0000001A') == [{'id': '1'}]
+        search_cache.set('S0000003A', [{'id': '3'}])
+
+        assert search_cache.get('S0000002A') is None
+        assert search_cache.get('S0000001A') == [{'id': '1'}]
+        stats = search_cache.stats()
+        assert (stats['evictions'], stats['size']) == (1, 2)
+
+def test_search_cache_hits_do_not_write(client):
+    from extensions import search_cache
+
+    with client.application.app_context():
+        search_cache.set('S0000001A', [{'id': '1'}])
+        statements = []
+        search_cache._connection().set_trace_callback(statements.append)
+        for _ in range(3):
+            assert search_cache.get('S0000001A') == [{'id': '1'}]
+        assert search_cache.get('S0000002A') is None
+        search_cache._connection().set_trace_callback(None)
+        assert statements and all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+        stats = search_cache.stats()
+        assert (stats['hits'], stats['misses']) == (3, 1)
+
+def test_search_cache_drops_a_result_invalidated_while_computed(client):
+    from extensions import search_cache
+
+    with client.application.app_context():
+        generation = search_cache.generation('S0000001A')
+        search_cache.delete('S0000001A')
+        search_cache.set('S0000001A', [{'id': 'stale'}], generation)
+        assert search_cache.get('S0000001A') is None
+
+        generation = search_cache.generation('S0000001A')
+        search_cache.set('S0000001A', [{'id': 'fresh'}], generation)
+        assert search_cache.get('S0000001A') == [{'id': 'fresh'}]
+
+        # Generations are striped, so invalidating many FINs (in several IN chunks) adds no rows per FIN
+        from shared_cache import GENERATION_STRIPES
+        search_cache.delete(*[f"S{n:07d}B" for n in range(3 * GENERATION_STRIPES)])
+        assert search_cache.get('S0000001A') == [{'id': 'fresh'}]
+        stripes = search_cache._connection().execute('SELECT count(*) FROM cache_generation_stripes').fetchone()[0]
+        assert stripes <= GENERATION_STRIPES
+
+def test_amendment_ids_use_per_application_sequence(client):
+    headers = {'X-API-Key': 'default_key'}
+    ids = []
+    for days in (60, 90):
+        data = {'new_doe': (date.today() + timedelta(days=days)).isoformat()}
+        response = client.put('/api/applications/TEST123/update-expiry', json=data, headers=headers)
+        ids.append(response.json['amendment_id'])
+    assert ids == ['P01TEST123', 'P02TEST123']
+
+    with client.application.app_context():
+        assert db.session.get(Application, 'TEST123').amendment_seq == 2
+
+def test_writes_take_the_write_lock_before_reading(client):
+    from sqlalchemy import event
+
+    headers = {'X-API-Key': 'default_key'}
+    with client.application.app_context():
+        engine = db.engine
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.lstrip().upper())
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        new_doe = (date.today() + timedelta(days=60)).isoformat()
+        for method, url, body in (('put', '/api/applications/TEST123/update-expiry', {'new_doe': new_doe}),
+                                  ('put', '/api/applications/update-expiry/batch',
+                                   [{'application_id': 'TEST123', 'new_doe': new_doe}])):
+            statements.clear()
+            assert getattr(client, method)(url, json=body, headers=headers).status_code == 200
+            # The values the write starts from are read after the lock is taken and before the first write
+            locked = statements.index('BEGIN IMMEDIATE')
+            first_write = next(i for i, s in enumerate(statements) if s.startswith(('UPDATE', 'INSERT')))
+            assert any(s.startswith('SELECT') and 'FROM APPLICATIONS' in s for s in statements[locked:first_write])
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+def test_amendment_seq_migration_backfills_from_existing_ids():
+    import sqlite3
+    from migrations import migrate
+
+    connection = sqlite3.connect(':memory:')
+    connection.executescript("""
+        CREATE TABLE applications (id TEXT PRIMARY KEY, name TEXT, pass_type TEXT, doa TEXT, company_uen TEXT, status TEXT,
+                                   doe TEXT NOT NULL);
+        CREATE TABLE amendments (amendment_id TEXT PRIMARY KEY, application_id TEXT NOT NULL, amendment_date TEXT);
+        CREATE INDEX ix_amendments_application_id ON amendments (application_id);
+        CREATE TABLE stvps (id TEXT PRIMARY KEY, application_id TEXT NOT NULL, end_date TEXT);
+        INSERT INTO applications (id, pass_type, company_uen, status, doe)
+        VALUES ('A0001', 'EP', 'UEN1', 'Approved', '2030-01-01'), ('A0002', 'EP', 'UEN1', 'Approved', '2030-01-01');
+        INSERT INTO amendments (amendment_id, application_id) VALUES ('P01A0001', 'A0001'), ('P03A0001', 'A0001');
+    """)
+    assert 'add_amendment_seq' in migrate(connection)
+    assert migrate(connection) == []
+    assert dict(connection.execute("SELECT id, amendment_seq FROM applications")) == {'A0001': 3, 'A0002': 0}
+    indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'ix_amendments_application_id_amendment_date' in indexes
+    assert 'ix_amendments_application_id' not in indexes   # Redundant with the composite index
+
+def test_bulk_stvp_issuance_matches_create_stvp_rules(client):
+    from bulk import issue_expired_stvps
+    from models import Amendment, STVP
+
+    with client.application.app_context():
+        for app_id, days_expired in (("E0001", 1), ("E0002", 10), ("E0003", 20)):
+            db.session.add(Application(
+                id=app_id, fin=f"S{app_id[1:]:0>7}E", name="Expired User", pass_type="EP",
+                doa=date.today() - timedelta(days=400), doe=date.today() - timedelta(days=days_expired),
+                company_uen="987654321A", status="EXPIRED"
+            ))
+        # E0003's STVP ended yesterday, so it is extended; E0004's is still open, so it is left alone
+        db.session.add(STVP(id="STVP0003", application_id="E0003",
+                            start_date=date.today() - timedelta(days=20), end_date=date.today() - timedelta(days=1)))
+        db.session.add(Application(
+            id="E0004", fin="S0000004E", name="Expired User", pass_type="EP", doa=date.today() - timedelta(days=400),
+            doe=date.today() - timedelta(days=5), company_uen="987654321A", status="EXPIRED"))
+        db.session.add(STVP(id="STVP0004", application_id="E0004",
+                            start_date=date.today() - timedelta(days=5), end_date=date.today() + timedelta(days=25)))
+        db.session.commit()
+
+        report = issue_expired_stvps(chunk_size=2)
+
+        assert (report["expired"], report["created"], report["extended"], report["open_stvps"], report["chunks"]) == (4, 2, 1, 1, 2)
+        assert db.session.get(STVP, "STVP0001").end_date == date.today() + timedelta(days=30)
+        assert db.session.get(STVP, "STVP0003").end_date == date.today() + timedelta(days=29)
+        assert db.session.get(STVP, "STVP0004").end_date == date.today() + timedelta(days=25)
+        amendment = Amendment.query.filter_by(application_id="E0003").one()
+        assert amendment.amendment_id == "P01E0003"
+        assert amendment.amended_value == (date.today() + timedelta(days=29)).isoformat()
+
+def test_bulk_stvp_issuance_rerun_on_the_same_day_changes_nothing(client):
+    from bulk import issue_expired_stvps
+    from models import Amendment, STVP
+
+    with client.application.app_context():
+        for app_id, days_expired in (("E0001", 1), ("E0002", 40)):
+            db.session.add(Application(
+                id=app_id, fin=f"S{app_id[1:]:0>7}E", name="Expired User", pass_type="EP",
+                doa=date.today() - timedelta(days=400), doe=date.today() - timedelta(days=days_expired),
+                company_uen="987654321A", status="EXPIRED"
+            ))
+        db.session.add(STVP(id="STVP0002", application_id="E0002",
+                            start_date=date.today() - timedelta(days=40), end_date=date.today() - timedelta(days=10)))
+        db.session.commit()
+
+        first = issue_expired_stvps()
+        assert (first["created"], first["extended"]) == (1, 1)
+        end_dates = dict(db.session.query(STVP.id, STVP.end_date).all())
+
+        second = issue_expired_stvps()
+        assert (second["created"], second["extended"], second["open_stvps"]) == (0, 0, 2)
+        assert dict(db.session.query(STVP.id, STVP.end_date).all()) == end_dates
+        assert Amendment.query.count() == 1
+
+def _wait_for_job(client, job_id, timeout=5):
+    import time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}', headers={'X-API-Key': 'default_key'}).json
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_bulk_stvp_job_endpoint(client):
+    response = client.post('/api/stvps/issue-expired', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 202
+    assert response.headers['Location'] == f"/api/jobs/{response.json['job_id']}"
+
+    job = _wait_for_job(client, response.json['job_id'])
+    assert job['status'] == 'succeeded'
+    assert job['result']['expired'] == 0
+
+def test_job_registry_bounded_queue_and_cancellation(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import Flask
+    from jobs import JobRegistry, JobQueueFull
+
+    started, release = threading.Event(), threading.Event()
+    app = Flask(__name__)
+    app.config['JOB_STORE_PATH'] = str(tmp_path / 'jobs.db')
+    registry = JobRegistry(app, ThreadPoolExecutor(max_workers=1), max_workers=1, max_pending=1)
+    running = registry.submit('blocker', lambda job: started.set() or release.wait(5))
+    assert started.wait(5)
+    queued = registry.submit('waiting', lambda job: 'never runs')
+    with pytest.raises(JobQueueFull):
+        registry.submit('overflow', lambda job: None)
+
+    assert registry.cancel(queued.id).status == 'cancelled'
+    stats = registry.stats()
+    assert (stats['queued'], stats['rejected']) == (0, 1)
+
+    release.set()
+    running._future.result(timeout=5)
+    assert running.status == 'succeeded'
+    assert registry.stats()['busy_workers'] == 0
+
+def test_jobs_are_shared_between_workers(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import Flask
+    from jobs import JobRegistry
+
+    # Two registries on one store stand in for two worker processes
+    app = Flask(__name__)
+    app.config['JOB_STORE_PATH'] = str(tmp_path / 'jobs.db')
+    worker, other = (JobRegistry(app, ThreadPoolExecutor(max_workers=1), max_workers=1, max_pending=1)
+                     for _ in range(2))
+
+    started, release = threading.Event(), threading.Event()
+    def work(job):
+        job.update_progress({"step": 1})
+        started.set()
+        release.wait(5)
+        job.update_progress({"step": 2})
+
+    running = worker.submit('work', work)
+    assert started.wait(5)
+    polled = other.get(running.id)
+    assert (polled.name, polled.status, polled.progress) == ('work', 'running', {"step": 1})
+
+    assert other.cancel(running.id).cancel_requested
+    release.set()
+    running._future.result(timeout=5)
+    assert other.get(running.id).status == 'cancelled'
+    assert other.get('missing') is None
+
+def test_jobs_of_a_stopped_worker_are_marked_failed(tmp_path):
+    import os
+    import subprocess
+    import sys
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import Flask
+    from jobs import JobRegistry
+
+    app = Flask(__name__)
+    app.config['JOB_STORE_PATH'] = str(tmp_path / 'jobs.db')
+    def registry():
+        return JobRegistry(app, ThreadPoolExecutor(max_workers=1), max_workers=1, max_pending=1)
+
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    worker = registry()
+    conn = worker._connection()
+    now = time.time()
+    conn.executemany(
+        'INSERT INTO jobs (id, name, status, created_at, owner_pid, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?)', [
+            ('exited', 'export', 'running', '2026-01-01T00:00:00+00:00', exited.pid, now),
+            ('silent', 'export', 'queued', '2026-01-01T00:00:00+00:00', os.getpid(), now - 3600),
+            ('alive', 'export', 'running', '2026-01-01T00:00:00+00:00', os.getpid(), now),
+        ])
+
+    # Polling fails a job whose worker has exited...
+    job = worker.get('exited')
+    assert (job.status, job.finished) == ('failed', True)
+    assert str(exited.pid) in job.error
+    # ...and a worker opening the store fails jobs whose heartbeat stopped
+    registry().stats()
+    assert dict(conn.execute('SELECT id, status FROM jobs')) == {
+        'exited': 'failed', 'silent': 'failed', 'alive': 'running'}
+
+def test_job_queue_full_returns_503(client):
+    client.application.jobs.max_pending = 0
+    response = client.get('/api/test-concurrency')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+def test_export_ndjson_with_related_rows(client):
+    import json
+    from models import Amendment, STVP
+
+    with client.application.app_context():
+        _add_applications(3)
+        db.session.add(Amendment(amendment_id="P01B0001", application_id="B0001",
+                                 original_value="2030-01-01", amended_value="2030-02-01"))
+        db.session.add(STVP(id="STVP0001", application_id="B0001",
+                            start_date=date.today(), end_date=date.today() + timedelta(days=30)))
+        db.session.commit()
+
+    response = client.get('/api/export?format=ndjson&include=amendments,stvps&status=Approved',
+                          headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['id'] for record in records] == ['B0000', 'B0001', 'B0002']
+    assert records[1]['amendments'][0]['amendment_id'] == 'P01B0001'
+    assert records[1]['stvps'][0]['id'] == 'STVP0001'
+    assert records[0]['amendments'] == [] and records[0]['stvps'] == []
+
+def test_export_csv_doe_filter(client):
+    import csv
+    import io
+
+    doe_to = (date.today() + timedelta(days=31)).isoformat()
+    response = client.get(f'/api/export?format=csv&doe_to={doe_to}', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['id'] for row in rows] == ['TEST123']
+
+def test_export_rejects_unknown_format(client):
+    response = client.get('/api/export?format=xml', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 400
+
+def test_export_job_download(client, tmp_path, monkeypatch):
+    import os
+    monkeypatch.setattr('config.Config.EXPORT_DIR', str(tmp_path / 'exports'))
+    response = client.post('/api/export?format=ndjson', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 202
+
+    job = _wait_for_job(client, response.json['job_id'])
+    assert job['status'] == 'succeeded'
+    assert job['result']['rows'] == 1
+    download = client.get(job['result']['download'], headers={'X-API-Key': 'default_key'})
+    assert download.status_code == 200
+    assert b'"id":"TEST123"' in download.data
+
+    # The file goes with the job record once newer jobs push it out of the history
+    client.application.jobs.history = 1
+    newer = client.post('/api/export?format=csv', headers={'X-API-Key': 'default_key'})
+    assert _wait_for_job(client, newer.json['job_id'])['status'] == 'succeeded'
+    assert client.get(f"/api/jobs/{job['id']}", headers={'X-API-Key': 'default_key'}).status_code == 404
+    assert sorted(os.listdir(tmp_path / 'exports')) == [f"{newer.json['job_id']}.csv"]
+
+def test_import_upserts_valid_rows_and_reports_rejected(client, tmp_path, monkeypatch):
+    import json
+    import os
+    from rollups import check, rebuild
+    with client.application.app_context():
+        rebuild('expiries')
+        rebuild('companies')
+        db.session.commit()
+    monkeypatch.setattr('config.Config.IMPORT_DIR', str(tmp_path / 'imports'))
+    monkeypatch.setattr('config.Config.IMPORT_CHUNK_SIZE', 2)
+    doe = (date.today() + timedelta(days=90)).isoformat()
+    body = (
+        "id,fin,name,pass_type,doa,doe,status,company_uen\n"
+        f"TEST123,S1234567X,Test User,EP,2024-01-01,{doe},ACTIVE,123456789A\n"
+        f"NEW1,G7654321N,Jane Tan,SP,2024-02-01,{doe},ACTIVE,987654321B\n"
+        "BAD1,123,Bad Row,EP,2024-02-30,2025-01-01,ACTIVE,987654321B\n"
+        f"NEW2,G1111111N,Ann Lim,EP,2024-03-01,{doe},PENDING,\n"
+    )
+    response = client.post('/api/import?format=csv', data=body, headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 202
+
+    job = _wait_for_job(client, response.json['job_id'])
+    assert job['status'] == 'succeeded'
+    result = job['result']
+    assert (result['rows_read'], result['inserted'], result['updated'], result['rejected']) == (4, 1, 1, 2)
+    assert result['chunks'] == 2
+    assert os.listdir(tmp_path / 'imports') == [f"{job['id']}.rejected.ndjson"]
+
+    rejected = client.get(result['rejected_download'], headers={'X-API-Key': 'default_key'})
+    assert rejected.status_code == 200
+    rows = [json.loads(line) for line in rejected.data.decode().splitlines()]
+    assert [row['row'] for row in rows] == [4, 5]
+    assert set(rows[0]['errors']) == {'fin', 'doa'}
+    assert rows[1]['errors'] == {'company_uen': "Missing required field: company_uen"}
+    assert rows[1]['record']['id'] == 'NEW2'
+
+    with client.application.app_context():
+        updated = db.session.get(Application, 'TEST123')
+        assert (updated.doe.isoformat(), updated.version) == (doe, 2)
+        assert db.session.get(Application, 'NEW1').name == "Jane Tan"
+        assert check('expiries') == [] and check('companies') == []
+
+    # The rejected-rows file goes with the job record once newer jobs push it out of the history
+    monkeypatch.setattr('config.Config.EXPORT_DIR', str(tmp_path / 'exports'))
+    client.application.jobs.history = 1
+    newer = client.post('/api/export?format=csv', headers={'X-API-Key': 'default_key'})
+    assert _wait_for_job(client, newer.json['job_id'])['status'] == 'succeeded'
+    assert os.listdir(tmp_path / 'imports') == []
+
+def test_import_moves_stvps_with_a_company_change(client):
+    import io
+    from imports import import_applications
+    from models import STVP
+    from rollups import check, rebuild
+    with client.application.app_context():
+        db.session.add(STVP(id="STVPEST123", application_id="TEST123",
+                            start_date=date.today(), end_date=date.today() + timedelta(days=30)))
+        rebuild('expiries')
+        rebuild('companies')
+        db.session.commit()
+
+        application = db.session.get(Application, 'TEST123')
+        body = ("id,fin,name,pass_type,doa,doe,status,company_uen\n"
+                f"TEST123,S1234567X,Test User,EP,{application.doa},{application.doe},ACTIVE,NEWUEN01\n")
+        report = import_applications(io.StringIO(body), 'csv')
+        assert report['updated'] == 1
+        assert check('expiries') == [] and check('companies') == []
+
+def test_application_detail_in_one_response(client):
+    from models import Amendment, STVP
+
+    with client.application.app_context():
+        db.session.add(Amendment(amendment_id="P01TEST123", application_id="TEST123",
+                                 amendment_date=datetime(2024, 1, 1),
+                                 original_value="2030-01-01", amended_value="2030-02-01"))
+        db.session.add(Amendment(amendment_id="P02TEST123", application_id="TEST123",
+                                 amendment_date=datetime(2024, 2, 1),
+                                 original_value="2030-02-01", amended_value="2030-03-01"))
+        db.session.add(STVP(id="STVPEST123", application_id="TEST123",
+                            start_date=date.today(), end_date=date.today() + timedelta(days=30)))
+        db.session.commit()
+
+    response = client.get('/api/applications/TEST123', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    assert response.json['fin'] == 'S1234567X'
+    assert [a['amendment_id'] for a in response.json['amendments']] == ['P01TEST123', 'P02TEST123']
+    assert response.json['stvps'][0]['id'] == 'STVPEST123'
+
+def test_application_detail_field_projection(client):
+    response = client.get('/api/applications/TEST123?fields=id,doe', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    assert set(response.json) == {'id', 'doe'}
+
+    response = client.get('/api/applications/TEST123?fields=id,password', headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 400
+    for fields in ('', ','):
+        response = client.get(f'/api/applications/TEST123?fields={fields}', headers={'X-API-Key': 'default_key'})
+        assert response.status_code == 400
+        assert response.json['error'] == "fields must name at least one field"
+    assert client.get('/api/applications/MISSING', headers={'X-API-Key': 'default_key'}).status_code == 404
+
+def test_metrics_endpoint_labels_by_route_template(client):
+    headers = {'X-API-Key': 'default_key'}
+    client.get('/api/applications/TEST123', headers=headers)
+    client.get('/api/applications/search?fin=S1234567X', headers=headers)
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'endpoint="/api/applications/<string:application_id>"' in body
+    assert 'endpoint="/api/applications/TEST123"' not in body
+    assert 'db_query_duration_seconds_count{operation="SELECT"}' in body
+    assert 'search_cache_misses_total' in body
+    assert 'executor_busy_workers' in body
+
+def test_production_sqlite_profile_splits_reads_and_writes(tmp_path):
+    from sqlalchemy import event
+    from config import ProductionSQLiteConfig
+
+    class ProfileConfig(ProductionSQLiteConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'profile.db'}"
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+
+    app = create_app(ProfileConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Application(id="TEST123", fin="S1234567X", name="Test User", pass_type="EP",
+                                   doa=date.today() - timedelta(days=365), doe=date.today() + timedelta(days=30),
+                                   company_uen="123456789A", status="ACTIVE"))
+        db.session.commit()
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        writer = db.engine
+    reader = app.extensions['sqlite_reader']
+
+    used = []
+    for name, engine in (('reader', reader), ('writer', writer)):
+        event.listen(engine, 'before_cursor_execute', lambda *args, name=name: used.append(name))
+
+    client = app.test_client()
+    assert client.get('/api/applications/TEST123').status_code == 200
+    assert set(used) == {'reader'}
+
+    used.clear()
+    response = client.put('/api/applications/TEST123/update-expiry',
+                          json={'new_doe': (date.today() + timedelta(days=60)).isoformat()})
+    assert response.status_code == 200
+    assert set(used) == {'writer'}
+
+def test_write_queue_group_commits_concurrent_writes(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from config import Config
+
+    class QueueConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'queue.db'}"
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+        WRITE_QUEUE_ENABLED = True
+        WRITE_QUEUE_MAX_WAIT_MS = 50
+
+    app = create_app(QueueConfig)
+    with app.app_context():
+        db.create_all()
+        for i in range(8):
+            db.session.add(Application(id=f"Q{i:04d}", fin=f"S{i:07d}Q", name="Queued User", pass_type="EP",
+                                       doa=date.today() - timedelta(days=365), doe=date.today() + timedelta(days=30),
+                                       company_uen="123456789A", status="ACTIVE"))
+        db.session.commit()
+
+    def update(app_id):
+        with app.test_client() as client:
+            return client.put(f'/api/applications/{app_id}/update-expiry',
+                              json={'new_doe': (date.today() + timedelta(days=90)).isoformat()})
+
+    app_ids = [f"Q{i:04d}" for i in range(8)] + ["Q0000", "MISSING"]
+    with ThreadPoolExecutor(max_workers=len(app_ids)) as pool:
+        responses = list(pool.map(update, app_ids))
+
+    assert [r.status_code for r in responses] == [200] * 9 + [404]
+    assert sorted(r.json['amendment_id'] for r in responses if r.json.get('amendment_id', '').startswith('P')
+                  and r.json['amendment_id'].endswith('Q0000')) == ['P01Q0000', 'P02Q0000']
+    stats = app.extensions['write_queue'].stats()
+    assert stats['operations'] == 9
+    assert stats['batches'] < stats['operations']
+    with app.app_context():
+        assert db.session.get(Application, 'Q0003').doe == date.today() + timedelta(days=90)
+    app.extensions['write_queue'].stop()
+
+def test_write_queue_timeout_does_not_report_a_failure(tmp_path, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from config import Config
+    import services
+
+    class QueueConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'queue.db'}"
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+        WRITE_QUEUE_ENABLED = True
+        WRITE_QUEUE_MAX_BATCH = 1
+
+    app = create_app(QueueConfig)
+    with app.app_context():
+        db.create_all()
+        for i in range(2):
+            db.session.add(Application(id=f"Q{i:04d}", fin=f"S{i:07d}Q", name="Queued User", pass_type="EP",
+                                       doa=date.today() - timedelta(days=365), doe=date.today() + timedelta(days=30),
+                                       company_uen="123456789A", status="ACTIVE"))
+        db.session.commit()
+
+    started, release = threading.Event(), threading.Event()
+    update_expiry = services.update_expiry
+    def slow_update_expiry(*args):
+        started.set()
+        release.wait(5)
+        return update_expiry(*args)
+    monkeypatch.setattr(services, 'update_expiry', slow_update_expiry)
+    monkeypatch.setattr(Config, 'WRITE_QUEUE_TIMEOUT', 0.2)
+
+    new_doe = (date.today() + timedelta(days=90)).isoformat()
+    def update(app_id):
+        with app.test_client() as client:
+            return client.put(f'/api/applications/{app_id}/update-expiry', json={'new_doe': new_doe})
+
+    with app.test_client() as client:
+        client.get('/api/applications/search?fin=S0000000Q')
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        running = pool.submit(update, 'Q0000')
+        assert started.wait(5)
+        # Queued behind the stalled write: cancelled, so the client may safely retry
+        queued = update('Q0001')
+        assert queued.status_code == 503 and 'Retry-After' in queued.headers
+        # Already being applied: accepted, not reported as a failure
+        assert running.result().status_code == 202
+    release.set()
+    app.extensions['write_queue'].stop()
+
+    with app.app_context():
+        assert db.session.get(Application, 'Q0000').doe == date.today() + timedelta(days=90)
+        assert db.session.get(Application, 'Q0001').doe == date.today() + timedelta(days=30)
+    with app.test_client() as client:
+        assert client.get('/api/applications/search?fin=S0000000Q').json[0]['doe'] == new_doe
+
+def test_generator_is_deterministic_and_indexed(tmp_path):
+    import sqlite3
+    from withamendments import generate
+
+    dumps = []
+    for name, commit_every in (('first.db', 1000), ('second.db', 7)):
+        path = str(tmp_path / name)
+        totals = generate(path, 60, seed=3, expired_ratio=0.5, workers=1, commit_every=commit_every,
+                          today=date(2026, 1, 1), progress=lambda message: None)
+        connection = sqlite3.connect(path)
+        dumps.append([connection.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+                      for table in ('applications', 'amendments', 'stvps')])
+        indexes = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")}
+        connection.close()
+
+    assert totals['applications'] == 61
+    assert dumps[0] == dumps[1]
+    assert {index.name for table in db.metadata.sorted_tables for index in table.indexes} == indexes
+
+def test_load_generator_counts_time_queued_behind_a_slow_server():
+    import asyncio
+    from load_gen import LoadGenerator
+
+    class SlowTransport:
+        async def request(self, method, path, body=None):
+            await asyncio.sleep(0.05)
+            return 200, b'[{"id": "A0001"}]'
+
+    async def main():
+        generator = LoadGenerator(SlowTransport(), {"any": [("S1234567X", "A0001")]}, {"search": 1},
+                                  max_in_flight=1, seed=1)
+        return generator.report(await generator.run([100], 0.1))
+
+    report = asyncio.run(main())
+    # Arrivals keep their schedule although only one request runs at a time...
+    assert report['stages'][0]['started'] == 10
+    assert report['endpoints'][0]['status'] == 200
+    # ...and the last one is timed from its intended send time, not from when it got a slot
+    assert report['endpoints'][0]['max_ms'] >= 300
+
+def test_load_generator_samples_targets_from_the_seed(tmp_path):
+    import sqlite3
+    from load_gen import sample_targets
+
+    database = str(tmp_path / 'targets.db')
+    today = date.today()
+    with sqlite3.connect(database) as connection:
+        connection.execute("CREATE TABLE applications (id TEXT PRIMARY KEY, fin TEXT, doe DATE)")
+        connection.executemany("INSERT INTO applications VALUES (?, ?, ?)", [
+            (f"A{n:04d}", f"S{n:07d}A", (today + timedelta(days=30 if n % 2 else -30)).isoformat())
+            for n in range(200)])
+
+    targets = sample_targets(database, count=10, seed=3)
+    assert targets == sample_targets(database, count=10, seed=3)
+    assert targets != sample_targets(database, count=10, seed=4)
+    assert all(len(values) == 10 for values in targets.values())
+    # Each FIN comes with its own application ID, and the kinds match the passes
+    assert all(fin == f"S{int(application_id[1:]):07d}A" for values in targets.values() for fin, application_id in values)
+    assert all(int(application_id[1:]) % 2 == 0 for _, application_id in targets["expired"])
+    assert all(int(application_id[1:]) % 2 == 1 for _, application_id in targets["active"])
+
+def test_streaming_latency_statistics_merge_across_workers():
+    import numpy as np
+    from ci_utils import RunningStats, QuantileSketch, ReservoirSample, bootstrap_percentile_ci
+
+    latencies = np.random.default_rng(7).lognormal(-4, 1, 200000)
+    workers = np.array_split(latencies, 4)
+    stats = RunningStats()
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for part in workers:
+        stats.merge(RunningStats().update(part))
+        sketch.merge(QuantileSketch(relative_accuracy=0.01).update(part))
+
+    assert stats.count == sketch.count == latencies.size
+    assert stats.mean == pytest.approx(latencies.mean())
+    assert stats.variance == pytest.approx(latencies.var(ddof=1))
+    for q in (0.5, 0.95, 0.99):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(latencies, q), rel=0.02)
+
+    sample = ReservoirSample(5000, seed=1).update(latencies)
+    assert sample.values.size == 5000
+    lower, upper = bootstrap_percentile_ci(sample.values, 95, resamples=500, seed=1)
+    assert lower < np.percentile(latencies, 95) < upper
+
+def test_rate_limit_is_shared_across_workers_and_tiered_per_key(tmp_path):
+    from config import Config
+
+    class LimitedConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'limited.db'}"
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMIT_PATH = str(tmp_path / 'rate_limit.db')
+        RATE_LIMIT_TIERS = {"default": {"*": "2/minute"}, "batch": {"*": "100/minute"}}
+        RATE_LIMIT_KEY_TIERS = {"batch_key": "batch"}
+
+    # Two apps stand in for two worker processes sharing one limiter file
+    workers = [create_app(LimitedConfig).test_client() for _ in range(2)]
+    url = '/api/applications/search?fin=INVALID'
+    statuses = [workers[i % 2].get(url, headers={'X-API-Key': 'default_key'}).status_code for i in range(3)]
+    assert statuses == [400, 400, 429]
+
+    rejected = workers[0].get(url, headers={'X-API-Key': 'default_key'})
+    assert rejected.json['error'] == 'Rate limit exceeded'
+    assert 1 <= int(rejected.headers['Retry-After']) <= 30
+
+    assert all(workers[1].get(url, headers={'X-API-Key': 'batch_key'}).status_code == 400 for _ in range(5))
+
+    metrics = workers[0].get('/metrics').get_data(as_text=True)
+    assert 'rate_limit_rejections_total{endpoint="/api/applications/search",tier="default"} 2.0' in metrics
+    assert 'rate_limit_allowed_total{endpoint="/api/applications/search",tier="batch"} 5.0' in metrics
+
+def test_rate_limit_buckets_are_bounded(tmp_path, monkeypatch):
+    import sqlite3
+    import time
+    from config import Config
+
+    class LimitedConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'limited.db'}"
+        SEARCH_CACHE_PATH = str(tmp_path / 'search_cache.db')
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMIT_PATH = str(tmp_path / 'rate_limit.db')
+        RATE_LIMIT_TIERS = {"default": {"*": "60/minute"}}
+        RATE_LIMIT_SWEEP_INTERVAL = 0
+
+    def buckets():
+        with sqlite3.connect(LimitedConfig.RATE_LIMIT_PATH) as connection:
+            return connection.execute('SELECT count(*) FROM rate_limit_buckets').fetchone()[0]
+
+    client = create_app(LimitedConfig).test_client()
+    url = '/api/applications/search?fin=INVALID'
+    # Unknown keys share the client address bucket
+    for n in range(5):
+        client.get(url, headers={'X-API-Key': f"made-up-{n}"})
+    client.get(url, headers={'X-API-Key': 'default_key'})
+    assert buckets() == 2
+
+    # One minute later both have refilled and the next check sweeps them
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    client.get(url, headers={'X-API-Key': 'default_key'})
+    assert buckets() == 1
+
+def test_read_fast_path_is_byte_identical_to_jsonify(client):
+    from flask import jsonify
+    from models import Amendment
+    from utils import encode_cursor
+
+    with client.application.app_context():
+        _add_applications(3)
+        unusual = db.session.get(Application, 'B0001')
+        unusual.name = 'Zoë "Q" O\'Neil\\\n'
+        db.session.add(Amendment(amendment_id='P01B0001', application_id='B0001', amendment_date=datetime(2024, 1, 2),
+                                 original_value='2024-01-01', amended_value='2024-02-01'))
+        db.session.add(Amendment(amendment_id='P02B0001', application_id='B0001',
+                                 amendment_date=datetime(2024, 3, 4, 5, 6, 7, 89),
+                                 original_value='2024-02-01', amended_value='2024-03-01'))
+        db.session.commit()
+
+        def listed(app):
+            return {"id": app.id, "name": app.name, "pass_type": app.pass_type, "doa": app.doa.isoformat(),
+                    "doe": app.doe.isoformat(), "status": app.status}
+
+        applications = Application.query.order_by(Application.id).all()
+        amendments = Amendment.query.filter_by(application_id='B0001').order_by(Amendment.amendment_date).all()
+        with client.application.test_request_context():
+            expected = {
+                '/api/applications/search?fin=T0000001A': jsonify(
+                    [dict(listed(applications[1]), company_uen=applications[1].company_uen)]),
+                '/api/applications?page=1&per_page=3': jsonify({
+                    "applications": [listed(app) for app in applications[:3]],
+                    "total": 4, "pages": 2, "current_page": 1}),
+                '/api/applications/B0001/amendments': jsonify({"amendments": [{
+                    "amendment_id": a.amendment_id, "amendment_date": a.amendment_date.isoformat(),
+                    "original_value": a.original_value, "amended_value": a.amended_value} for a in amendments],
+                    "next_cursor": None}),
+                '/api/applications?per_page=2&cursor=': jsonify({
+                    "applications": [listed(app) for app in applications[:2]],
+                    "next_cursor": encode_cursor(applications[1].id)})
+            }
+            expected = {url: response.get_data() for url, response in expected.items()}
+
+    for url, body in expected.items():
+        response = client.get(url, headers={'X-API-Key': 'default_key'})
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert response.get_data() == body, url
+    # Served from the search cache the second time, still identical
+    assert client.get('/api/applications/search?fin=T0000001A').get_data() == \
+        expected['/api/applications/search?fin=T0000001A']
+
+def test_conditional_get_tracks_application_version(client):
+    headers = {'X-API-Key': 'default_key'}
+    urls = ['/api/applications/search?fin=S1234567X', '/api/applications/TEST123',
+            '/api/applications/TEST123?fields=id,doe']
+
+    first = {url: client.get(url, headers=headers) for url in urls}
+    etags = {url: response.headers['ETag'] for url, response in first.items()}
+    assert len(set(etags.values())) == len(urls)
+    for url in urls:
+        # Revalidation is answered from the cache entry or the version alone
+        response = client.get(url, headers=dict(headers, **{'If-None-Match': etags[url]}))
+        assert response.status_code == 304
+        assert response.get_data() == b''
+        assert response.headers['ETag'] == etags[url]
+
+    client.put('/api/applications/TEST123/update-expiry', headers=headers,
+               json={'new_doe': (date.today() + timedelta(days=90)).isoformat()})
+    amendments = client.get('/api/applications/TEST123/amendments', headers=headers)
+    for url in urls:
+        response = client.get(url, headers=dict(headers, **{'If-None-Match': etags[url]}))
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etags[url]
+    assert client.get('/api/applications/TEST123/amendments',
+                      headers=dict(headers, **{'If-None-Match': amendments.headers['ETag']})).status_code == 304
+
+    with client.application.app_context():
+        assert db.session.get(Application, 'TEST123').version == 2
+
+def test_amendment_history_pages_and_date_filters(client, monkeypatch):
+    from models import Amendment
+    headers = {'X-API-Key': 'default_key'}
+    with client.application.app_context():
+        _add_applications(1)
+        # Two amendments share a timestamp, so the cursor has to break the tie by amendment_id
+        for amendment_id, application_id, day in (("P01TEST123", "TEST123", 1), ("P02TEST123", "TEST123", 3),
+                                                  ("P03TEST123", "TEST123", 3), ("P04TEST123", "TEST123", 5),
+                                                  ("P01B0000", "B0000", 2)):
+            db.session.add(Amendment(amendment_id=amendment_id, application_id=application_id,
+                                     amendment_date=datetime(1990, 1, day, 9, 30), original_value="a", amended_value="b"))
+        db.session.commit()
+
+    full = client.get('/api/applications/TEST123/amendments', headers=headers)
+    assert [a['amendment_id'] for a in full.json['amendments']] == ['P01TEST123', 'P02TEST123', 'P03TEST123', 'P04TEST123']
+    assert full.json['next_cursor'] is None
+    monkeypatch.setattr('config.Config.ITEMS_PER_PAGE', 3)
+    default = client.get('/api/applications/TEST123/amendments', headers=headers).json
+    assert len(default['amendments']) == 3 and default['next_cursor'] is not None
+    monkeypatch.undo()
+
+    seen, after, etags = [], '', set()
+    while True:
+        page = client.get('/api/applications/TEST123/amendments', query_string={'limit': 2, 'after': after}, headers=headers)
+        assert page.status_code == 200
+        seen += [a['amendment_id'] for a in page.json['amendments']]
+        etags.add(page.headers['ETag'])
+        after = page.json['next_cursor']
+        if after is None:
+            break
+    assert seen == [a['amendment_id'] for a in full.json['amendments']]
+    assert len(etags) == 2 and full.headers['ETag'] not in etags
+    assert client.get('/api/applications/TEST123/amendments', query_string={'limit': 2},
+                      headers=dict(headers, **{'If-None-Match': page.headers['ETag']})).status_code == 200
+
+    ranged = client.get('/api/applications/TEST123/amendments?from=1990-01-03&to=1990-01-03', headers=headers)
+    assert [a['amendment_id'] for a in ranged.json['amendments']] == ['P02TEST123', 'P03TEST123']
+    assert client.get('/api/applications/TEST123/amendments?from=1990-02-01', headers=headers).status_code == 404
+    assert client.get('/api/applications/TEST123/amendments?to=1990-13-01', headers=headers).status_code == 400
+    assert client.get('/api/applications/TEST123/amendments?after=garbage', headers=headers).status_code == 400
+
+    audit = client.get('/api/amendments?since=1990-01-02&to=1990-01-31&limit=3', headers=headers)
+    assert [a['amendment_id'] for a in audit.json['amendments']] == ['P01B0000', 'P02TEST123', 'P03TEST123']
+    assert audit.json['amendments'][0]['application_id'] == 'B0000'
+    rest = client.get('/api/amendments', query_string={'since': '1990-01-02', 'to': '1990-01-31', 'after': audit.json['next_cursor']},
+                      headers=headers)
+    assert [a['amendment_id'] for a in rest.json['amendments']] == ['P04TEST123']
+    assert rest.json['next_cursor'] is None
+
+def test_list_and_export_responses_are_gzipped_when_accepted(client):
+    import gzip
+
+    with client.application.app_context():
+        _add_applications(30)
+    headers = {'X-API-Key': 'default_key'}
+    plain = client.get('/api/applications?per_page=30', headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    compressed = client.get('/api/applications?per_page=30', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(compressed.get_data()) < len(plain.get_data())
+
+    # Small responses are not worth compressing
+    small = client.get('/api/applications?per_page=1', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in small.headers
+
+    # Streamed bodies are read before the next request, which would push another request context
+    plain = client.get('/api/export?format=csv', headers=headers).get_data()
+    compressed = client.get('/api/export?format=csv', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain
+
+def test_list_filters_and_sorting(client):
+    with client.application.app_context():
+        _add_applications(6)
+        for i, application in enumerate(Application.query.filter(Application.id.like('B%')).order_by(Application.id)):
+            application.status = 'Approved' if i % 2 else 'Pending'
+            application.company_uen = f"UEN0000{i % 3}"
+            application.doe = date(2030, 1, 1) + timedelta(days=10 * (5 - i))
+        db.session.commit()
+    headers = {'X-API-Key': 'default_key'}
+
+    response = client.get('/api/applications?status=Approved&sort=-doe', headers=headers)
+    assert [a['id'] for a in response.json['applications']] == ['B0001', 'B0003', 'B0005']
+    assert response.json['total'] == 3
+    response = client.get('/api/applications?company_uen=UEN00001&doe_from=2030-01-01&doe_to=2030-02-10&sort=doe',
+                          headers=headers)
+    assert [a['id'] for a in response.json['applications']] == ['B0004', 'B0001']
+
+    # Cursor pagination follows the sort order and keeps the filters
+    seen, cursor = [], ''
+    while cursor is not None:
+        page = client.get(f'/api/applications?pass_type=S Pass&sort=doe&per_page=4&cursor={cursor}', headers=headers).json
+        seen += [a['id'] for a in page['applications']]
+        cursor = page['next_cursor']
+    assert seen == ['B0005', 'B0004', 'B0003', 'B0002', 'B0001', 'B0000']
+
+    assert client.get('/api/applications?doa_from=2020-13-01', headers=headers).status_code == 400
+    assert client.get('/api/applications?sort=name', headers=headers).status_code == 400
+
+def test_list_filter_queries_never_scan_the_table(client):
+    from itertools import combinations
+    from sqlalchemy import event
+
+    filters = {'status': 'Approved', 'pass_type': 'S Pass', 'company_uen': 'UEN00001',
+               'doe_from': '2020-01-01', 'doe_to': '2040-01-01', 'doa_from': '2000-01-01', 'doa_to': '2040-01-01'}
+    groups = [('status',), ('pass_type',), ('company_uen',), ('doe_from', 'doe_to'), ('doa_from', 'doa_to')]
+    statements = []
+    with client.application.app_context():
+        _add_applications(3)
+        engine = db.engine
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        for size in range(len(groups) + 1):
+            for combination in combinations(groups, size):
+                query = '&'.join(f"{name}={filters[name]}" for group in combination for name in group)
+                for sort in ('id', '-doe', 'doa'):
+                    for mode in ('page=1', 'cursor=&include_total=true'):
+                        statements.clear()
+                        client.get(f'/api/applications?{query}&sort={sort}&{mode}', headers={'X-API-Key': 'default_key'})
+                        captured = list(statements)
+                        with engine.connect() as connection:
+                            for statement, parameters in captured:
+                                plan = [row[-1] for row in connection.exec_driver_sql(
+                                    f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                                scans = [step for step in plan if step.startswith('SCAN applications')]
+                                if combination:
+                                    assert not scans, (query, sort, plan)
+                                else:
+                                    # Unfiltered pages walk an index in sort order and stop at LIMIT
+                                    assert all('USING' in step for step in scans), (sort, plan)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+def test_expiry_rollup_is_maintained_by_every_write(client):
+    from bulk import issue_expired_stvps
+    from rollups import check, rebuild
+
+    today = date.today()
+    with client.application.app_context():
+        db.session.add(Application(
+            id="E0001", fin="S0000001E", name="Expired User", pass_type="S Pass",
+            doa=today - timedelta(days=400), doe=today - timedelta(days=5),
+            company_uen="987654321A", status="EXPIRED"
+        ))
+        db.session.commit()
+        # Rows added straight through the ORM bypass the rollup, as a raw load would
+        rebuild('expiries')
+        db.session.commit()
+
+    def expiries(**params):
+        return client.get('/api/expiries', query_string=params, headers={'X-API-Key': 'default_key'})
+
+    response = expiries(group_by='pass_type')
+    assert response.status_code == 200
+    assert (response.json['from'], len(response.json['days'])) == (today.isoformat(), 90)
+    assert response.json['days'][30] == {"date": (today + timedelta(days=30)).isoformat(), "total": 1,
+                                         "by_pass_type": {"EP": 1}}
+
+    new_doe = today + timedelta(days=60)
+    client.put('/api/applications/TEST123/update-expiry', json={'new_doe': new_doe.isoformat()},
+               headers={'X-API-Key': 'default_key'})
+    client.post('/api/applications/E0001/create-stvp', headers={'X-API-Key': 'default_key'})   # New STVP
+    with client.application.app_context():
+        issue_expired_stvps()                                                # Still open: left alone
+        issue_expired_stvps(as_of=today + timedelta(days=31))                # Extends it once it has ended
+        assert check('expiries') == []
+
+    window = expiries(**{'from': (today + timedelta(days=30)).isoformat(), 'to': (today + timedelta(days=60)).isoformat()}).json
+    assert window['total'] == 2
+    assert 'by_pass_type' not in window['days'][0]
+    assert window['days'][0]['total'] == 0 and window['days'][-1]['total'] == 2
+
+    assert expiries(**{'from': '2024-02-01', 'to': '2024-01-01'}).status_code == 400
+    assert expiries(**{'from': '2024-01-01', 'to': '2026-01-01'}).status_code == 400
+    assert expiries(group_by='status').status_code == 400
+
+def test_company_summary_is_maintained_by_every_write(client):
+    from bulk import issue_expired_stvps
+    from rollups import check, rebuild
+
+    today = date.today()
+    with client.application.app_context():
+        db.session.add_all([Application(
+            id=f"C{i:04d}", fin=f"S{i:07d}C", name="Company User", pass_type=pass_type,
+            doa=today - timedelta(days=400), doe=today + timedelta(days=offset),
+            company_uen="UEN77777", status=status
+        ) for i, (pass_type, status, offset) in enumerate([
+            ("S Pass", "Approved", 10), ("S Pass", "Approved", 200), ("EP", "Pending", 5), ("EP", "Issued", -3)])])
+        db.session.commit()
+        for rollup in ('expiries', 'companies'):
+            rebuild(rollup)
+        db.session.commit()
+
+    def summary(uen, **params):
+        return client.get(f'/api/companies/{uen}/summary', query_string=params, headers={'X-API-Key': 'default_key'})
+
+    body = summary("UEN77777").json
+    assert body["passes"] == 4 and body["active_passes"] == 3
+    assert body["by_pass_type"] == {"EP": {"Issued": 1, "Pending": 1}, "S Pass": {"Approved": 2}}
+    assert body["by_status"] == {"Approved": 2, "Issued": 1, "Pending": 1}
+    assert (body["expiring_soon"]["count"], body["open_stvps"]) == (2, 0)
+
+    client.put('/api/applications/C0000/update-expiry', json={'new_doe': (today + timedelta(days=100)).isoformat()},
+               headers={'X-API-Key': 'default_key'})
+    client.post('/api/applications/C0003/create-stvp', headers={'X-API-Key': 'default_key'})
+    with client.application.app_context():
+        issue_expired_stvps()
+        assert check('companies') == [] and check('expiries') == []
+
+    body = summary("UEN77777", expiring_within=7).json
+    assert (body["expiring_soon"]["count"], body["open_stvps"]) == (1, 1)
+    assert summary("UEN77777", expiring_within=150).json["expiring_soon"]["count"] == 2
+    assert summary("UEN00000").status_code == 404
+    assert summary("UEN77777", expiring_within=-1).status_code == 400
+
+    top = client.get('/api/companies?limit=1', headers={'X-API-Key': 'default_key'}).json
+    assert top == [{"company_uen": "UEN77777", "passes": 4}]
+
+def test_name_search_uses_fts_prefix_matching_ranked_and_capped(client, monkeypatch):
+    from sqlalchemy import event
+    from config import Config
+
+    with client.application.app_context():
+        db.session.add_all([Application(
+            id=f"N{i:04d}", fin=f"S{i:07d}N", name=name, pass_type="EP",
+            doa=date.today() - timedelta(days=100), doe=date.today() + timedelta(days=100),
+            company_uen="UEN55555", status="Approved"
+        ) for i, name in enumerate(["Quillon Zebedee", "Quillon Zebedee Zebedee", "Quillonia Marsh", "José Zebedee"])])
+        db.session.commit()
+
+    def search(**params):
+        return client.get('/api/applications/search', query_string=params, headers={'X-API-Key': 'default_key'})
+
+    body = search(name='quil zeb').json
+    assert [row['id'] for row in body['applications']] == ["N0001", "N0000"]   # More occurrences rank first
+    assert (body['total'], body['total_capped'], body['applications'][0]['fin']) == (2, False, "S0000001N")
+    assert search(name='jose').json['applications'][0]['name'] == "José Zebedee"
+
+    pages = [search(name='Quillon', per_page=2, page=page).json for page in (1, 2)]
+    assert [(page['total'], page['pages'], len(page['applications'])) for page in pages] == [(3, 2, 2), (3, 2, 1)]
+    assert {row['id'] for page in pages for row in page['applications']} == {"N0000", "N0001", "N0002"}
+
+    monkeypatch.setattr(Config, 'NAME_SEARCH_MAX_RESULTS', 2)
+    capped = search(name='quillon', per_page=2).json
+    assert (capped['total'], capped['total_capped'], capped['pages']) == (2, True, 1)
+    assert search(name='quillon', per_page=2, page=2).status_code == 404
+    monkeypatch.undo()
+
+    # Triggers keep the index in step with renames and deletes
+    with client.application.app_context():
+        db.session.get(Application, "N0002").name = "Ottoline Marsh"
+        db.session.delete(db.session.get(Application, "N0003"))
+        db.session.commit()
+    assert search(name='quillon').json['total'] == 2
+    assert search(name='ottol').json['applications'][0]['id'] == "N0002"
+    assert search(name='jose').status_code == 404
+
+    assert search(name='a').status_code == 400
+    assert search(name='"OR*').status_code == 404   # FTS5 syntax is quoted away, not interpreted
+    assert search().status_code == 400
+
+    # The index does not depend on applications.rowid, which a VACUUM may renumber
+    from sqlalchemy import text
+    with client.application.app_context():
+        db.session.execute(text("UPDATE applications SET rowid = -rowid"))
+        db.session.execute(text("INSERT INTO applications_fts (applications_fts) VALUES ('integrity-check')"))
+        db.session.commit()
+    assert [row['id'] for row in search(name='quil zeb').json['applications']] == ["N0001", "N0000"]
+
+    # The only table scanned is the FTS index itself; applications is reached through the index keys
+    statements = []
+    with client.application.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        search(name='quil zeb')
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            assert not [step for step in plan if step.split(' ')[:2] in (['SCAN', 'applications'],
+                                                                         ['SCAN', 'applications_fts_keys'])], plan
+
+def test_batch_update_expiry_reports_every_item(client):
+    from models import Amendment
+    from rollups import check, rebuild
+
+    today = date.today()
+    with client.application.app_context():
+        _add_applications(1200)
+        db.session.add(Application(
+            id="E0001", fin="S0000001E", name="Expired User", pass_type="EP",
+            doa=today - timedelta(days=400), doe=today - timedelta(days=5),
+            company_uen="987654321A", status="EXPIRED"
+        ))
+        db.session.commit()
+        for rollup in ('expiries', 'companies'):
+            rebuild(rollup)
+        db.session.commit()
+        versions = dict(db.session.execute(db.select(Application.id, Application.version)).all())
+
+    # Cache one FIN to check that the batch invalidates it
+    client.get('/api/applications/search?fin=T0000000A', headers={'X-API-Key': 'default_key'})
+
+    new_doe = (today + timedelta(days=365)).isoformat()
+    updates = [{"application_id": f"B{i:04d}", "new_doe": new_doe} for i in range(1200)] + [
+        {"application_id": "E0001", "new_doe": new_doe},
+        {"application_id": "MISSING", "new_doe": new_doe},
+        {"application_id": "B0000", "new_doe": new_doe},
+        {"application_id": "B0001", "new_doe": "2024-13-01"},
+        {"new_doe": new_doe},
+        1, "x", None,
+        {"application_id": 5, "new_doe": new_doe},
+        {"application_id": "B0002", "new_doe": 20300101},
+    ]
+    response = client.put('/api/applications/update-expiry/batch', json={"updates": updates},
+                          headers={'X-API-Key': 'default_key'})
+    assert response.status_code == 200
+    body = response.json
+    assert (body["updated"], body["failed"], len(body["results"])) == (1200, 10, 1210)
+    assert body["results"][0] == {"application_id": "B0000", "status": 200, "message": "Expiry date updated successfully",
+                                  "amendment_id": "P01B0000", "new_expiry": new_doe}
+    assert [(result["status"], result["error"]) for result in body["results"][1200:]] == [
+        (400, "Cannot update expired application"), (404, "Application not found"),
+        (400, "Application listed more than once"), (400, "Invalid date format. Use YYYY-MM-DD"),
+        (400, "Missing required field: application_id"), (400, "Each update must be an object"),
+        (400, "Each update must be an object"), (400, "Each update must be an object"),
+        (400, "application_id must be a string: 5"), (400, "new_doe must be a string: 20300101")]
+
+    with client.application.app_context():
+        assert db.session.get(Application, "B0999").doe.isoformat() == new_doe
+        assert db.session.get(Application, "B0999").version == versions["B0999"] + 1
+        assert db.session.get(Application, "E0001").version == versions["E0001"]
+        assert Amendment.query.filter(Amendment.application_id.like("B%")).count() == 1200
+        assert check('expiries') == [] and check('companies') == []
+    search = client.get('/api/applications/search?fin=T0000000A', headers={'X-API-Key': 'default_key'}).json
+    assert search[0]["doe"] == new_doe
+
+    assert client.put('/api/applications/update-expiry/batch', json={"updates": []},
+                      headers={'X-API-Key': 'default_key'}).status_code == 400
@@ -1,18 +1,28 @@
 # utils.py
 # The require_api_key decorator is used to protect API routes that require an API key for access.
+# It also applies the rate limiter (rate_limit.py) before checking the key.
+# encode_cursor/decode_cursor build the opaque tokens used by keyset (cursor) pagination.
+# etag_for/not_modified implement conditional GET; gzip_response/gzip_stream negotiate compression.
 
+import base64
+import gzip
+import hashlib
+import json
+import zlib
 from functools import wraps
-from flask import request, jsonify
+from flask import Response, current_app, request, jsonify, stream_with_context
 from config import Config
 import logging
-from flask_limiter import Limiter
-
-limiter = Limiter(key_func=lambda: request.headers.get('X-API-Key'))
+from extensions import rate_limiter
 
 def require_api_key(f):
     @wraps(f)
-    @limiter.limit("10/minute")
     def decorated(*args, **kwargs):
+        allowed, retry_after = rate_limiter.check()
+        if not allowed:
+            logging.warning(f"Rate limit exceeded for {request.endpoint}")
+            return jsonify({"error": "Rate limit exceeded", "retry_after": retry_after}), 429, \
+                {"Retry-After": str(retry_after)}
         if Config.REQUIRE_API_KEY:
             if request.headers.get('X-API-Key') and request.headers.get('X-API-Key') == Config.API_KEY:
                 return f(*args, **kwargs)
@@ -21,3 +31,62 @@ def require_api_key(f):
                 return jsonify({"message": "Unauthorized"}), 401
         return f(*args, **kwargs)
     return decorated
+
+
+def encode_cursor(*values):
+    """Pack the keyset position of the last row on a page into an opaque token."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Raises ValueError for tampered or malformed tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid cursor: {token}")
+    return values
+
+def etag_for(*parts):
+    """Strong ETag value (unquoted) for a representation identified by parts, e.g. (kind, id, version)."""
+    return hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:24]
+
+def not_modified(etag):
+    """A 304 response if the client's If-None-Match already names etag, else None."""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+def gzip_response(response):
+    """Compress a buffered response when the client accepts gzip and it is at least GZIP_MIN_SIZE bytes."""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers or not accepts_gzip()
+            or response.calculate_content_length() < Config.GZIP_MIN_SIZE):
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=Config.GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def gzip_stream(chunks):
+    """Gzip a stream of str or bytes chunks incrementally, so memory stays constant."""
+    compressor = zlib.compressobj(Config.GZIP_LEVEL, zlib.DEFLATED, 31)   # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streamed_response(chunks, mimetype, headers):
+    """Streaming Response that runs inside the request context, gzip-encoded when the client accepts it."""
+    headers = dict(headers, Vary='Accept-Encoding')
+    if accepts_gzip():
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
@@ -1,22 +1,58 @@
 # Description: This file contains functions to validate the input data.
 
-from datetime import datetime
+import re
+from datetime import date, datetime
 
-def validate_fin(fin):
+def fin_error(fin):
+    """Return a description of what is wrong with a FIN, or None if it is valid."""
+    if not isinstance(fin, str):
+        return f"FIN must be a string: {fin!r}"
     if len(fin) != 9:
-        print(f"FIN length is incorrect: {len(fin)}")
-        return False
+        return f"FIN length is incorrect: {len(fin)}"
     if not fin[0].isalpha():
-        print(f"First character is not a letter: {fin[0]}")
-        return False
+        return f"First character is not a letter: {fin[0]}"
     if not fin[1:8].isdigit():
-        print(f"Characters 2-8 are not digits: {fin[1:8]}")
-        return False
+        return f"Characters 2-8 are not digits: {fin[1:8]}"
     if not fin[-1].isalnum():
-        print(f"Last character is not alphanumeric: {fin[-1]}")
+        return f"Last character is not alphanumeric: {fin[-1]}"
+    return None
+
+def validate_fin(fin):
+    error = fin_error(fin)
+    if error:
+        print(error)
         return False
     return True
 
+def validate_fins(fins):
+    """Validate many FINs in one pass.
+    :return: Tuple (valid, invalid) where valid is a de-duplicated list in input order
+             and invalid maps each rejected FIN to its error message.
+    """
+    valid = []
+    invalid = {}
+    seen = set()
+    for fin in fins:
+        if fin in seen or fin in invalid:
+            continue
+        error = fin_error(fin)
+        if error:
+            invalid[fin] = error
+        else:
+            seen.add(fin)
+            valid.append(fin)
+    return valid, invalid
+
+def date_error(date_str):
+    """Return a description of what is wrong with a YYYY-MM-DD date, or None if it is valid."""
+    if not isinstance(date_str, str):
+        return f"Date must be a string: {date_str!r}"
+    try:
+        datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        return f"Invalid date format: {date_str!r}. Use YYYY-MM-DD"
+    return None
+
 def validate_date(date_str):
     try:
         datetime.strptime(date_str, '%Y-%m-%d')
@@ -24,5 +60,67 @@ def validate_date(date_str):
     except ValueError:
         return False
 
+APPLICATION_FIELDS = ('id', 'fin', 'name', 'pass_type', 'doa', 'doe', 'status', 'company_uen')
+DATE_FIELDS = ('doa', 'doe')
+# Fast paths for the common, valid case; anything they reject is re-checked by fin_error/date_error,
+# so a batch accepts and rejects exactly what the single-value validators do
+_VALID_FIN = re.compile(r'[A-Za-z][0-9]{7}[A-Za-z0-9]')
+_ISO_DATE = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+
+def validate_applications(records):
+    """Validate a batch of application records (e.g. rows of an import file) column by column.
+    :param records: List of (row_number, record) pairs, where record is a dict of field -> value.
+    :return: Tuple (valid, rejected). valid is a list of (row_number, application) with only the
+             APPLICATION_FIELDS and doa/doe parsed to dates; rejected is a list of
+             {"row": row_number, "errors": {field: message}} in input order.
+    """
+    errors = [{} if isinstance(record, dict) else {"record": "Row must be an object"} for _, record in records]
+    columns = {field: [record.get(field) if isinstance(record, dict) else None for _, record in records]
+               for field in APPLICATION_FIELDS}
+
+    for field in APPLICATION_FIELDS:
+        for i, value in enumerate(columns[field]):
+            if "record" in errors[i]:
+                continue
+            if value is None or value == '':
+                errors[i][field] = f"Missing required field: {field}"
+            elif not isinstance(value, str):
+                errors[i][field] = f"{field} must be a string: {value!r}"
+
+    for i, fin in enumerate(columns['fin']):
+        if errors[i].keys() & {'fin', 'record'} or _VALID_FIN.fullmatch(fin):
+            continue
+        error = fin_error(fin)
+        if error:
+            errors[i]['fin'] = error
+
+    parsed = {field: [None] * len(records) for field in DATE_FIELDS}
+    for field in DATE_FIELDS:
+        for i, value in enumerate(columns[field]):
+            if errors[i].keys() & {field, 'record'}:
+                continue
+            try:
+                if _ISO_DATE.fullmatch(value):
+                    parsed[field][i] = date.fromisoformat(value)
+                    continue
+            except ValueError:
+                pass
+            error = date_error(value)
+            if error:
+                errors[i][field] = error
+            else:
+                parsed[field][i] = datetime.strptime(value, '%Y-%m-%d').date()
+
+    valid, rejected = [], []
+    for i, (row, _) in enumerate(records):
+        if errors[i]:
+            rejected.append({"row": row, "errors": errors[i]})
+            continue
+        application = {field: columns[field][i] for field in APPLICATION_FIELDS}
+        for field in DATE_FIELDS:
+            application[field] = parsed[field][i]
+        valid.append((row, application))
+    return valid, rejected
+
 def sanitize_input(input_str):
-    return input_str.strip().replace("'", "").replace(";", "")
\ No newline at end of file
+    return input_str.strip().replace("'", "").replace(";", "")
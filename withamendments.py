@@ -1,140 +1,228 @@
 # Description: This script generates a SQLite database with applications, amendments, and STVPs.
-
+# Rows are produced in fixed-size blocks, each seeded from (--seed, block number), so the same
+# seed always yields the same data no matter how many worker processes generate it or how large
+# the transactions are. Blocks are generated by a process pool, streamed back in order and
+# written with executemany in large transactions. The schema, including every index, comes from
+# the ORM models; indexes are built after the load, which is much faster than maintaining them
+# row by row. The rollup tables (rollups.py) and the name index (name_search.py) are built from
+# the loaded rows at the end.
+#
+# Usage: python withamendments.py [--applications 5_000_000] [--seed 42] [--expired-ratio 0.3]
+#                                 [--workers 8] [--database with_amendments.db]
+
+import argparse
+import os
+import random
 import sqlite3
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import islice
+from multiprocessing import Pool
 from faker import Faker
-from datetime import datetime, timedelta
-import random
-
-# Connect to the database
-connection = sqlite3.connect('with_amendments.db')
-cursor = connection.cursor()
-
-# Create schema
-def create_schema(cursor):
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS applications (
-            id TEXT PRIMARY KEY,
-            fin TEXT NOT NULL,
-            name TEXT NOT NULL,
-            pass_type TEXT NOT NULL,
-            doa TEXT NOT NULL,
-            company_uen TEXT NOT NULL,
-            status TEXT NOT NULL,
-            doe TEXT NOT NULL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS amendments (
-            amendment_id TEXT PRIMARY KEY,
-            application_id TEXT NOT NULL,
-            amendment_date TEXT NOT NULL,
-            original_value TEXT NOT NULL,
-            amended_value TEXT NOT NULL,
-            FOREIGN KEY (application_id) REFERENCES applications (id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stvps (
-            id TEXT PRIMARY KEY,
-            application_id TEXT NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            FOREIGN KEY (application_id) REFERENCES applications (id)
-        )
-    ''')
-
-# Recreate the schema
-cursor.execute("DROP TABLE IF EXISTS applications")
-cursor.execute("DROP TABLE IF EXISTS amendments")
-create_schema(cursor)
-
-# Initialize Faker
-fake = Faker()
-application_count = 20  # Testing dataset
-
-# Generate applications
-applications_data = []
-amendments_data = []
-
-# Generate applications and amendments
-for app_index in range(2, application_count + 1):
-    # Generate application details
-    application_id = f"A{str(app_index).zfill(4)}"
-    fin = fake.bothify(text='?#######?')
-    name = fake.name()
-    pass_type = random.choice(['Employment Pass', 'EntrePass', 'S Pass', 'Dependant’s Pass', 'Long-Term Visit Pass'])
-    doa = fake.date_between(start_date='-5y', end_date='today').isoformat()  # 2019 to today
-    company_uen = fake.bothify(text='UEN#####')
-    status = random.choice(['Pending', 'Approved', 'Rejected', 'Withdrawn', 'Cancelled', 'Issued'])
-    doe = (datetime.strptime(doa, '%Y-%m-%d') + timedelta(days=365 * random.randint(1, 5))).strftime('%Y-%m-%d')  # 1-5 years after doa
-    applications_data.append((application_id, fin, name, pass_type, doa, company_uen, status, doe))
-
-    # Generate amendments
-    amendment_count = random.randint(0, 3)
-    last_amend_date = datetime.strptime(doa, '%Y-%m-%d')
-    for amend_index in range(1, amendment_count + 1):
-        last_amend_date += timedelta(weeks=random.randint(2, 4))
-        if last_amend_date >= datetime.strptime(doe, '%Y-%m-%d'):
-            break
-        amendment_id = f"P{str(amend_index).zfill(2)}{application_id}"
-        amendment_date = last_amend_date.strftime('%Y-%m-%d %H:%M:%S')
-        original_value = doe
-        amended_value = (datetime.strptime(original_value, '%Y-%m-%d') + timedelta(days=30)).strftime('%Y-%m-%d')
-        amendments_data.append((amendment_id, application_id, amendment_date, original_value, amended_value))
-        doe = amended_value  # Update doe after amendment
-
-    # Update the final doe in applications
-    applications_data[-1] = (*applications_data[-1][:-1], doe)  # Update in-memory
-    cursor.execute("UPDATE applications SET doe = ? WHERE id = ?", (doe, application_id))
-
-    # Generate STVPs for expired passes
-    stvps_data = []
-    current_date = datetime.now().date()
-    for app_id, _, _, _, _, _, _, doe in applications_data:
-        if datetime.strptime(doe, '%Y-%m-%d').date() < current_date:
-            stvp_id = f"STVP{app_id[1:]}"
-            start_date = (datetime.strptime(doe, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-            end_date = (datetime.strptime(doe, '%Y-%m-%d') + timedelta(days=30)).strftime('%Y-%m-%d')
-            stvps_data.append((stvp_id, app_id, start_date, end_date))
-
-# Add the test application last
-applications_data.append((
-        "A0001",                    # ID
-        "S1234567X",                # FIN (the test value)
-        "Test User",                # Name
-        "Employment Pass",          # Pass type
-        (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),  # DOA (30 days ago)
-        "UEN12345",                 # Company UEN
-        "Pending",                  # Status
-        (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')  # DOE (expired)
-    ))
-
-# Ensure all IDs are unique
-ids = [app[0] for app in applications_data]
-if len(ids) != len(set(ids)):
-    raise ValueError("Duplicate IDs found in applications_data")
-
-# Insert applications
-cursor.executemany('''
-    INSERT INTO applications (id, fin, name, pass_type, doa, company_uen, status, doe)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-''', applications_data)
-
-# Insert amendments
-cursor.executemany('''
-    INSERT INTO amendments (amendment_id, application_id, amendment_date, original_value, amended_value)
-    VALUES (?, ?, ?, ?, ?)
-''', amendments_data)
-
-# Insert STVPs
-cursor.executemany('''
-    INSERT INTO stvps (id, application_id, start_date, end_date)
-    VALUES (?, ?, ?, ?)
-''', stvps_data)
-
-# Commit and close
-connection.commit()
-connection.close()
-
-print(f"{len(applications_data)} applications and {len(amendments_data)} amendments added.")
-print(f"{len(stvps_data)} STVPs added.")
\ No newline at end of file
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+from models import db
+import rollups
+from name_search import create_name_index
+
+BLOCK_SIZE = 10000   # Applications per seeded generation block; changing it changes the data
+
+PASS_TYPES = ['Employment Pass', 'EntrePass', 'S Pass', 'Dependant’s Pass', 'Long-Term Visit Pass']
+STATUSES = ['Pending', 'Approved', 'Rejected', 'Withdrawn', 'Cancelled', 'Issued']
+
+TEST_APPLICATION_ID = "A0001"
+TEST_FIN = "S1234567X"
+
+_fake = None
+
+def _faker():
+    # One Faker per process; it is re-seeded for every block
+    global _fake
+    if _fake is None:
+        _fake = Faker()
+    return _fake
+
+def _datetime_value(value):
+    # Same text format SQLAlchemy's SQLite DateTime type writes
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def generate_block(task):
+    """Generate the applications numbered [start, stop) and their amendments and STVPs."""
+    seed, block, start, stop, expired_ratio, today, id_width = task
+    rng = random.Random(f"{seed}:{block}")
+    fake = _faker()
+    fake.seed_instance(seed * 1000003 + block)
+
+    applications, amendments, stvps = [], [], []
+    for app_index in range(start, stop):
+        application_id = f"A{str(app_index).zfill(id_width)}"
+        if rng.random() < expired_ratio:
+            doe = today - timedelta(days=rng.randint(1, 365))
+        else:
+            doe = today + timedelta(days=rng.randint(0, 5 * 365))
+
+        # Each amendment extended the pass by 30 days, so walk back to the original expiry
+        amendment_count = rng.randint(0, 3)
+        original_doe = doe - timedelta(days=30 * amendment_count)
+        doa = original_doe - timedelta(days=365 * rng.randint(1, 5))
+
+        applications.append((
+            application_id,
+            fake.bothify(text='?#######?'),
+            fake.name(),
+            rng.choice(PASS_TYPES),
+            doa.isoformat(),
+            fake.bothify(text='UEN#####'),
+            rng.choice(STATUSES),
+            doe.isoformat(),
+            amendment_count
+        ))
+
+        amended_at = datetime.combine(doa, datetime.min.time())
+        value = original_doe
+        for amend_index in range(1, amendment_count + 1):
+            amended_at += timedelta(weeks=rng.randint(2, 4))
+            amendments.append((
+                f"P{str(amend_index).zfill(2)}{application_id}",
+                application_id,
+                _datetime_value(amended_at),
+                value.isoformat(),
+                (value + timedelta(days=30)).isoformat()
+            ))
+            value += timedelta(days=30)
+
+        # STVPs for expired passes
+        if doe < today:
+            stvps.append((
+                f"STVP{application_id[1:]}",
+                application_id,
+                (doe + timedelta(days=1)).isoformat(),
+                (doe + timedelta(days=30)).isoformat()
+            ))
+    return applications, amendments, stvps
+
+def _blocks(tasks, workers):
+    """Yield generated blocks in task order, keeping at most 2 * workers blocks in memory."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(generate_block, tasks)
+        return
+    with Pool(workers) as pool:
+        remaining = iter(tasks)
+        pending = deque(pool.apply_async(generate_block, (task,)) for task in islice(remaining, 2 * workers))
+        while pending:
+            rows = pending.popleft().get()
+            for task in islice(remaining, 1):
+                pending.append(pool.apply_async(generate_block, (task,)))
+            yield rows
+
+def _test_application(today):
+    return (
+        TEST_APPLICATION_ID,                              # ID
+        TEST_FIN,                                         # FIN (the test value)
+        "Test User",                                      # Name
+        "Employment Pass",                                # Pass type
+        (today - timedelta(days=30)).isoformat(),         # DOA (30 days ago)
+        "UEN12345",                                       # Company UEN
+        "Pending",                                        # Status
+        (today - timedelta(days=10)).isoformat(),         # DOE (expired)
+        0                                                 # amendment_seq
+    )
+
+def create_schema(database):
+    """Recreate every table declared in models.py, without indexes. Returns the engine."""
+    engine = create_engine(f"sqlite:///{database}")
+    db.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            connection.execute(CreateTable(table))
+    return engine
+
+def create_indexes(engine):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine)
+
+def generate(database, applications, seed=42, expired_ratio=0.3, workers=None, commit_every=200000,
+             today=None, progress=print):
+    """Generate a database of `applications` applications (plus the A0001 test application)."""
+    today = today or date.today()
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    engine = create_schema(database)
+
+    connection = sqlite3.connect(database)
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.execute('PRAGMA journal_mode=MEMORY')
+
+    # The test application is A0001, so generated IDs start at 2 like the original script
+    first, last = 2, applications + 1
+    id_width = max(4, len(str(last)))
+    tasks = [
+        (seed, block, start, min(start + BLOCK_SIZE, last + 1), expired_ratio, today, id_width)
+        for block, start in enumerate(range(first, last + 1, BLOCK_SIZE))
+    ]
+    totals = {"applications": 0, "amendments": 0, "stvps": 0}
+
+    def write(rows):
+        block_applications, block_amendments, block_stvps = rows
+        connection.executemany('''
+            INSERT INTO applications (id, fin, name, pass_type, doa, company_uen, status, doe, amendment_seq)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', block_applications)
+        connection.executemany('''
+            INSERT INTO amendments (amendment_id, application_id, amendment_date, original_value, amended_value)
+            VALUES (?, ?, ?, ?, ?)
+        ''', block_amendments)
+        connection.executemany('''
+            INSERT INTO stvps (id, application_id, start_date, end_date)
+            VALUES (?, ?, ?, ?)
+        ''', block_stvps)
+        totals["applications"] += len(block_applications)
+        totals["amendments"] += len(block_amendments)
+        totals["stvps"] += len(block_stvps)
+
+    uncommitted = 0
+    for rows in _blocks(tasks, workers):
+        write(rows)
+        uncommitted += len(rows[0])
+        if uncommitted >= commit_every:
+            connection.commit()
+            uncommitted = 0
+            progress(f"{totals['applications']}/{applications} applications "
+                     f"({time.perf_counter() - started:.1f}s)")
+
+    # Add the test application last
+    write(([_test_application(today)], [], []))
+    connection.commit()
+    connection.close()
+
+    progress("Creating indexes...")
+    create_indexes(engine)
+    # Raw inserts bypass services.py, so the rollups and the name index are built once from the loaded rows
+    with engine.begin() as connection:
+        for rollup in rollups.ROLLUPS:
+            rollups.rebuild(rollup, connection)
+        create_name_index(connection)
+    engine.dispose()
+
+    totals["elapsed_seconds"] = round(time.perf_counter() - started, 1)
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a deterministic work pass database for testing and benchmarking.")
+    parser.add_argument('--applications', type=int, default=19,
+                        help="Number of generated applications, in addition to the A0001 test application")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--expired-ratio', type=float, default=0.3, help="Share of passes whose doe is in the past")
+    parser.add_argument('--workers', type=int, default=None, help="Generator processes (default: CPU count)")
+    parser.add_argument('--commit-every', type=int, default=200000, help="Applications per transaction")
+    parser.add_argument('--today', type=date.fromisoformat, default=None,
+                        help="Reference date for expiry (YYYY-MM-DD); fix it to reproduce a dataset exactly")
+    parser.add_argument('--database', default='with_amendments.db')
+    args = parser.parse_args()
+
+    totals = generate(args.database, args.applications, seed=args.seed, expired_ratio=args.expired_ratio,
+                      workers=args.workers, commit_every=args.commit_every, today=args.today)
+    print(f"{totals['applications']} applications and {totals['amendments']} amendments added.")
+    print(f"{totals['stvps']} STVPs added in {totals['elapsed_seconds']}s.")
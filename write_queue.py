@@ -0,0 +1,105 @@
+# write_queue.py
+# Optional single-writer pipeline with group commit. Request handlers submit an operation from
+# services.py and wait on its Future; one writer thread drains the queue, waiting at most
+# max_wait for up to max_batch operations, applies them in one transaction and commits once.
+# On SQLite this turns one fsync per write into one fsync per batch, and the handlers no longer
+# compete for the write lock. The writer invalidates the search cache for every committed write,
+# so the cache stays correct even when a handler gave up waiting before the commit.
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from extensions import search_cache
+from models import db
+
+class WriteQueueFull(Exception):
+    """Raised by WriteQueue.submit when max_pending operations are already waiting."""
+
+class WriteQueue:
+    def __init__(self, app, max_batch=64, max_wait=0.005, max_pending=1000):
+        self._app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._operations = 0
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        """Queue operation(*args); the Future resolves to its (body, status, fin) once committed."""
+        future = Future()
+        try:
+            self._queue.put_nowait((future, operation, args))
+        except queue.Full:
+            raise WriteQueueFull(f"{self._queue.qsize()} writes already queued")
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "pending": self._queue.qsize(),
+                "batches": self._batches,
+                "operations": self._operations,
+                "average_batch": round(self._operations / self._batches, 2) if self._batches else 0.0
+            }
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+            with self._app.app_context():
+                self._apply(batch)
+            with self._stats_lock:
+                self._batches += 1
+                self._operations += len(batch)
+            if stop:
+                return
+
+    def _apply(self, batch):
+        if not batch:
+            return
+        try:
+            outcomes = [(future, operation(*args)) for future, operation, args in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                logging.error(f"Queued write failed: {str(e)}", exc_info=True)
+                batch[0][0].set_exception(e)
+                return
+            # Apply the batch one operation at a time so a single failure only fails its own caller
+            logging.warning(f"Group commit of {len(batch)} writes failed ({str(e)}); retrying individually")
+            for item in batch:
+                self._apply([item])
+            return
+        finally:
+            db.session.remove()
+        fins = {fin for _, (_, _, fin) in outcomes if fin}
+        if fins:
+            search_cache.delete(*fins)
+        for future, outcome in outcomes:
+            future.set_result(outcome)